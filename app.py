@@ -1,13 +1,22 @@
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, Response, g, request, render_template, jsonify, stream_with_context, url_for
 import os
-import traceback
-from generators import (
-    generate_passphrase,
-    generate_ssh_key,
-    generate_rsa_key,
-    generate_pgp_key
+import math
+import time
+from generators.batch import parse_batch_specs, iter_batch_ndjson, get_batch_max_keys
+from generators.handlers import run_handler
+from generators.executors import OverloadedError, get_in_flight_limit
+from generators.idempotency import (
+    IDEMPOTENCY_HEADER, REPLAYED_HEADER, IdempotencyError, get_idempotency_cache, run_idempotent
 )
-from utils.utils import create_output_directory, save_key_pair
+from generators.jobs import get_job_manager, QueueFullError, JobPoolUnavailableError, MAX_WAIT_SECONDS
+from generators.keypool import get_pool_stats, start_key_pool
+from generators.passphrase import get_charset_cache_stats
+from storage import get_keystore, get_key_index
+from storage.writebehind import get_write_behind_queue
+from utils.config import env_flag
+from utils.deadline import DEADLINE_HEADER, parse_timeout
+from utils.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT, render_metrics
+from utils.timing import span, start_collecting, stop_collecting, server_timing
 
 app = Flask(__name__)
 
@@ -18,250 +27,290 @@ for key_type in ['ssh', 'rsa', 'pgp']:
     os.makedirs(dir_path, exist_ok=True)
     os.chmod(dir_path, 0o700)
 
+# Fill the RSA key pool while the worker waits for its first requests
+start_key_pool()
+
+@app.before_request
+def start_request_metrics():
+    # Label by route template so IDs in URLs do not create new series
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    HTTP_REQUESTS_IN_FLIGHT.labels(g.metrics_route).inc()
+    if request.path.startswith('/generate/') and env_flag('SERVER_TIMING', '1'):
+        g.timing_token = start_collecting()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'metrics_route' in g:
+        elapsed = time.perf_counter() - g.metrics_start
+        HTTP_REQUEST_DURATION.labels(request.method, g.metrics_route, str(response.status_code)).observe(elapsed)
+        if 'timing_token' in g:
+            response.headers['Server-Timing'] = server_timing(stop_collecting(g.pop('timing_token')), elapsed)
+    return response
+
+@app.teardown_request
+def end_request_metrics(exc):
+    if 'metrics_route' in g:
+        HTTP_REQUESTS_IN_FLIGHT.labels(g.metrics_route).dec()
+    if 'timing_token' in g:
+        stop_collecting(g.pop('timing_token'))
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/generate/passphrase', methods=['POST'])
-def passphrase():
+def _wants_async():
+    """Check whether the client asked for an asynchronous job"""
+    if request.args.get('async', '').lower() in ('true', '1', 't'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '').lower()
+
+def _job_response(record):
+    """Build the public view of a job record"""
+    data = {
+        'jobId': record['jobId'],
+        'type': record['type'],
+        'status': record['status'],
+        'createdAt': record.get('createdAt'),
+        'startedAt': record.get('startedAt'),
+        'finishedAt': record.get('finishedAt'),
+        'statusUrl': url_for('job_status', job_id=record['jobId'])
+    }
+    if 'result' in record:
+        data['resultStatus'] = record.get('resultStatus')
+        data['result'] = record['result']
+    return {'success': True, 'data': data}
+
+def _request_deadline(data):
+    """
+    Return the client's deadline as a time.monotonic() value, or None.
+
+    Raises:
+        ValueError: If the client's timeout is invalid
+    """
+    timeout = parse_timeout(request.headers.get(DEADLINE_HEADER), data)
+    return time.monotonic() + timeout if timeout is not None else None
+
+def _run_generation(kind, data, deadline):
+    """Run a generation on this thread once the worker admits it"""
+    with get_in_flight_limit().admit(kind, data):
+        return run_handler(kind, data, deadline=deadline)
+
+def _handle_request(kind):
+    """Decode the JSON body and run the generation handler for one request"""
     try:
-        data = request.json or {}
-        result = generate_passphrase(
-            length=int(data.get('length', 16)),
-            include_numbers=data.get('includeNumbers', True),
-            include_special=data.get('includeSpecial', True),
-            exclude_chars=data.get('excludeChars', '')
-        )
-        
-        # Ensure a consistent JSON response
-        if result.get('success'):
-            return jsonify({
-                'success': True,
-                'data': {
-                    'passphrase': result.get('passphrase'),
-                    'length': result.get('length'),
-                    'includeNumbers': result.get('includeNumbers'),
-                    'includeSpecial': result.get('includeSpecial')
-                }
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error_message': result.get('error_message', 'Failed to generate passphrase')
-            }), 400
-    
+        with span('request.validate'):
+            data = request.json or {}
     except Exception as e:
-        print("Passphrase Generation Error:", str(e))
-        print(traceback.format_exc())
         return jsonify({
             'success': False,
-            'error_message': f'Failed to generate passphrase: {str(e)}'
+            'error_message': f'Invalid request body: {str(e)}'
         }), 400
 
-@app.route('/generate/ssh', methods=['POST'])
-def ssh():
     try:
-        data = request.json or {}
-        comment = data.get('comment', '').strip()
-        
-        # Get key_size if provided, otherwise let generator use default
-        key_size = data.get('keySize')
-        if key_size is not None:
-            key_size = int(key_size)
-        
-        # Generate the SSH key pair
-        result = generate_ssh_key(
-            key_type=data.get('keyType', 'rsa'),
-            key_size=key_size,
-            comment=comment,
-            passphrase=data.get('passphrase') if 'passphrase' in data else None
-        )
-        
-        if not isinstance(result, dict):
+        deadline = _request_deadline(data)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error_message': str(e)
+        }), 400
+
+    if _wants_async():
+        try:
+            record = get_job_manager().submit(kind, data)
+        except (QueueFullError, JobPoolUnavailableError) as e:
             return jsonify({
                 'success': False,
-                'error_message': str(result)
-            }), 400
-            
-        if result.get('success'):
-            try:
-                # Create directory and save keys
-                dir_path = create_output_directory('ssh', comment)
-                private_path, public_path = save_key_pair(
-                    result['data']['privateKey'],
-                    result['data']['publicKey'],
-                    dir_path,
-                    'ssh'
-                )
-                
-                return jsonify({
-                    'success': True,
-                    'data': {
-                        'privateKey': result['data']['privateKey'],
-                        'publicKey': result['data']['publicKey'],
-                        'keyType': result['data']['keyType'],
-                        'keySize': result['data']['keySize'],
-                        'directory': dir_path,
-                        'privatePath': private_path,
-                        'publicPath': public_path
-                    }
-                })
-            except Exception as e:
-                # If saving fails, still return the keys but with a warning
-                return jsonify({
-                    'success': True,
-                    'warning': f'Keys generated but could not be saved: {str(e)}',
-                    'data': {
-                        'privateKey': result['data']['privateKey'],
-                        'publicKey': result['data']['publicKey'],
-                        'keyType': result['data']['keyType'],
-                        'keySize': result['data']['keySize']
-                    }
-                })
+                'error_message': str(e)
+            }), 503
+        body = _job_response(record)
+        return jsonify(body), 202, {'Location': body['data']['statusUrl']}
+
+    idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+    replayed = False
+    try:
+        if idempotency_key is None:
+            body, status = _run_generation(kind, data, deadline)
         else:
-            return jsonify({
-                'success': False,
-                'error_message': result.get('error_message', 'Failed to generate SSH key')
-            }), 400
-            
-    except ValueError as ve:
+            body, status, replayed = run_idempotent(
+                get_idempotency_cache(), idempotency_key, kind, data,
+                lambda: _run_generation(kind, data, deadline), deadline=deadline
+            )
+    except IdempotencyError as e:
         return jsonify({
             'success': False,
-            'error_message': str(ve)
-        }), 400
-    except Exception as e:
-        print("SSH Key Generation Error:", str(e))
-        print(traceback.format_exc())
+            'error_message': str(e)
+        }), e.status
+    except OverloadedError as e:
         return jsonify({
             'success': False,
-            'error_message': f'Failed to generate SSH key: {str(e)}'
-        }), 500
+            'error_message': str(e),
+            'retryAfter': e.retry_after
+        }), 429, {'Retry-After': str(e.retry_after)}
+    with span('response.json'):
+        response = jsonify(body)
+    if replayed:
+        response.headers[REPLAYED_HEADER] = 'true'
+    return response, status
+
+@app.route('/generate/passphrase', methods=['POST'])
+def passphrase():
+    return _handle_request('passphrase')
+
+@app.route('/generate/ssh', methods=['POST'])
+def ssh():
+    return _handle_request('ssh')
 
 @app.route('/generate/rsa', methods=['POST'])
 def rsa():
+    return _handle_request('rsa')
+
+@app.route('/generate/pgp', methods=['POST'])
+def pgp():
+    return _handle_request('pgp')
+
+@app.route('/generate/batch', methods=['POST'])
+def batch():
     try:
-        data = request.json or {}
-        comment = data.get('comment', '').strip()
-        
-        # Generate the RSA key pair
-        result = generate_rsa_key(
-            key_size=int(data.get('keySize', 2048)),
-            passphrase=data.get('passphrase', '')
-        )
-        
-        if result.get('success'):
-            try:
-                # Create directory and save keys
-                dir_path = create_output_directory('rsa', comment)
-                private_path, public_path = save_key_pair(
-                    result['data']['privateKey'],
-                    result['data']['publicKey'],
-                    dir_path,
-                    'rsa'
-                )
-                
-                return jsonify({
-                    'success': True,
-                    'data': {
-                        'privateKey': result['data']['privateKey'],
-                        'publicKey': result['data']['publicKey'],
-                        'keySize': data.get('keySize', 2048),
-                        'directory': dir_path,
-                        'privatePath': private_path,
-                        'publicPath': public_path
-                    }
-                })
-            except Exception as e:
-                # If saving fails, still return the keys but with a warning
-                return jsonify({
-                    'success': True,
-                    'warning': f'Keys generated but could not be saved: {str(e)}',
-                    'data': {
-                        'privateKey': result['data']['privateKey'],
-                        'publicKey': result['data']['publicKey'],
-                        'keySize': data.get('keySize', 2048)
-                    }
-                })
-        else:
-            return jsonify({
-                'success': False,
-                'error_message': result.get('error_message', 'Failed to generate RSA key')
-            }), 400
-            
+        with span('request.validate'):
+            data = request.json
+            specs = parse_batch_specs(data, max_keys=get_batch_max_keys())
+            deadline = _request_deadline(data)
     except ValueError as ve:
         return jsonify({
             'success': False,
             'error_message': str(ve)
         }), 400
     except Exception as e:
-        print("RSA Key Generation Error:", str(e))
-        print(traceback.format_exc())
         return jsonify({
             'success': False,
-            'error_message': 'Internal server error'
-        }), 500
+            'error_message': f'Invalid request body: {str(e)}'
+        }), 400
 
-@app.route('/generate/pgp', methods=['POST'])
-def pgp():
+    # Results are encoded and sent one line at a time so no key is buffered
+    return Response(
+        stream_with_context(iter_batch_ndjson(specs, deadline=deadline)),
+        mimetype='application/x-ndjson'
+    )
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
     try:
-        data = request.json or {}
-        
-        # Required parameters
-        name = data.get('name')
-        email = data.get('email')
-        
-        if not name or not email:
-            return jsonify({
-                'success': False,
-                'error_message': 'Name and email are required'
-            }), 400
-
-        # Optional parameters with case conversion for key_type
-        comment = data.get('comment')
-        key_type = data.get('keyType', 'RSA').upper()  # Convert to uppercase for consistency
-        key_length = data.get('keyLength')  # Optional for RSA
-        curve = data.get('curve')  # Optional for ECC
-        passphrase = data.get('passphrase')
-        expire_time = data.get('expireTime', '2y')
-
-        result = generate_pgp_key(
-            name=name,
-            email=email,
-            comment=comment,
-            key_type=key_type,
-            key_length=key_length,
-            curve=curve,
-            passphrase=passphrase,
-            expire_time=expire_time
-        )
+        wait_seconds = float(request.args.get('wait', 0))
+        if not math.isfinite(wait_seconds) or wait_seconds < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error_message': 'wait must be a number of seconds'
+        }), 400
+    # A long-poll holds a request thread, so it is kept short
+    wait_seconds = min(wait_seconds, MAX_WAIT_SECONDS)
 
-        if result.get('success'):
-            # Save keys but don't include directory info in response
-            dir_path = create_output_directory('pgp', comment or email.replace('@', '_at_'))
-            save_key_pair(
-                result['data']['privateKey'],
-                result['data']['publicKey'],
-                dir_path,
-                'pgp'
-            )
-            
-            # Return result without directory information
-            return jsonify(result)
-        else:
-            return jsonify(result), 400
+    record = get_job_manager().get(job_id, wait_seconds=wait_seconds)
+    if record is None:
+        return jsonify({
+            'success': False,
+            'error_message': 'Job not found'
+        }), 404
+    return jsonify(_job_response(record)), 200
 
-    except Exception as e:
-        print("PGP Key Generation Error:", str(e))
-        traceback.print_exc()
+@app.route('/storage/<path:handle>')
+def storage_status(handle):
+    store = get_keystore()
+    write_behind = get_write_behind_queue(store)
+    if write_behind is not None:
+        status = write_behind.status(handle)
+    else:
+        status = 'stored' if store.exists(handle) else None
+    if status is None:
+        return jsonify({
+            'success': False,
+            'error_message': 'Storage handle not found'
+        }), 404
+    return jsonify({
+        'success': True,
+        'data': {
+            'storageHandle': handle,
+            'storageStatus': status
+        }
+    }), 200
+
+# Query parameter -> converter for the key index filters
+KEY_FILTERS = {
+    'keyType': str.lower,
+    'algorithm': str,
+    'keySize': int,
+    'comment': str,
+    'fingerprint': str,
+    'pgpKeyId': str.upper,
+    'email': str.lower,
+    'createdAfter': float,
+    'createdBefore': float,
+    'expiresBefore': str
+}
+
+def _query_index(filter_names, require_filter=False):
+    """Run a paginated key index query from the request's query parameters"""
+    index = get_key_index()
+    if index is None:
         return jsonify({
             'success': False,
-            'error_message': f'Failed to generate PGP key: {str(e)}'
-        }), 500
+            'error_message': 'Key index is disabled'
+        }), 404
+
+    try:
+        filters = {}
+        for name in filter_names:
+            value = request.args.get(name)
+            if value:
+                filters[name] = KEY_FILTERS[name](value)
+        if require_filter and not filters:
+            raise ValueError(f"At least one filter is required: {', '.join(filter_names)}")
+        page = index.search(
+            filters,
+            limit=int(request.args.get('limit', 50)),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error_message': str(e)
+        }), 400
+
+    return jsonify({'success': True, 'data': page}), 200
+
+@app.route('/keys')
+def list_keys():
+    return _query_index(('keyType',))
+
+@app.route('/keys/search')
+def search_keys():
+    return _query_index(KEY_FILTERS, require_filter=True)
 
 @app.route('/health')
 def health_check():
     return jsonify({"status": "healthy"}), 200
 
+@app.route('/ready')
+def ready():
+    # Generations of this worker; the ASGI server answers /ready from its lanes itself
+    body, status = get_in_flight_limit().readiness()
+    return jsonify(body), status
+
+@app.route('/metrics')
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, mimetype=content_type)
+
+@app.route('/stats/keypool')
+def keypool_stats():
+    return jsonify(get_pool_stats()), 200
+
+@app.route('/stats/charset-cache')
+def charset_cache_stats():
+    return jsonify(get_charset_cache_stats()), 200
+
 if __name__ == '__main__':
     # Use environment variable to control debug mode, default to False for security
     debug_mode = os.environ.get('FLASK_DEBUG', '0').lower() in ('true', '1', 't')
@@ -0,0 +1,298 @@
+"""ASGI entry point serving the routes of app.py from an event loop.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+A gunicorn sync worker is busy for the whole of a slow RSA or PGP
+generation. Here ``/``, ``/health`` and ``/generate/*`` are served by the
+event loop itself: generations run in the bounded executors of
+``generators.executors`` while the loop keeps answering other requests, so
+clients waiting on slow keys hold a socket rather than a worker. Every
+other route (jobs, storage, key index, metrics, stats, static files and
+asynchronous ``/generate`` requests) is passed to the Flask app, which runs
+in a2wsgi's thread pool.
+
+Generations that would not finish within the latency budget are rejected
+with ``429`` and a ``Retry-After`` header (see ``generators.executors``);
+``/ready`` reports the queue depth of each lane. Generations that miss the
+client's deadline (``utils.deadline``) are stopped and answered with ``504``.
+Requests with an ``Idempotency-Key`` run at most once per key (see
+``generators.idempotency``).
+"""
+import json
+import time
+import logging
+from functools import partial
+from a2wsgi import WSGIMiddleware
+from flask import render_template
+from app import app as flask_app
+from generators.batch import parse_batch_specs, aiter_batch_results, get_batch_max_keys
+from generators.executors import get_generation_executors, OverloadedError
+from generators.handlers import HANDLERS
+from generators.idempotency import (
+    IDEMPOTENCY_HEADER, REPLAYED_HEADER, IdempotencyError, get_idempotency_cache, arun_idempotent
+)
+from generators.keypool import start_key_pool
+from utils.config import env_flag, env_int
+from utils.deadline import DEADLINE_HEADER, DeadlineExceeded, parse_timeout
+from utils.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT, sweep_dead_processes
+from utils.timing import span, start_collecting, stop_collecting, server_timing
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    """The parts of an ASGI HTTP request the native routes need"""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self.query = scope.get('query_string', b'').decode('latin-1')
+
+    async def body(self):
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await self.receive()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionError("Client disconnected")
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        return b''.join(chunks)
+
+    async def json(self):
+        """
+        Decode a JSON body the way Flask's ``request.json`` accepts it.
+
+        Raises:
+            ValueError: 'Invalid request body: ...' if the body is not JSON
+        """
+        mimetype = self.headers.get('content-type', '').split(';', 1)[0].strip().lower()
+        if mimetype != 'application/json' and not mimetype.endswith('+json'):
+            raise ValueError("Invalid request body: Content-Type must be application/json")
+        try:
+            return json.loads(await self.body())
+        except ValueError as e:
+            raise ValueError(f"Invalid request body: {str(e)}")
+
+    def wants_async(self):
+        """Check whether the client asked for an asynchronous job, as in app.py"""
+        for part in self.query.split('&'):
+            name, _, value = part.partition('=')
+            if name == 'async' and value.lower() in ('true', '1', 't'):
+                return True
+        return 'respond-async' in self.headers.get('prefer', '').lower()
+
+
+def _dumps(body):
+    """Encode a response body like Flask's jsonify"""
+    return (flask_app.json.dumps(body, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+async def _respond(send, status, body, content_type='application/json', headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode('latin-1')),
+            (b'content-length', str(len(body)).encode('latin-1')),
+            *((name.encode('latin-1'), value.encode('latin-1')) for name, value in headers)
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+_index_page = None
+
+
+async def index(request, send):
+    global _index_page
+    if _index_page is None:
+        # The page is static; render it once with Flask's url_for
+        with flask_app.test_request_context('/'):
+            _index_page = render_template('index.html').encode('utf-8')
+    await _respond(send, 200, _index_page, 'text/html; charset=utf-8')
+    return 200
+
+
+async def health_check(request, send):
+    await _respond(send, 200, _dumps({"status": "healthy"}))
+    return 200
+
+
+async def ready(request, send):
+    body, status = get_generation_executors().readiness()
+    await _respond(send, status, _dumps(body))
+    return status
+
+
+def _overloaded_body(error):
+    return {
+        'success': False,
+        'error_message': str(error),
+        'retryAfter': error.retry_after
+    }
+
+
+def _deadline(request, data, received):
+    """
+    Return the request's deadline as a time.monotonic() value, or None.
+
+    Raises:
+        ValueError: If the client's timeout is invalid
+    """
+    timeout = parse_timeout(request.headers.get(DEADLINE_HEADER.lower()), data)
+    return received + timeout if timeout is not None else None
+
+
+def _admitted_runner(deadline):
+    """Coroutine function running one batch generation, with 429 or 504 records for rejected keys"""
+    async def run(kind, data):
+        try:
+            return await get_generation_executors().run(kind, data, deadline=deadline)
+        except OverloadedError as e:
+            return _overloaded_body(e), 429
+        except DeadlineExceeded as e:
+            return {'success': False, 'error_message': str(e)}, 504
+    return run
+
+
+async def generate(request, send, kind):
+    timing_token = start_collecting() if env_flag('SERVER_TIMING', '1') else None
+    start = time.perf_counter()
+    received = time.monotonic()
+    headers = []
+    try:
+        try:
+            with span('request.validate'):
+                data = await request.json() or {}
+                deadline = _deadline(request, data, received)
+        except ValueError as e:
+            status = 400
+            body = {
+                'success': False,
+                'error_message': str(e)
+            }
+        else:
+            def run():
+                return get_generation_executors().run(kind, data, deadline=deadline)
+
+            idempotency_key = request.headers.get(IDEMPOTENCY_HEADER.lower())
+            try:
+                if idempotency_key is None:
+                    body, status = await run()
+                else:
+                    body, status, replayed = await arun_idempotent(
+                        get_idempotency_cache(), idempotency_key, kind, data, run, deadline=deadline
+                    )
+                    if replayed:
+                        headers.append((REPLAYED_HEADER, 'true'))
+            except IdempotencyError as e:
+                body, status = {'success': False, 'error_message': str(e)}, e.status
+            except OverloadedError as e:
+                body, status = _overloaded_body(e), 429
+                headers.append(('Retry-After', str(e.retry_after)))
+            except DeadlineExceeded as e:
+                body, status = {'success': False, 'error_message': str(e)}, 504
+            except Exception as e:
+                # Answer with the JSON error body instead of dropping the connection
+                logger.exception(f"Unhandled error generating {kind}")
+                body, status = {'success': False, 'error_message': f'Internal server error: {str(e)}'}, 500
+        with span('response.json'):
+            encoded = _dumps(body)
+    finally:
+        collected = stop_collecting(timing_token) if timing_token is not None else None
+    if collected is not None:
+        headers.append(('Server-Timing', server_timing(collected, time.perf_counter() - start)))
+    await _respond(send, status, encoded, headers=headers)
+    return status
+
+
+async def batch(request, send):
+    received = time.monotonic()
+    with span('request.validate'):
+        try:
+            data = await request.json()
+            specs = parse_batch_specs(data, max_keys=get_batch_max_keys())
+            deadline = _deadline(request, data, received)
+        except ValueError as e:
+            error_message = str(e)
+        else:
+            error_message = None
+    if error_message is not None:
+        await _respond(send, 400, _dumps({'success': False, 'error_message': error_message}))
+        return 400
+
+    # Results are encoded and sent one line at a time so no key is buffered
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'application/x-ndjson')]
+    })
+    async for record in aiter_batch_results(specs, _admitted_runner(deadline)):
+        await send({'type': 'http.response.body', 'body': (json.dumps(record) + '\n').encode('utf-8'), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+    return 200
+
+
+# (method, path) -> native route; anything else goes to the Flask app
+ROUTES = {
+    ('GET', '/'): index,
+    ('HEAD', '/'): index,
+    ('GET', '/health'): health_check,
+    ('HEAD', '/health'): health_check,
+    ('GET', '/ready'): ready,
+    ('POST', '/generate/batch'): batch
+}
+for _kind in HANDLERS:
+    ROUTES[('POST', f'/generate/{_kind}')] = partial(generate, kind=_kind)
+
+
+class KeyGeneratorASGI:
+    """The ASGI application: native routes first, then the Flask app"""
+
+    def __init__(self, flask_wsgi_app, wsgi_workers=10):
+        self.wsgi = WSGIMiddleware(flask_wsgi_app, workers=wsgi_workers)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        route = ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        request = _Request(scope, receive) if route is not None else None
+        if route is None or (isinstance(route, partial) and request.wants_async()):
+            await self.wsgi(scope, receive, send)
+            return
+
+        # Same route labels as Flask's url_rule in app.py
+        start = time.perf_counter()
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(request.path)
+        in_flight.inc()
+        status = 500
+        try:
+            status = await route(request, send)
+        except ConnectionError:
+            status = 499
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_DURATION.labels(request.method, request.path, str(status)).observe(
+                time.perf_counter() - start
+            )
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Replaces gunicorn's child_exit hook: drop gauges of processes that are gone
+                sweep_dead_processes()
+                start_key_pool()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                get_generation_executors().shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = KeyGeneratorASGI(flask_app, wsgi_workers=env_int('ASGI_WSGI_WORKERS', 10))
@@ -0,0 +1,174 @@
+"""Benchmark the ASGI server against gunicorn sync workers under many slow requests.
+
+Starts each server on a local port, opens ``--clients`` concurrent
+connections that each request one RSA key, and meanwhile probes /health
+every ``--probe-interval`` seconds. With 4 sync workers, gunicorn serves 4
+requests at a time and /health waits behind the RSA requests; uvicorn keeps
+every connection open on one event loop and answers /health at once.
+
+Reports RSA completion latency and throughput, /health latency and the
+resident memory of each server's process tree.
+
+Usage:
+    python -m benchmarks.bench_asgi [--clients N] [--key-size N] [--server gunicorn|uvicorn|both]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = str(Path(__file__).parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.suite import percentile
+
+SERVERS = {
+    'gunicorn': ['gunicorn', '--bind', '127.0.0.1:{port}', '--workers', '4', '--backlog', '8192', 'app:app'],
+    'uvicorn': ['uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', '{port}', '--backlog', '8192',
+                '--log-level', 'warning']
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _tree_rss_mb(pid):
+    """Resident memory of a process and all its descendants"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+        except (OSError, StopIteration):
+            pass
+    return total / 1024
+
+
+async def _http(port, method, path, body=None, timeout=600):
+    """One HTTP/1.1 request on a fresh connection; returns (status, seconds)"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    payload = json.dumps(body).encode() if body is not None else b''
+    writer.write(
+        f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n'
+        f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'.encode() + payload
+    )
+    await writer.drain()
+    response = await asyncio.wait_for(reader.read(), timeout)
+    writer.close()
+    status = int(response.split(b' ', 2)[1]) if response.startswith(b'HTTP/') else 0
+    return status, time.perf_counter() - start
+
+
+async def _load(port, clients, key_size, probe_interval):
+    done = asyncio.Event()
+
+    async def slow_client():
+        try:
+            return await _http(port, 'POST', '/generate/rsa', {'keySize': key_size})
+        except (OSError, asyncio.TimeoutError):
+            return 0, 0.0
+
+    async def probe():
+        samples = []
+        while not done.is_set():
+            try:
+                samples.append(await _http(port, 'GET', '/health', timeout=120))
+            except (OSError, asyncio.TimeoutError):
+                samples.append((0, 120.0))
+            await asyncio.sleep(probe_interval)
+        return samples
+
+    start = time.perf_counter()
+    prober = asyncio.create_task(probe())
+    results = await asyncio.gather(*(slow_client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    return results, await prober, elapsed
+
+
+def run_server(name, clients, key_size, probe_interval):
+    port = _free_port()
+    storage = tempfile.mkdtemp(prefix='bench-asgi-')
+    env = dict(os.environ, KEY_STORAGE_PATH=storage, GNUPGHOME=os.path.join(storage, '.gnupg'),
+               PROMETHEUS_MULTIPROC_DIR=os.path.join(storage, '.prom'))
+    os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'])
+    command = [arg.format(port=port) for arg in SERVERS[name]]
+    server = subprocess.Popen(command, cwd=project_root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if asyncio.run(_http(port, 'GET', '/health', timeout=5))[0] == 200:
+                    break
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{name} did not start")
+            time.sleep(0.2)
+        # Warm up: start every executor process before measuring
+        asyncio.run(_http(port, 'POST', '/generate/rsa', {'keySize': key_size}))
+        results, probes, elapsed = asyncio.run(_load(port, clients, key_size, probe_interval))
+        rss = _tree_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        shutil.rmtree(storage, ignore_errors=True)
+
+    latencies = sorted(seconds for status, seconds in results if status == 200)
+    health = sorted(seconds for status, seconds in probes if status == 200)
+    return {
+        'rsaOk': len(latencies),
+        'rsaErrors': clients - len(latencies),
+        'rsaPerSec': len(latencies) / elapsed,
+        'rsaP50Ms': percentile(latencies, 50) * 1000 if latencies else None,
+        'rsaP99Ms': percentile(latencies, 99) * 1000 if latencies else None,
+        'healthP50Ms': percentile(health, 50) * 1000 if health else None,
+        'healthMaxMs': health[-1] * 1000 if health else None,
+        'rssMb': rss
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=1000, help='concurrent RSA requests')
+    parser.add_argument('--key-size', type=int, default=2048)
+    parser.add_argument('--probe-interval', type=float, default=0.05, help='seconds between /health probes')
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn', 'both'), default='both')
+    args = parser.parse_args(argv)
+
+    print(f"{args.clients} concurrent RSA-{args.key_size} requests, {os.cpu_count()} CPUs")
+    for name in (tuple(SERVERS) if args.server == 'both' else (args.server,)):
+        result = run_server(name, args.clients, args.key_size, args.probe_interval)
+        print(f"{name:9} rsa ok {result['rsaOk']:5} errors {result['rsaErrors']:4}  "
+              f"{result['rsaPerSec']:7.2f}/s  p50 {result['rsaP50Ms']:9.1f}ms  p99 {result['rsaP99Ms']:9.1f}ms  "
+              f"health p50 {result['healthP50Ms']:8.1f}ms  max {result['healthMaxMs']:8.1f}ms  "
+              f"rss {result['rssMb']:7.1f}MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Benchmark gpg engine latency as generations accumulate, per PGP_GPG_HOME mode.
+
+With PGP_GPG_HOME=shared every generated key stays in GNUPGHOME, so the
+keyring grows with each request; delete removes each key again after export,
+and ephemeral generates each key in a throwaway tmpfs home. The report shows
+p50 latency per window of generations, which should stay flat in the delete
+and ephemeral modes.
+
+``--seed`` imports that many extra public keys into the shared keyring
+first (built with the native engine, which is fast), to show the effect of
+a large keyring without waiting for thousands of gpg generations.
+
+Usage:
+    python -m benchmarks.bench_gpg_home [--keys N] [--window N] [--mode shared|delete|ephemeral|all]
+                                        [--seed N] [--curve CURVE]
+
+Example (the full run behind the flat-latency claim; takes hours with gpg):
+    python -m benchmarks.bench_gpg_home --keys 10000 --window 1000 --mode ephemeral
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+
+def _seed_keyring(gpg_home, count, curve):
+    """Import ``count`` public keys into the keyring at gpg_home"""
+    import gnupg
+    from generators.openpgp import generate_openpgp_key
+    gpg = gnupg.GPG(gnupghome=gpg_home)
+    batch = []
+    for i in range(count):
+        key = generate_openpgp_key(f'Seed {i} <seed{i}@example.com>', 'ECC', 'seed', curve=curve, coded_count=0)
+        batch.append(key['publicKey'])
+        if len(batch) == 500 or i == count - 1:
+            gpg.import_keys('\n'.join(batch))
+            batch = []
+
+
+def run_mode(mode, keys, window, seed, curve):
+    """
+    Generate ``keys`` PGP keys with the gpg engine in one home mode.
+
+    Returns:
+        list: (first generation, p50 ms, keyring bytes) for each window
+    """
+    from generators.pgp import generate_pgp_key
+
+    gpg_home = tempfile.mkdtemp(prefix='bench-gpg-')
+    ephemeral_root = tempfile.mkdtemp(prefix='bench-eph-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    os.environ.update({
+        'PGP_ENGINE': 'gpg',
+        'PGP_GPG_HOME': mode,
+        'PGP_EPHEMERAL_HOME_DIR': ephemeral_root,
+        'GNUPGHOME': gpg_home
+    })
+    try:
+        if seed:
+            _seed_keyring(gpg_home, seed, curve)
+        windows = []
+        samples = []
+        for i in range(keys):
+            start = time.perf_counter()
+            result = generate_pgp_key(name='Bench User', email='bench@example.com', key_type='ECC', curve=curve)
+            samples.append(time.perf_counter() - start)
+            if not result['success']:
+                raise RuntimeError(result['error_message'])
+            if len(samples) == window or i == keys - 1:
+                keyring = sum(f.stat().st_size for f in Path(gpg_home).rglob('*') if f.is_file())
+                windows.append((i + 1 - len(samples), statistics.median(samples) * 1000, keyring))
+                print(f"{mode:10} keys {i + 1 - len(samples):6}-{i:6}  p50 {windows[-1][1]:9.2f}ms  "
+                      f"keyring {keyring / 1024:10.1f}KB", file=sys.stderr)
+                samples = []
+        leftovers = os.listdir(ephemeral_root)
+        if leftovers:
+            raise RuntimeError(f"ephemeral homes left behind: {leftovers}")
+        return windows
+    finally:
+        shutil.rmtree(gpg_home, ignore_errors=True)
+        shutil.rmtree(ephemeral_root, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keys', type=int, default=10000, help='generations per mode')
+    parser.add_argument('--window', type=int, default=500, help='generations per reported p50')
+    parser.add_argument('--mode', choices=('shared', 'delete', 'ephemeral', 'all'), default='all')
+    parser.add_argument('--seed', type=int, default=0, help='public keys imported into the shared keyring first')
+    parser.add_argument('--curve', default='ed25519', help='ECC curve to generate (cheapest for gpg)')
+    args = parser.parse_args(argv)
+
+    modes = ('shared', 'delete', 'ephemeral') if args.mode == 'all' else (args.mode,)
+    for mode in modes:
+        windows = run_mode(mode, args.keys, args.window, args.seed, args.curve)
+        first, last = windows[0][1], windows[-1][1]
+        print(f"{mode}: first window p50 {first:.2f}ms, last window p50 {last:.2f}ms "
+              f"({(last / first - 1) * 100:+.1f}%), final keyring {windows[-1][2] / 1024:.1f}KB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
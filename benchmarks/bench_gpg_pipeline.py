@@ -0,0 +1,98 @@
+"""Benchmark the gpg engine pipeline: separate gpg calls vs one secret export per key.
+
+The legacy pipeline runs gpg for --gen-key, --export, --export-secret-key
+and, in delete mode, two deletes. The current one derives the public key
+from the secret export and deletes both keys with one gpg call, so a key
+costs two gpg processes (three in delete mode). Two is the floor: gpg has
+no command that generates a key and exports its secret part, so the
+secret export is always its own process.
+The benchmark runs in delete mode, so it reports 5 spawns per key for the
+legacy pipeline and 3 for the current one.
+
+Usage:
+    python -m benchmarks.bench_gpg_pipeline [--keys N] [--curve CURVE] [--key-type RSA|ECC]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.bench_pgp_context import _SpawnCounter
+from generators import pgp
+
+
+def _legacy_generate(gpg_home, key_type, curve):
+    """Replicate the gpg calls made per key before the single-export pipeline"""
+    gpg = pgp._get_gpg_context(gpg_home).gpg
+    key_input = gpg.gen_key_input(
+        name_real='Bench User', name_email='bench@example.com', expire_date='0', passphrase='bench',
+        **pgp._gpg_key_parameters(key_type, 2048, curve)
+    )
+    key = gpg.gen_key(key_input)
+    public_key = gpg.export_keys(str(key))
+    private_key = gpg.export_keys(str(key), secret=True, passphrase='bench')
+    gpg.delete_keys(str(key), secret=True, passphrase='bench')
+    gpg.delete_keys(str(key))
+    return public_key and private_key
+
+
+def _pipeline_generate(gpg_home, key_type, curve):
+    result = pgp.generate_pgp_key(name='Bench User', email='bench@example.com', key_type=key_type,
+                                  key_length=2048 if key_type == 'RSA' else None, curve=curve,
+                                  passphrase='bench')
+    return result['success']
+
+
+def _measure(generate, gpg_home, keys, key_type, curve):
+    timings = []
+    with _SpawnCounter() as spawns:
+        for _ in range(keys):
+            start = time.perf_counter()
+            if not generate(gpg_home, key_type, curve):
+                raise RuntimeError('generation failed')
+            timings.append(time.perf_counter() - start)
+    return timings, spawns.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keys', type=int, default=10, help='keys generated per pipeline')
+    parser.add_argument('--key-type', choices=('RSA', 'ECC'), default='ECC')
+    parser.add_argument('--curve', default='ed25519', help='ECC curve to generate')
+    args = parser.parse_args(argv)
+    curve = args.curve if args.key_type == 'ECC' else None
+
+    with tempfile.TemporaryDirectory(prefix='bench_gpg_', dir='/tmp') as gpg_home, \
+            tempfile.TemporaryDirectory(prefix='bench_keys_') as key_storage:
+        os.chmod(gpg_home, 0o700)
+        os.environ.update({
+            'GNUPGHOME': gpg_home,
+            'KEY_STORAGE_PATH': key_storage,
+            'PGP_ENGINE': 'gpg',
+            'PGP_GPG_HOME': 'delete',
+            'PGP_GPG_SLOTS': '0'
+        })
+        # Start the gpg-agent before timing
+        _pipeline_generate(gpg_home, args.key_type, curve)
+
+        print(f"{args.keys} {args.key_type} {curve or 2048} keys per pipeline")
+        results = {}
+        for label, generate in (('legacy', _legacy_generate), ('pipeline', _pipeline_generate)):
+            timings, spawns = _measure(generate, gpg_home, args.keys, args.key_type, curve)
+            results[label] = statistics.median(timings)
+            print(f"{label:<10} p50={results[label] * 1000:9.2f} ms  "
+                  f"mean={statistics.mean(timings) * 1000:9.2f} ms  spawns/key={spawns / args.keys:.2f}")
+        print(f"p50 change: {(results['pipeline'] / results['legacy'] - 1) * 100:+.1f}%")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Stress the gpg engine from several worker processes: one shared GNUPGHOME vs per-worker slots.
+
+Each worker process generates PGP keys with the gpg engine in a loop, the
+way gunicorn workers (and the pods sharing the key volume) do. With
+PGP_GPG_SLOTS=0 every worker uses the same GNUPGHOME, so their gpg calls
+queue on its keyring locks and its single gpg-agent; with PGP_GPG_SLOTS=1
+each worker has its own home and agent. The report shows total keys per
+second for each worker count, which should grow with the workers (up to
+the CPU count) with slots and stay flat without them.
+
+Usage:
+    python -m benchmarks.bench_gpg_slots [--workers 1,2,4] [--keys N] [--curve CURVE]
+                                         [--layout gnupghome|slots|both]
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+LAYOUTS = {'gnupghome': '0', 'slots': '1'}
+
+
+def _worker(keys, curve, start, results):
+    from generators.pgp import generate_pgp_key
+    start.wait()
+    errors = 0
+    for _ in range(keys):
+        result = generate_pgp_key(name='Stress User', email='stress@example.com', key_type='ECC', curve=curve)
+        errors += not result['success']
+    results.put(errors)
+
+
+def run_layout(layout, workers, keys, curve):
+    """
+    Generate ``keys`` PGP keys in each of ``workers`` processes at once.
+
+    Returns:
+        dict: keysPerSec, seconds and errors
+    """
+    gpg_home = tempfile.mkdtemp(prefix='stress-gpg-', dir='/tmp')
+    slot_root = tempfile.mkdtemp(prefix='stress-slot-', dir='/dev/shm' if os.path.isdir('/dev/shm') else '/tmp')
+    os.environ.update({
+        'PGP_ENGINE': 'gpg',
+        'PGP_GPG_HOME': 'delete',
+        'PGP_GPG_SLOTS': LAYOUTS[layout],
+        'PGP_EPHEMERAL_HOME_DIR': slot_root,
+        'GNUPGHOME': gpg_home
+    })
+    ctx = multiprocessing.get_context('spawn')
+    start, results = ctx.Event(), ctx.Queue()
+    processes = [ctx.Process(target=_worker, args=(keys, curve, start, results)) for _ in range(workers)]
+    try:
+        for process in processes:
+            process.start()
+        began = time.perf_counter()
+        start.set()
+        errors = sum(results.get() for _ in processes)
+        seconds = time.perf_counter() - began
+        for process in processes:
+            process.join()
+        return {'keysPerSec': workers * keys / seconds, 'seconds': seconds, 'errors': errors}
+    finally:
+        shutil.rmtree(gpg_home, ignore_errors=True)
+        shutil.rmtree(slot_root, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4', help='comma-separated worker process counts')
+    parser.add_argument('--keys', type=int, default=20, help='keys generated by each worker')
+    parser.add_argument('--curve', default='ed25519', help='ECC curve to generate (cheapest for gpg)')
+    parser.add_argument('--layout', choices=('gnupghome', 'slots', 'both'), default='both')
+    args = parser.parse_args(argv)
+
+    layouts = tuple(LAYOUTS) if args.layout == 'both' else (args.layout,)
+    print(f"{os.cpu_count()} CPUs")
+    for layout in layouts:
+        for workers in (int(n) for n in args.workers.split(',')):
+            result = run_layout(layout, workers, args.keys, args.curve)
+            print(f"{layout:10} workers {workers:3}  {result['keysPerSec']:8.2f} keys/s  "
+                  f"{result['seconds']:8.2f}s  errors {result['errors']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
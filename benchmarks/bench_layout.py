@@ -0,0 +1,86 @@
+"""Benchmark key create/lookup latency for the flat and sharded storage layouts.
+
+Every key gets its own uuid directory, as for keys generated without a
+comment, which is what makes the flat ``keys/<type>`` directory grow.
+
+Usage:
+    python -m benchmarks.bench_layout [--keys N] [--lookups N] [--dir PATH]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from storage.filesystem import FilesystemKeyStore
+from storage.layout import LAYOUTS
+
+PRIVATE_KEY = 'x' * 64
+PUBLIC_KEY = 'y' * 64
+
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def _report(label, samples):
+    print(f"  {label:8} p50 {_percentile(samples, 50) * 1e6:8.1f}us"
+          f"  p99 {_percentile(samples, 99) * 1e6:8.1f}us"
+          f"  {len(samples) / sum(samples):12,.0f} ops/s")
+
+
+def _run(base_path, layout, keys, lookups):
+    store = FilesystemKeyStore(base_path, layout=layout)
+    handles = []
+    create = []
+    for i in range(keys):
+        start = time.perf_counter()
+        handles.append(store.put(PRIVATE_KEY, PUBLIC_KEY, 'ssh')['storageHandle'])
+        create.append(time.perf_counter() - start)
+        if (i + 1) % 100000 == 0:
+            print(f"  {i + 1} keys created", file=sys.stderr)
+
+    lookup = []
+    for handle in random.sample(handles, min(lookups, len(handles))):
+        start = time.perf_counter()
+        store.get(handle)
+        lookup.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    top_level = sum(1 for _ in os.scandir(os.path.join(base_path, 'ssh')))
+    listing = time.perf_counter() - start
+
+    print(f"{layout}: {keys} keys, {top_level} entries in keys/ssh")
+    _report('create', create)
+    _report('lookup', lookup)
+    print(f"  list keys/ssh {listing * 1e3:.1f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keys', type=int, default=100000, help='keys per layout (use 1000000 for the full run)')
+    parser.add_argument('--lookups', type=int, default=10000, help='random lookups per layout')
+    parser.add_argument('--dir', default=None, help='scratch directory, on the volume to measure')
+    parser.add_argument('--layout', choices=LAYOUTS, action='append', help='layouts to run, default both')
+    args = parser.parse_args(argv)
+
+    for layout in args.layout or LAYOUTS:
+        base_path = tempfile.mkdtemp(prefix=f'bench-layout-{layout}-', dir=args.dir)
+        try:
+            _run(base_path, layout, args.keys, args.lookups)
+        finally:
+            shutil.rmtree(base_path, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
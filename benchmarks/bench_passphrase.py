@@ -0,0 +1,58 @@
+"""Benchmark passphrase throughput: per-character secrets.choice vs the byte-buffered sampler.
+
+Usage:
+    python -m benchmarks.bench_passphrase [--count N] [--length N]
+"""
+import argparse
+import secrets
+import string
+import sys
+import time
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from generators.passphrase import generate_passphrases
+
+
+def _legacy(count, length):
+    """The original loop: one secrets.choice call per character"""
+    chars = string.ascii_letters + string.digits + string.punctuation
+    return [''.join(secrets.choice(chars) for _ in range(length)) for _ in range(count)]
+
+
+def _bulk(count, length):
+    return generate_passphrases(count, length=length)
+
+
+def _rate(func, count, length, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(count, length)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000, help='passphrases per run')
+    parser.add_argument('--length', type=int, default=16, help='passphrase length')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per mode, best is kept')
+    args = parser.parse_args(argv)
+
+    legacy = _rate(_legacy, args.count, args.length, args.repeat)
+    bulk = _rate(_bulk, args.count, args.length, args.repeat)
+    print(f"{args.count} passphrases of length {args.length}")
+    print(f"legacy  {legacy:14,.0f} passphrases/s")
+    print(f"bulk    {bulk:14,.0f} passphrases/s")
+    print(f"speedup {bulk / legacy:14.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Benchmark per-request GPG setup: legacy probing vs the cached per-process context.
+
+Usage:
+    python -m benchmarks.bench_pgp_context [--iterations N] [--generate N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+import gnupg
+from generators import pgp
+
+
+class _SpawnCounter:
+    """Count subprocesses started through subprocess.Popen"""
+
+    def __init__(self):
+        self.count = 0
+        self._original = subprocess.Popen
+
+    def __enter__(self):
+        counter = self
+
+        class CountingPopen(self._original):
+            def __init__(self, *args, **kwargs):
+                counter.count += 1
+                super().__init__(*args, **kwargs)
+
+        subprocess.Popen = CountingPopen
+        gnupg.Popen = CountingPopen
+        return self
+
+    def __exit__(self, *exc):
+        subprocess.Popen = self._original
+        gnupg.Popen = self._original
+
+
+def _legacy_setup(gpg_home):
+    """Replicate the probing done on every request before the context cache"""
+    gpg_path = pgp._get_gpg_path()
+    pgp._check_gpg_installation()
+    gpg = gnupg.GPG(gnupghome=gpg_home, gpgbinary=gpg_path)
+    gpg.list_keys()
+    return gpg
+
+
+def _cached_setup(gpg_home):
+    return pgp._get_gpg_context(gpg_home).gpg
+
+
+def _measure(setup, gpg_home, iterations):
+    timings = []
+    with _SpawnCounter() as spawns:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            setup(gpg_home)
+            timings.append(time.perf_counter() - start)
+    return timings, spawns.count
+
+
+def _report(label, timings, spawns, iterations):
+    print(f"{label:<10} p50={statistics.median(timings) * 1000:8.3f} ms  "
+          f"mean={statistics.mean(timings) * 1000:8.3f} ms  "
+          f"spawns/request={spawns / iterations:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50,
+                        help='setup iterations per mode')
+    parser.add_argument('--generate', type=int, default=0,
+                        help='also time N full generate_pgp_key calls')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='bench_gpg_') as gpg_home, \
+            tempfile.TemporaryDirectory(prefix='bench_keys_') as key_storage:
+        os.chmod(gpg_home, 0o700)
+        os.environ['GNUPGHOME'] = gpg_home
+        os.environ['KEY_STORAGE_PATH'] = key_storage
+
+        legacy, legacy_spawns = _measure(_legacy_setup, gpg_home, args.iterations)
+        cached, cached_spawns = _measure(_cached_setup, gpg_home, args.iterations)
+
+        print(f"GPG setup cost per request ({args.iterations} iterations)")
+        _report('legacy', legacy, legacy_spawns, args.iterations)
+        _report('cached', cached, cached_spawns, args.iterations)
+        saved = statistics.median(legacy) - statistics.median(cached)
+        print(f"saved per request: {saved * 1000:.3f} ms, "
+              f"{(legacy_spawns - cached_spawns) / args.iterations:.2f} process spawns")
+
+        if args.generate:
+            timings = []
+            with _SpawnCounter() as spawns:
+                for _ in range(args.generate):
+                    start = time.perf_counter()
+                    result = pgp.generate_pgp_key(name='Bench User', email='bench@example.com')
+                    timings.append(time.perf_counter() - start)
+                    if not result['success']:
+                        print(f"generation failed: {result['error_message']}")
+                        return 1
+            _report('generate', timings, spawns.count, args.generate)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,302 @@
+"""Latency and throughput benchmarks for every generator, key storage and the HTTP routes.
+
+Each case runs in a fresh process so its peak RSS is its own. Results are
+written as JSON and can be compared against a stored baseline; any case
+that got slower or heavier than the tolerance allows fails the run.
+
+Usage:
+    python -m benchmarks.suite [--filter TEXT] [--scale F] [--concurrency N]
+                               [--url URL] [--output FILE] [--baseline FILE] [--tolerance F]
+
+Examples:
+    # Record a baseline
+    python -m benchmarks.suite --output benchmarks/baseline.json
+
+    # Compare a change against it; exits 1 on regressions
+    python -m benchmarks.suite --baseline benchmarks/baseline.json
+
+    # Drive a running server (e.g. gunicorn) instead of the in-process app
+    python -m benchmarks.suite --filter route/ --url http://localhost:5001 --concurrency 8
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+# Measured iterations per case at --scale 1; slow key sizes get fewer
+CASES = {
+    'passphrase': 2000,
+    'ssh/rsa-2048': 20,
+    'ssh/rsa-4096': 4,
+    'ssh/ecdsa-256': 200,
+    'ssh/ecdsa-384': 200,
+    'ssh/ecdsa-521': 100,
+    'ssh/ed25519': 500,
+    'rsa/2048': 20,
+    'rsa/4096': 4,
+    'pgp/rsa-2048': 5,
+    'pgp/ecc': 5,
+    'save_key_pair': 500,
+    'route/health': 1000,
+    'route/passphrase': 500,
+    'route/ssh-ed25519': 200,
+    'route/rsa-2048': 20,
+    'route/pgp-rsa-2048': 5,
+}
+
+# Route cases: method, path, JSON body
+ROUTES = {
+    'route/health': ('GET', '/health', None),
+    'route/passphrase': ('POST', '/generate/passphrase', {'length': 16}),
+    'route/ssh-ed25519': ('POST', '/generate/ssh', {'keyType': 'ed25519'}),
+    'route/rsa-2048': ('POST', '/generate/rsa', {'keySize': 2048}),
+    'route/pgp-rsa-2048': ('POST', '/generate/pgp', {
+        'name': 'Bench User', 'email': 'bench@example.com', 'keyType': 'RSA', 'keyLength': 2048
+    }),
+}
+
+# Stand-ins the size of an unencrypted RSA-2048 PEM pair
+PRIVATE_PEM = 'P' * 1704
+PUBLIC_PEM = 'Q' * 451
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def _generator_call(name, scratch_dir):
+    """Return a zero-argument callable for a non-route case"""
+    from generators.passphrase import generate_passphrase
+    from generators.ssh import generate_ssh_key
+    from generators.rsa import generate_rsa_key
+    from generators.pgp import generate_pgp_key
+    from utils.utils import save_key_pair
+
+    kind, _, variant = name.partition('/')
+    if kind == 'passphrase':
+        return lambda: generate_passphrase(length=16)
+    if kind == 'ssh':
+        key_type, _, size = variant.partition('-')
+        return lambda: generate_ssh_key(key_type=key_type, key_size=int(size) if size else None)
+    if kind == 'rsa':
+        return lambda: generate_rsa_key(key_size=int(variant))
+    if kind == 'pgp':
+        key_type = 'RSA' if variant.startswith('rsa') else 'ECC'
+        return lambda: generate_pgp_key(
+            name='Bench User', email='bench@example.com', key_type=key_type,
+            key_length=2048 if key_type == 'RSA' else None
+        )
+    if kind == 'save_key_pair':
+        return lambda: save_key_pair(PRIVATE_PEM, PUBLIC_PEM, scratch_dir, 'rsa')
+    raise ValueError(f"Unknown benchmark case: {name}")
+
+
+def _route_call(name, url):
+    """Return a factory making one zero-argument callable per worker thread"""
+    method, path, body = ROUTES[name]
+    if url:
+        import requests
+
+        def factory():
+            session = requests.Session()
+            return lambda: session.request(method, url.rstrip('/') + path, json=body, timeout=300)
+        return factory
+
+    from app import app
+    app.config['TESTING'] = True
+
+    def factory():
+        client = app.test_client()
+        return lambda: client.open(path, method=method, json=body)
+    return factory
+
+
+def _ok(result):
+    status = getattr(result, 'status_code', None)
+    if status is not None:
+        return status < 400
+    return not isinstance(result, dict) or result.get('success', True)
+
+
+def run_case(name, iterations, concurrency=1, url=None):
+    """
+    Run one benchmark case in the current process.
+
+    Args:
+        name (str): Case name from CASES
+        iterations (int): Measured calls, split across the worker threads
+        concurrency (int): Worker threads issuing calls
+        url (str): Base URL of a running server for route cases
+
+    Returns:
+        dict: iterations, concurrency, errors, latency percentiles in ms,
+        opsPerSec, peakRssMb and peakChildRssMb
+    """
+    scratch_dir = tempfile.mkdtemp(prefix='bench-')
+    os.environ['KEY_STORAGE_PATH'] = scratch_dir
+    os.environ['GNUPGHOME'] = os.path.join(scratch_dir, '.gnupg')
+    os.makedirs(os.environ['GNUPGHOME'], mode=0o700, exist_ok=True)
+    try:
+        if name in ROUTES:
+            factory = _route_call(name, url)
+        else:
+            call = _generator_call(name, scratch_dir)
+
+            def factory():
+                return call
+
+        # Warm up imports, caches and pools outside the measurement
+        factory()()
+
+        samples = []
+        errors = []
+        lock = threading.Lock()
+        counts = [iterations // concurrency + (1 if i < iterations % concurrency else 0)
+                  for i in range(concurrency)]
+
+        def worker(count):
+            call = factory()
+            local_samples = []
+            local_errors = 0
+            for _ in range(count):
+                start = time.perf_counter()
+                try:
+                    ok = _ok(call())
+                except Exception:
+                    ok = False
+                local_samples.append(time.perf_counter() - start)
+                local_errors += 0 if ok else 1
+            with lock:
+                samples.extend(local_samples)
+                errors.append(local_errors)
+
+        threads = [threading.Thread(target=worker, args=(count,)) for count in counts if count]
+        wall_start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - wall_start
+
+        return {
+            'iterations': len(samples),
+            'concurrency': concurrency,
+            'errors': sum(errors),
+            'p50Ms': percentile(samples, 50) * 1000,
+            'p95Ms': percentile(samples, 95) * 1000,
+            'p99Ms': percentile(samples, 99) * 1000,
+            'meanMs': sum(samples) / len(samples) * 1000,
+            'opsPerSec': len(samples) / wall,
+            # ru_maxrss is in kilobytes on Linux; children are gpg processes
+            'peakRssMb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'peakChildRssMb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        }
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results against a baseline.
+
+    A case regresses when its p95 latency or peak RSS grew, or its
+    throughput dropped, by more than ``tolerance`` (a fraction), or when
+    it had errors. Cases missing from either side are ignored.
+
+    Returns:
+        list: Human-readable regression descriptions
+    """
+    regressions = []
+    for name, current in results.items():
+        if current['errors']:
+            regressions.append(f"{name}: {current['errors']} failed calls")
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if current['p95Ms'] > base['p95Ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95Ms']:.3f}ms -> {current['p95Ms']:.3f}ms")
+        if current['opsPerSec'] < base['opsPerSec'] * (1 - tolerance):
+            regressions.append(f"{name}: {base['opsPerSec']:.1f} -> {current['opsPerSec']:.1f} ops/s")
+        if current['peakRssMb'] > base['peakRssMb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {base['peakRssMb']:.1f}MB -> {current['peakRssMb']:.1f}MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filter', action='append', help='only run cases containing this text (repeatable)')
+    parser.add_argument('--list', action='store_true', help='list the cases and exit')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply every case\'s iteration count')
+    parser.add_argument('--concurrency', type=int, default=4, help='client threads for route cases')
+    parser.add_argument('--url', default=None, help='base URL of a running server for route cases')
+    parser.add_argument('--output', default=None, help='write JSON results to this file')
+    parser.add_argument('--baseline', default=None, help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed regression as a fraction')
+    args = parser.parse_args(argv)
+
+    names = [n for n in CASES if not args.filter or any(f in n for f in args.filter)]
+    if args.list:
+        print('\n'.join(names))
+        return 0
+
+    results = {}
+    # A fresh spawned process per case keeps peak RSS and warm caches separate
+    for name in names:
+        iterations = max(3, int(CASES[name] * args.scale))
+        concurrency = args.concurrency if name in ROUTES else 1
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            result = executor.submit(run_case, name, iterations, concurrency, args.url).result()
+        results[name] = result
+        print(f"{name:20} p50 {result['p50Ms']:9.2f}ms  p95 {result['p95Ms']:9.2f}ms  "
+              f"p99 {result['p99Ms']:9.2f}ms  {result['opsPerSec']:10.1f} ops/s  "
+              f"{result['peakRssMb']:7.1f}MB  errors {result['errors']}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpuCount': os.cpu_count(),
+            'scale': args.scale,
+            'url': args.url
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"REGRESSIONS against {args.baseline} (tolerance {args.tolerance:.0%}):", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            return 1
+        print(f"No regressions against {args.baseline}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,10 +4,16 @@ set -e
 # Set default values for required paths if not provided
 : "${KEY_STORAGE_PATH:=/app/keys}"
 : "${GNUPGHOME:=/app/keys/.gnupg}"
+# Shared by all server and worker processes so /metrics reports pod-wide totals
+: "${PROMETHEUS_MULTIPROC_DIR:=/tmp/prometheus-multiproc}"
 
 # Export the variables so they are available to the application
 export KEY_STORAGE_PATH
 export GNUPGHOME
+export PROMETHEUS_MULTIPROC_DIR
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+# Start from empty metrics, as gunicorn.conf.py does; uvicorn has no such hook
+find "$PROMETHEUS_MULTIPROC_DIR" -maxdepth 1 -name '*.db' -type f -delete
 
 # Execute the main command
 exec "$@"
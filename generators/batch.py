@@ -0,0 +1,131 @@
+import json
+from utils.config import env_int
+from .handlers import HANDLERS, run_handler
+
+# Upper bound on keys per batch request, overridable through BATCH_MAX_KEYS
+DEFAULT_BATCH_MAX_KEYS = 1000
+
+
+def get_batch_max_keys():
+    """Return the configured maximum number of keys per batch request"""
+    return env_int('BATCH_MAX_KEYS', DEFAULT_BATCH_MAX_KEYS)
+
+
+def parse_batch_specs(data, max_keys=DEFAULT_BATCH_MAX_KEYS):
+    """
+    Validate a batch request body.
+
+    The body is either a list of specs or an object with a ``specs`` list.
+    Each spec carries a ``type`` (passphrase, ssh, rsa or pgp), an optional
+    ``repeat`` (default 1) and the same parameters as the single-key endpoint.
+    ``count`` is a passphrase parameter, so other specs must not carry it.
+
+    Args:
+        data: Decoded JSON request body
+        max_keys (int): Maximum total number of keys across all specs
+
+    Returns:
+        list: (type, repeat, params) tuples
+
+    Raises:
+        ValueError: If the body or any spec is invalid
+    """
+    if isinstance(data, dict):
+        data = data.get('specs')
+    if not isinstance(data, list) or not data:
+        raise ValueError("Batch request must contain a non-empty 'specs' list")
+
+    specs = []
+    total = 0
+    for position, spec in enumerate(data):
+        if not isinstance(spec, dict):
+            raise ValueError(f"Spec {position} must be an object")
+
+        params = dict(spec)
+        kind = params.pop('type', None)
+        if kind not in HANDLERS:
+            raise ValueError(
+                f"Spec {position} has an invalid type. Must be one of: {', '.join(HANDLERS)}"
+            )
+
+        if kind != 'passphrase' and 'count' in params:
+            raise ValueError(f"Spec {position} has a count; use 'repeat' to generate it more than once")
+
+        repeat = params.pop('repeat', 1)
+        if isinstance(repeat, bool):
+            raise ValueError(f"Spec {position} repeat must be a positive integer")
+        try:
+            repeat = int(repeat)
+        except (TypeError, ValueError):
+            raise ValueError(f"Spec {position} repeat must be a positive integer")
+        if repeat < 1:
+            raise ValueError(f"Spec {position} repeat must be a positive integer")
+
+        total += repeat
+        if total > max_keys:
+            raise ValueError(f"Batch requests are limited to {max_keys} keys")
+
+        specs.append((kind, repeat, params))
+    return specs
+
+
+def iter_batch_results(specs, deadline=None):
+    """
+    Generate every key in a parsed batch, yielding one result at a time.
+
+    Args:
+        specs (list): Result of ``parse_batch_specs``
+        deadline (float): time.monotonic() after which the remaining keys
+            are not generated, or None
+
+    Yields:
+        dict: The single-key response body plus its batch position, followed
+        by a final summary record
+    """
+    index = 0
+    succeeded = 0
+    for spec_index, (kind, repeat, params) in enumerate(specs):
+        for _ in range(repeat):
+            body, status = run_handler(kind, params, deadline=deadline)
+            if body.get('success'):
+                succeeded += 1
+            yield dict(body, index=index, spec=spec_index, type=kind, status=status)
+            index += 1
+
+    yield _batch_summary(index, succeeded)
+
+
+async def aiter_batch_results(specs, run):
+    """
+    Async variant of ``iter_batch_results``.
+
+    Args:
+        specs (list): Result of ``parse_batch_specs``
+        run: Coroutine function taking (type, params) and returning (body, status_code)
+    """
+    index = 0
+    succeeded = 0
+    for spec_index, (kind, repeat, params) in enumerate(specs):
+        for _ in range(repeat):
+            body, status = await run(kind, params)
+            if body.get('success'):
+                succeeded += 1
+            yield dict(body, index=index, spec=spec_index, type=kind, status=status)
+            index += 1
+
+    yield _batch_summary(index, succeeded)
+
+
+def _batch_summary(total, succeeded):
+    return {
+        'done': True,
+        'total': total,
+        'succeeded': succeeded,
+        'failed': total - succeeded
+    }
+
+
+def iter_batch_ndjson(specs, deadline=None):
+    """Yield batch results encoded as newline-delimited JSON"""
+    for record in iter_batch_results(specs, deadline=deadline):
+        yield json.dumps(record) + '\n'
@@ -0,0 +1,703 @@
+"""Bounded executors that run generation handlers off the ASGI event loop.
+
+RSA, SSH and native PGP generation is CPU-bound and holds the GIL for the
+whole key generation (over 500ms for RSA 4096), so it runs in a pool of
+generation processes. gpg generations spend their time waiting on gpg
+subprocesses and run in a thread pool. Passphrases take microseconds and
+run inline, except bulk requests, which run in the cheap lane's threads. Generation processes have no RSA key pool of their own: when
+the pool is enabled, the web process draws a request's keys from its pool
+(see ``generators.keypool``) and hands them to the process with the request.
+
+Requests are scheduled in lanes by cost class (see ``cost_class``). Each
+lane has its own concurrency budget and FIFO queue, and the pools are sized
+to the sum of the budgets, so a burst of RSA-4096 or PGP requests fills the
+heavy lane while ed25519 SSH keys keep going through the cheap lane. Queued
+requests cost the event loop nothing but memory.
+
+With a latency budget, requests are admitted only while they are expected
+to finish within it. The expected latency of a request is estimated from
+the CPU cost of the work already in its lane, the CPUs the lane can use and
+the request's own cost; costs are learned per generation type and lane from
+completed requests. A request that would queue past the budget fails at
+once with ``OverloadedError``, carrying the seconds until it would fit.
+
+A request may carry a client deadline (see ``utils.deadline``). Once it
+passes, the request fails with ``DeadlineExceeded`` and its work is
+stopped: a queued request leaves its lane, the generation process running
+it is killed and replaced, and gpg subprocesses started for it are killed.
+Requests that would queue past their deadline are not admitted.
+
+The Flask app generates on the thread serving each request, so it has no
+lanes; ``InFlightLimit`` caps the generations each of its worker processes
+runs at once instead.
+"""
+import os
+import math
+import time
+import asyncio
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from utils.config import env_int
+from utils.deadline import CancelScope, DeadlineExceeded, use_scope
+from utils.metrics import ADMISSION_REJECTIONS, GENERATION_CANCELLATIONS, mark_process_dead
+from utils.timing import start_collecting, stop_collecting, add_collected
+from .handlers import run_handler
+from .keypool import take_rsa_private_keys, use_rsa_private_keys
+from .rsa import validate_rsa_key_size
+from .ssh import validate_ssh_key
+
+# Cost classes, cheapest first: microseconds to milliseconds, tens to hundreds
+# of milliseconds (RSA 2048, ECC PGP), and up to seconds (RSA 4096, RSA PGP)
+COST_CLASSES = ('cheap', 'standard', 'heavy')
+# Lanes whose generations run in the process pool and share its CPUs
+PROCESS_LANES = ('standard', 'heavy')
+
+# CPU seconds of one generation per cost class, until requests are measured
+DEFAULT_COSTS = {'cheap': 0.005, 'standard': 0.1, 'heavy': 0.5}
+# Weight of each measurement in the moving average of generation costs
+COST_SMOOTHING = 0.2
+
+# Passphrase characters generated on the event loop; larger requests run in threads
+INLINE_PASSPHRASE_CHARS = 4096
+
+# cgroup v2 and v1 CPU limit files: (quota file, period file or None)
+CGROUP_CPU_LIMITS = (
+    ('/sys/fs/cgroup/cpu.max', None),
+    ('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', '/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+)
+
+
+class OverloadedError(Exception):
+    """Raised when a request would not finish within the latency budget"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def cpu_capacity():
+    """
+    Return the CPUs this process may use: the cgroup CPU limit when one is
+    set (0.5 for a Kubernetes limit of 500m), otherwise the CPU count.
+
+    Returns:
+        float: Number of CPUs, possibly fractional
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    for quota_path, period_path in CGROUP_CPU_LIMITS:
+        try:
+            with open(quota_path) as f:
+                fields = f.read().split()
+            if period_path is not None:
+                with open(period_path) as f:
+                    fields.append(f.read().strip())
+            quota, period = fields[0], int(fields[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        # 'max' (v2) or -1 (v1) means no limit
+        if quota not in ('max', '-1') and period > 0:
+            return min(cpus, int(quota) / period)
+        return cpus
+    return cpus
+
+
+def cost_class(kind, data):
+    """
+    Classify a generation request by the work it will do.
+
+    Key types and sizes are checked with the generators' own validation;
+    requests they would reject are cheap, since they fail before any key
+    is generated.
+
+    Args:
+        kind (str): Generation type
+        data (dict): Decoded request body
+
+    Returns:
+        str: One of COST_CLASSES
+    """
+    try:
+        if kind == 'ssh':
+            key_size = data.get('keySize')
+            key_type, key_size = validate_ssh_key(
+                data.get('keyType', 'rsa'), int(key_size) if key_size is not None else None
+            )
+            if key_type != 'rsa':
+                return 'cheap'
+            return 'heavy' if key_size > 2048 else 'standard'
+        if kind == 'rsa':
+            key_size = validate_rsa_key_size(int(data.get('keySize', 2048)))
+            return 'heavy' if key_size > 2048 else 'standard'
+        if kind == 'pgp':
+            if not data.get('name') or not data.get('email'):
+                return 'cheap'
+            return 'heavy' if str(data.get('keyType', 'RSA')).upper() == 'RSA' else 'standard'
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return 'cheap'
+
+
+def _pooled_key_demand(kind, data):
+    """
+    Return the RSA keys a process-lane request draws from the key pool.
+
+    Returns:
+        tuple: (key size, number of keys), or None for requests without RSA keys
+    """
+    try:
+        if kind == 'ssh':
+            key_size = data.get('keySize')
+            key_type, key_size = validate_ssh_key(
+                data.get('keyType', 'rsa'), int(key_size) if key_size is not None else None
+            )
+            return (key_size, 1) if key_type == 'rsa' else None
+        if kind == 'rsa':
+            return validate_rsa_key_size(int(data.get('keySize', 2048))), 1
+        if kind == 'pgp' and str(data.get('keyType', 'RSA')).upper() == 'RSA':
+            # A primary key and an encryption subkey
+            return int(data.get('keyLength') or 2048), 2
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return None
+
+
+def _init_generation_worker():
+    """Initializer for generation processes"""
+    # The RSA key pool belongs to the web process, which hands pooled keys to each request
+    os.environ['RSA_KEY_POOL_ENABLED'] = '0'
+
+
+def _run_collecting(kind, data, scope=None, rsa_keys=None):
+    """
+    Run a handler and return the spans it recorded, so the web process can
+    build Server-Timing for work done in an executor, and the CPU time it
+    took.
+
+    Args:
+        scope (CancelScope): Cancel scope of the request, for work run in threads
+        rsa_keys (list): Pooled keys drawn for the request by the web process
+
+    Returns:
+        tuple: (body, status_code, collected spans, CPU seconds)
+    """
+    token = start_collecting()
+    cpu_start = time.thread_time()
+    try:
+        with use_scope(scope), use_rsa_private_keys(rsa_keys):
+            body, status = run_handler(kind, data)
+    finally:
+        collected = stop_collecting(token)
+    return body, status, collected, time.thread_time() - cpu_start
+
+
+def _generation_worker(conn):
+    """Main loop of a generation process: run requests received on ``conn`` one at a time"""
+    _init_generation_worker()
+    while True:
+        try:
+            kind, data, rsa_keys = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            result = _run_collecting(kind, data, rsa_keys=rsa_keys)
+        except Exception as e:
+            result = RuntimeError(f"Generation failed: {str(e)}")
+        conn.send(result)
+
+
+class _GenerationProcess:
+    """One generation process and the pipe it takes requests from"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_generation_worker, args=(child_conn,), daemon=True)
+        self.process.start()
+        # The process holds the only other end, so its exit shows up as EOF
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.conn.close()
+        # No gunicorn master reports this process's exit to the metrics
+        mark_process_dead(self.process.pid)
+
+
+class _GenerationProcesses:
+    """Generation processes that can be killed one at a time.
+
+    Unlike a ProcessPoolExecutor, killing the process of a cancelled request
+    leaves the others running; a new process replaces it on the next request.
+    The lane budgets bound how many processes are busy at once.
+    """
+
+    def __init__(self):
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = []
+        self._all = set()
+
+    async def run(self, kind, data, rsa_keys=None):
+        """
+        Run a handler in a generation process. Cancelling the call kills the process.
+
+        Args:
+            rsa_keys (list): Pooled keys from ``take_rsa_private_keys`` for the request
+
+        Returns:
+            tuple: Result of ``_run_collecting``
+        """
+        worker = self._idle.pop() if self._idle else None
+        if worker is None:
+            worker = _GenerationProcess(self._context)
+            self._all.add(worker)
+        loop = asyncio.get_running_loop()
+        result = loop.create_future()
+        fd = worker.conn.fileno()
+
+        def on_readable():
+            loop.remove_reader(fd)
+            if result.done():
+                return
+            try:
+                result.set_result(worker.conn.recv())
+            except (EOFError, OSError):
+                result.set_exception(RuntimeError("Generation process exited unexpectedly"))
+
+        try:
+            worker.conn.send((kind, data, rsa_keys))
+            loop.add_reader(fd, on_readable)
+            outcome = await result
+        except BaseException:
+            # Cancelled, or the process died: it cannot take another request
+            loop.remove_reader(fd)
+            worker.kill()
+            self._all.discard(worker)
+            raise
+        self._idle.append(worker)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def shutdown(self):
+        for worker in self._all:
+            worker.kill()
+        self._all.clear()
+        self._idle = []
+
+
+def _call_soon(loop, callback):
+    """Schedule ``callback`` on ``loop`` from any thread, unless the loop is gone"""
+    try:
+        loop.call_soon_threadsafe(callback)
+    except RuntimeError:
+        pass
+
+
+class _Lane:
+    """Concurrency budget and FIFO queue of one cost class, on one event loop"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.running = 0
+        self.queued = 0
+        # Estimated CPU seconds of the queued generations
+        self.queued_cost = 0.0
+        # token -> (start time, estimated CPU seconds) of each running generation
+        self.started = {}
+        self.semaphore = asyncio.Semaphore(budget)
+
+    def work(self, share):
+        """
+        Estimate the CPU seconds left in this lane.
+
+        Args:
+            share (float): CPUs the lane can use; running generations split
+                them, at most one CPU each
+        """
+        now = time.monotonic()
+        per_generation = min(1.0, share / self.running) if self.running else 0.0
+        remaining = sum(
+            max(0.0, cost - (now - start) * per_generation) for start, cost in self.started.values()
+        )
+        return max(0.0, self.queued_cost) + remaining
+
+
+class GenerationExecutors:
+    """Lanes plus a process pool and a thread pool shared by all requests of one process
+
+    Args:
+        budgets (dict): Concurrency budget per lane, overriding the defaults
+        latency_budget (float): Seconds a request may be expected to take
+            before it is rejected; 0 admits everything
+        capacity (float): CPUs available, by default ``cpu_capacity()``
+    """
+
+    def __init__(self, budgets=None, latency_budget=0, capacity=None):
+        self.capacity = capacity or cpu_capacity()
+        cpus = math.ceil(self.capacity)
+        self.budgets = {'cheap': 4, 'standard': cpus, 'heavy': max(1, cpus // 2)}
+        self.budgets.update(budgets or {})
+        self.latency_budget = latency_budget
+        # (kind, lane) -> moving average of measured CPU seconds
+        self._costs = {}
+        self._processes = None
+        self._threads = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._loop = None
+        self._lanes = {}
+
+    def _executors(self):
+        with self._lock:
+            # A forked child must not reuse the parent's executors
+            if self._processes is None or self._pid != os.getpid():
+                # Every lane can use its whole budget without waiting on another lane
+                self._processes = _GenerationProcesses()
+                self._threads = ThreadPoolExecutor(
+                    max_workers=sum(self.budgets.values()), thread_name_prefix='generation'
+                )
+                self._pid = os.getpid()
+            return self._processes, self._threads
+
+    def _lane(self, name):
+        # asyncio primitives belong to one event loop
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._lanes = {lane: _Lane(budget) for lane, budget in self.budgets.items()}
+        return self._lanes[name]
+
+    def execution(self, kind, lane, data=None):
+        """Return where a request runs: 'inline', 'thread' or 'process'"""
+        if kind == 'passphrase':
+            try:
+                chars = int((data or {}).get('count') or 1) * int((data or {}).get('length', 16))
+            except (AttributeError, TypeError, ValueError):
+                # Invalid requests are rejected without generating anything
+                return 'inline'
+            return 'inline' if chars <= INLINE_PASSPHRASE_CHARS else 'thread'
+        if kind == 'pgp' and os.environ.get('PGP_ENGINE', 'gpg').lower() == 'gpg':
+            return 'thread'
+        return 'thread' if lane == 'cheap' else 'process'
+
+    def estimated_cost(self, kind, lane):
+        """Return the expected CPU seconds of one generation"""
+        return self._costs.get((kind, lane), DEFAULT_COSTS[lane])
+
+    def record_cost(self, kind, lane, seconds):
+        """Fold a measured generation cost into the estimate"""
+        estimate = self.estimated_cost(kind, lane)
+        self._costs[(kind, lane)] = estimate + COST_SMOOTHING * (seconds - estimate)
+
+    def _share(self, name):
+        """CPUs a lane can use: process lanes with work split the CPUs by budget"""
+        budget = self.budgets[name]
+        if name not in PROCESS_LANES:
+            return min(budget, self.capacity)
+        busy = sum(
+            self.budgets[other] for other in PROCESS_LANES
+            if other == name or (other in self._lanes and (self._lanes[other].running or self._lanes[other].queued))
+        )
+        return min(budget, self.capacity * budget / busy)
+
+    def estimated_latency(self, name, cost):
+        """
+        Estimate the seconds until a new request in a lane would finish.
+
+        A request that would queue waits for the lane's remaining work to
+        drain at the lane's share of the CPUs, then runs on at most one CPU.
+
+        Args:
+            name (str): Lane
+            cost (float): Expected CPU seconds of the request
+
+        Returns:
+            float: Estimated latency in seconds
+        """
+        share = self._share(name)
+        lane = self._lanes.get(name)
+        wait = 0.0
+        if lane is not None and lane.running + lane.queued >= lane.budget:
+            wait = lane.work(share) / share
+        return wait + cost / min(1.0, share)
+
+    def _admit(self, kind, name, lane, cost, scope):
+        """
+        Reject a request that cannot start at once and would not finish within
+        the latency budget or before its deadline.
+
+        Raises:
+            OverloadedError: If the request would queue past the latency budget
+            DeadlineExceeded: If it would queue past its deadline
+        """
+        if scope.expired():
+            GENERATION_CANCELLATIONS.labels(kind, 'admission').inc()
+            raise DeadlineExceeded("Request deadline exceeded")
+        remaining = scope.remaining()
+        if (not self.latency_budget and remaining is None) or lane.running + lane.queued < lane.budget:
+            return
+        latency = self.estimated_latency(name, cost)
+        if self.latency_budget and latency > self.latency_budget:
+            ADMISSION_REJECTIONS.labels(name).inc()
+            # The lane's work drains at its CPU share, so the estimate falls by a second per second
+            retry_after = max(1, math.ceil(latency - self.latency_budget))
+            raise OverloadedError(
+                f"Server is overloaded, please retry in {retry_after} seconds", retry_after
+            )
+        if remaining is not None and latency > remaining:
+            GENERATION_CANCELLATIONS.labels(kind, 'admission').inc()
+            raise DeadlineExceeded("Request deadline would be exceeded")
+
+    async def run(self, kind, data, deadline=None):
+        """
+        Run the handler for a generation type without blocking the event loop.
+
+        The request first waits for a free slot in its cost class lane. Spans
+        recorded by the handler are added to the caller's collection.
+
+        Args:
+            kind (str): Generation type
+            data (dict): Decoded request body
+            deadline (float): time.monotonic() by which the client needs the
+                result, or None
+
+        Returns:
+            tuple: (body, status_code)
+
+        Raises:
+            OverloadedError: If the request would not finish within the latency budget
+            DeadlineExceeded: If the deadline passed before the work was done
+        """
+        name = cost_class(kind, data)
+        execution = self.execution(kind, name, data)
+        scope = CancelScope(deadline)
+        if execution == 'inline':
+            if scope.expired():
+                GENERATION_CANCELLATIONS.labels(kind, 'admission').inc()
+                raise DeadlineExceeded("Request deadline exceeded")
+            return run_handler(kind, data)
+
+        lane = self._lane(name)
+        cost = self.estimated_cost(kind, name)
+        self._admit(kind, name, lane, cost, scope)
+        progress = {'stage': 'queued'}
+        try:
+            result, elapsed = await asyncio.wait_for(
+                self._queue_and_run(kind, data, name, execution, lane, cost, scope, progress),
+                scope.remaining()
+            )
+        except asyncio.TimeoutError:
+            # Kills gpg subprocesses still running for the request in a thread
+            scope.cancel()
+            GENERATION_CANCELLATIONS.labels(kind, progress['stage']).inc()
+            raise DeadlineExceeded("Request deadline exceeded")
+        body, status, collected, cpu_seconds = result
+        # gpg spends its CPU time in subprocesses, so its cost is measured in wall time
+        gpg = kind == 'pgp' and execution == 'thread'
+        self.record_cost(kind, name, elapsed if gpg else cpu_seconds)
+        add_collected(collected)
+        return body, status
+
+    async def _queue_and_run(self, kind, data, name, execution, lane, cost, scope, progress):
+        """
+        Wait for a slot in the lane and run the handler; cancelling this
+        coroutine takes the request off the queue or kills its process.
+
+        Returns:
+            tuple: (result of ``_run_collecting``, seconds it ran)
+        """
+        lane.queued += 1
+        lane.queued_cost += cost
+        try:
+            await lane.semaphore.acquire()
+        finally:
+            lane.queued -= 1
+            lane.queued_cost -= cost
+        progress['stage'] = 'running'
+        token = object()
+        start = time.monotonic()
+        lane.started[token] = (start, cost)
+        lane.running += 1
+
+        def release():
+            lane.running -= 1
+            del lane.started[token]
+            lane.semaphore.release()
+
+        processes, threads = self._executors()
+        if execution == 'process':
+            # Generation processes have no key pool: draw the request's keys here
+            demand = _pooled_key_demand(kind, data)
+            # Cancelling kills the process, so the slot is free once this returns
+            try:
+                rsa_keys = take_rsa_private_keys(*demand) if demand else None
+                result = await processes.run(kind, data, rsa_keys)
+            finally:
+                release()
+            return result, time.monotonic() - start
+
+        # A thread cannot be killed: a cancelled request keeps its slot until the
+        # thread finishes, so the lane never runs more than its budget
+        loop = asyncio.get_running_loop()
+        try:
+            future = threads.submit(_run_collecting, kind, data, scope)
+        except BaseException:
+            release()
+            raise
+        future.add_done_callback(lambda f: _call_soon(loop, release))
+        result = await asyncio.wrap_future(future)
+        return result, time.monotonic() - start
+
+    def stats(self):
+        """
+        Return the state of each lane.
+
+        Returns:
+            dict: lane -> {'budget', 'running', 'queued'}
+        """
+        lanes = self._lanes
+        return {
+            name: {
+                'budget': budget,
+                'running': lanes[name].running if name in lanes else 0,
+                'queued': lanes[name].queued if name in lanes else 0
+            }
+            for name, budget in self.budgets.items()
+        }
+
+    def readiness(self):
+        """
+        Report queue depth and whether a standard request would be admitted,
+        for the /ready endpoint.
+
+        Returns:
+            tuple: (body, status_code); 503 while overloaded
+        """
+        lanes = self.stats()
+        for name, lane in lanes.items():
+            costs = [cost for (_, lane_name), cost in self._costs.items() if lane_name == name]
+            lane['estimatedLatencySeconds'] = round(
+                self.estimated_latency(name, max(costs, default=DEFAULT_COSTS[name])), 3
+            )
+        overloaded = bool(self.latency_budget) and lanes['standard']['estimatedLatencySeconds'] > self.latency_budget
+        return {
+            'status': 'overloaded' if overloaded else 'ready',
+            'latencyBudgetSeconds': self.latency_budget,
+            'cpus': self.capacity,
+            'lanes': lanes
+        }, 503 if overloaded else 200
+
+    def shutdown(self):
+        with self._lock:
+            if self._processes is not None and self._pid == os.getpid():
+                self._processes.shutdown()
+                self._threads.shutdown(wait=False, cancel_futures=True)
+            self._processes = self._threads = None
+
+
+class InFlightLimit:
+    """Admission control for generations that run on request threads
+
+    Each process admits at most ``limit`` generations at once; passphrases
+    are not counted. A request over the limit fails at once with
+    ``OverloadedError``, carrying the seconds until the generation closest
+    to done is expected to finish, from the default cost of its lane.
+
+    Args:
+        limit (int): Generations admitted at once; 0 admits everything
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        # token -> (start time, estimated CPU seconds) of each running generation
+        self._running = {}
+
+    @contextmanager
+    def admit(self, kind, data):
+        """
+        Hold a slot while the generation runs.
+
+        Raises:
+            OverloadedError: If ``limit`` generations are running already
+        """
+        if kind == 'passphrase' or not self.limit:
+            yield
+            return
+        name = cost_class(kind, data)
+        token = object()
+        with self._lock:
+            if len(self._running) >= self.limit:
+                ADMISSION_REJECTIONS.labels(name).inc()
+                retry_after = self._retry_after()
+                raise OverloadedError(
+                    f"Server is overloaded, please retry in {retry_after} seconds", retry_after
+                )
+            self._running[token] = (time.monotonic(), DEFAULT_COSTS[name])
+        try:
+            yield
+        finally:
+            with self._lock:
+                del self._running[token]
+
+    def _retry_after(self):
+        """Seconds until a running generation should finish. Holds the lock."""
+        now = time.monotonic()
+        remaining = min(cost - (now - start) for start, cost in self._running.values())
+        return max(1, math.ceil(remaining))
+
+    def readiness(self):
+        """
+        Report the generations in flight, for the /ready endpoint.
+
+        Returns:
+            tuple: (body, status_code); 503 while at the limit
+        """
+        with self._lock:
+            in_flight = len(self._running)
+        overloaded = bool(self.limit) and in_flight >= self.limit
+        return {
+            'status': 'overloaded' if overloaded else 'ready',
+            'inFlight': in_flight,
+            'maxInFlight': self.limit
+        }, 503 if overloaded else 200
+
+
+_executors = None
+_executors_lock = threading.Lock()
+_in_flight_limit = None
+
+
+def get_generation_executors():
+    """
+    Return the process-wide generation executors.
+
+    Lane budgets come from ASGI_CHEAP_WORKERS (default 4 threads),
+    ASGI_STANDARD_WORKERS (default: number of CPUs) and ASGI_HEAVY_WORKERS
+    (default: half the CPUs, at least 1). ADMISSION_LATENCY_BUDGET_MS
+    (default 30000, 0 to disable) sets the latency budget.
+    """
+    global _executors
+    with _executors_lock:
+        if _executors is None:
+            budgets = {name: env_int(f'ASGI_{name.upper()}_WORKERS', 0) for name in COST_CLASSES}
+            _executors = GenerationExecutors(
+                {name: budget for name, budget in budgets.items() if budget > 0},
+                latency_budget=env_int('ADMISSION_LATENCY_BUDGET_MS', 30000) / 1000
+            )
+        return _executors
+
+
+def get_in_flight_limit():
+    """
+    Return the process-wide in-flight limit for generations run by the Flask app.
+
+    ADMISSION_MAX_IN_FLIGHT sets the limit per worker process (default: the
+    number of CPUs, 0 to disable).
+    """
+    global _in_flight_limit
+    with _executors_lock:
+        if _in_flight_limit is None:
+            _in_flight_limit = InFlightLimit(env_int('ADMISSION_MAX_IN_FLIGHT', math.ceil(cpu_capacity())))
+        return _in_flight_limit
@@ -0,0 +1,343 @@
+"""Request handlers shared by the HTTP routes.
+
+Each handler takes the decoded JSON body of a ``/generate/<type>`` request,
+runs the generator, persists the key pair and returns ``(body, status_code)``.
+They do not depend on Flask, so the single-key routes, the batch endpoint and
+background workers all produce identical results.
+"""
+import traceback
+from .passphrase import generate_passphrase
+from .ssh import generate_ssh_key
+from .rsa import generate_rsa_key
+from .pgp import generate_pgp_key
+from storage import get_keystore
+from storage.writebehind import get_write_behind_queue
+from utils.deadline import CancelScope, use_scope, cancel_at_deadline
+from utils.metrics import observe_generation, GENERATION_CANCELLATIONS
+from utils.timing import span
+
+
+def _persist(private_key, public_key, key_type, comment='', metadata=None):
+    """
+    Persist a key pair exactly once through the configured key store.
+
+    ``metadata`` carries index fields the generator already knows (see
+    ``storage.metadata.key_metadata``); the rest is derived at write time.
+
+    Returns:
+        dict: storageHandle, storageStatus and any backend location fields
+        (directory, privatePath and publicPath for the filesystem store)
+    """
+    with span('storage.persist', key_type=key_type):
+        store = get_keystore()
+        write_behind = get_write_behind_queue(store)
+        if write_behind is not None:
+            return write_behind.enqueue(private_key, public_key, key_type, comment, metadata)
+
+        stored = store.put(private_key, public_key, key_type, comment, metadata=metadata)
+        stored['storageStatus'] = 'stored'
+        return stored
+
+
+def handle_passphrase(data):
+    try:
+        with observe_generation('passphrase') as metric, span('passphrase.keygen'):
+            result = generate_passphrase(
+                length=int(data.get('length', 16)),
+                include_numbers=data.get('includeNumbers', True),
+                include_special=data.get('includeSpecial', True),
+                exclude_chars=data.get('excludeChars', ''),
+                count=int(data['count']) if data.get('count') is not None else None
+            )
+            metric['failed'] = not result.get('success')
+
+        # Ensure a consistent JSON response
+        if result.get('success'):
+            response_data = {
+                'passphrase': result.get('passphrase'),
+                'length': result.get('length'),
+                'includeNumbers': result.get('includeNumbers'),
+                'includeSpecial': result.get('includeSpecial')
+            }
+            if 'passphrases' in result:
+                response_data['passphrases'] = result['passphrases']
+                response_data['count'] = result['count']
+            return {
+                'success': True,
+                'data': response_data
+            }, 200
+        else:
+            return {
+                'success': False,
+                'error_message': result.get('error_message', 'Failed to generate passphrase')
+            }, 400
+
+    except Exception as e:
+        print("Passphrase Generation Error:", str(e))
+        print(traceback.format_exc())
+        return {
+            'success': False,
+            'error_message': f'Failed to generate passphrase: {str(e)}'
+        }, 400
+
+
+def handle_ssh(data):
+    try:
+        comment = data.get('comment', '').strip()
+
+        # Get key_size if provided, otherwise let generator use default
+        key_size = data.get('keySize')
+        if key_size is not None:
+            key_size = int(key_size)
+
+        # Generate the SSH key pair
+        with observe_generation('ssh') as metric:
+            result = generate_ssh_key(
+                key_type=data.get('keyType', 'rsa'),
+                key_size=key_size,
+                comment=comment,
+                passphrase=data.get('passphrase') if 'passphrase' in data else None
+            )
+            if isinstance(result, dict) and result.get('success'):
+                metric['algorithm'] = result['data']['keyType']
+                metric['size'] = result['data']['keySize']
+            else:
+                metric['failed'] = True
+
+        if not isinstance(result, dict):
+            return {
+                'success': False,
+                'error_message': str(result)
+            }, 400
+
+        if result.get('success'):
+            try:
+                # Create directory and save keys
+                stored = _persist(
+                    result['data']['privateKey'],
+                    result['data']['publicKey'],
+                    'ssh',
+                    comment
+                )
+
+                return {
+                    'success': True,
+                    'data': {
+                        'privateKey': result['data']['privateKey'],
+                        'publicKey': result['data']['publicKey'],
+                        'keyType': result['data']['keyType'],
+                        'keySize': result['data']['keySize'],
+                        **stored
+                    }
+                }, 200
+            except Exception as e:
+                # If saving fails, still return the keys but with a warning
+                return {
+                    'success': True,
+                    'warning': f'Keys generated but could not be saved: {str(e)}',
+                    'data': {
+                        'privateKey': result['data']['privateKey'],
+                        'publicKey': result['data']['publicKey'],
+                        'keyType': result['data']['keyType'],
+                        'keySize': result['data']['keySize']
+                    }
+                }, 200
+        else:
+            return {
+                'success': False,
+                'error_message': result.get('error_message', 'Failed to generate SSH key')
+            }, 400
+
+    except ValueError as ve:
+        return {
+            'success': False,
+            'error_message': str(ve)
+        }, 400
+    except Exception as e:
+        print("SSH Key Generation Error:", str(e))
+        print(traceback.format_exc())
+        return {
+            'success': False,
+            'error_message': f'Failed to generate SSH key: {str(e)}'
+        }, 500
+
+
+def handle_rsa(data):
+    try:
+        comment = data.get('comment', '').strip()
+
+        # Generate the RSA key pair
+        with observe_generation('rsa') as metric:
+            key_size = int(data.get('keySize', 2048))
+            result = generate_rsa_key(
+                key_size=key_size,
+                passphrase=data.get('passphrase', '')
+            )
+            metric['algorithm'] = 'rsa'
+            metric['size'] = key_size
+            metric['failed'] = not result.get('success')
+
+        if result.get('success'):
+            try:
+                # Create directory and save keys
+                stored = _persist(
+                    result['data']['privateKey'],
+                    result['data']['publicKey'],
+                    'rsa',
+                    comment
+                )
+
+                return {
+                    'success': True,
+                    'data': {
+                        'privateKey': result['data']['privateKey'],
+                        'publicKey': result['data']['publicKey'],
+                        'keySize': data.get('keySize', 2048),
+                        **stored
+                    }
+                }, 200
+            except Exception as e:
+                # If saving fails, still return the keys but with a warning
+                return {
+                    'success': True,
+                    'warning': f'Keys generated but could not be saved: {str(e)}',
+                    'data': {
+                        'privateKey': result['data']['privateKey'],
+                        'publicKey': result['data']['publicKey'],
+                        'keySize': data.get('keySize', 2048)
+                    }
+                }, 200
+        else:
+            return {
+                'success': False,
+                'error_message': result.get('error_message', 'Failed to generate RSA key')
+            }, 400
+
+    except ValueError as ve:
+        return {
+            'success': False,
+            'error_message': str(ve)
+        }, 400
+    except Exception as e:
+        print("RSA Key Generation Error:", str(e))
+        print(traceback.format_exc())
+        return {
+            'success': False,
+            'error_message': 'Internal server error'
+        }, 500
+
+
+def handle_pgp(data):
+    try:
+        # Required parameters
+        name = data.get('name')
+        email = data.get('email')
+
+        if not name or not email:
+            return {
+                'success': False,
+                'error_message': 'Name and email are required'
+            }, 400
+
+        # Optional parameters with case conversion for key_type
+        comment = data.get('comment')
+        key_type = data.get('keyType', 'RSA').upper()  # Convert to uppercase for consistency
+        key_length = data.get('keyLength')  # Optional for RSA
+        curve = data.get('curve')  # Optional for ECC
+        passphrase = data.get('passphrase')
+        expire_time = data.get('expireTime', '2y')
+
+        with observe_generation('pgp') as metric:
+            result = generate_pgp_key(
+                name=name,
+                email=email,
+                comment=comment,
+                key_type=key_type,
+                key_length=key_length,
+                curve=curve,
+                passphrase=passphrase,
+                expire_time=expire_time
+            )
+            if result.get('success'):
+                metric['algorithm'] = result['data']['keyType']
+                metric['size'] = result['data']['keyLength'] or result['data']['curve']
+            else:
+                metric['failed'] = True
+
+        if result.get('success'):
+            # Save keys but don't include directory info in response
+            stored = _persist(
+                result['data']['privateKey'],
+                result['data']['publicKey'],
+                'pgp',
+                comment or email.replace('@', '_at_'),
+                metadata={
+                    'fingerprint': result['data']['keyId'],
+                    'email': email,
+                    # '0' means the key never expires
+                    'expiresAt': (
+                        None if result['data']['expireDate'] == '0'
+                        else result['data']['expireDate']
+                    )
+                }
+            )
+            result['data']['storageHandle'] = stored['storageHandle']
+            result['data']['storageStatus'] = stored['storageStatus']
+
+            # Return result without directory information
+            return result, 200
+        else:
+            return result, 400
+
+    except Exception as e:
+        print("PGP Key Generation Error:", str(e))
+        traceback.print_exc()
+        return {
+            'success': False,
+            'error_message': f'Failed to generate PGP key: {str(e)}'
+        }, 500
+
+
+# Generation type -> handler, as used by /generate/<type>
+HANDLERS = {
+    'passphrase': handle_passphrase,
+    'ssh': handle_ssh,
+    'rsa': handle_rsa,
+    'pgp': handle_pgp
+}
+
+
+def _deadline_exceeded():
+    return {
+        'success': False,
+        'error_message': 'Request deadline exceeded'
+    }, 504
+
+
+def run_handler(kind, data, deadline=None):
+    """
+    Run the handler for a generation type and return (body, status_code).
+
+    With a deadline (a time.monotonic() value), nothing is generated once it
+    has passed, and gpg subprocesses still running at the deadline are
+    killed. In-process generation cannot be interrupted and runs to the end.
+    """
+    handler = HANDLERS.get(kind)
+    if handler is None:
+        return {
+            'success': False,
+            'error_message': f"Invalid generation type. Must be one of: {', '.join(HANDLERS)}"
+        }, 400
+    if deadline is None:
+        return handler(data)
+
+    scope = CancelScope(deadline)
+    if scope.expired():
+        GENERATION_CANCELLATIONS.labels(kind, 'admission').inc()
+        return _deadline_exceeded()
+    with use_scope(scope), cancel_at_deadline(scope):
+        body, status = handler(data)
+    if scope.cancelled and not body.get('success'):
+        GENERATION_CANCELLATIONS.labels(kind, 'running').inc()
+        return _deadline_exceeded()
+    return body, status
@@ -0,0 +1,490 @@
+"""Idempotency keys for /generate/* requests.
+
+A client that retries a generation sends the same ``Idempotency-Key``
+header with every attempt. The first request with a key generates the key
+pair. Duplicates that arrive while it runs wait for it and get its
+response, and later duplicates get the response replayed from a cache, so
+a retry storm generates and stores a single key pair. Replayed responses
+carry ``Idempotent-Replayed: true``. Reusing a key for a different request
+fails with 422.
+
+Entries are JSON files under KEY_STORAGE_PATH/.idempotency, shared by every
+worker process like job records: ``<id>.pending`` while a request holds the
+key and ``<id>.json`` once its response is cached. File names are an HMAC of
+the key under a secret kept outside that directory (IDEMPOTENCY_SECRET_PATH),
+and responses are encrypted with AES-GCM under a key derived from the
+idempotency key and that secret, so the cached private keys cannot be read
+without the idempotency key. Request fingerprints, which detect a key reused
+for a different request, are HMACs under the secret too, so the hashes of
+short passphrases in a cached entry cannot be brute-forced offline. The
+secret should live on a different volume from the entries: anyone who can
+read both can match fingerprints to guessed requests. Only successful responses are cached: a failed,
+rejected or cancelled request can be retried with the same key. Entries
+expire after ``ttl`` seconds and at most ``max_entries`` responses are kept,
+the oldest being evicted first; pending claims are never evicted.
+"""
+import os
+import json
+import time
+import hmac
+import base64
+import socket
+import asyncio
+import hashlib
+import logging
+import functools
+import threading
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from utils.config import env_int
+from utils.deadline import DEADLINE_FIELD
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# Longest a duplicate waits for the original request, unless its own deadline is shorter
+MAX_WAIT_SECONDS = 60
+# Interval for polling entries owned by another worker process
+POLL_INTERVAL = 0.1
+# Minimum interval between sweeps for expired entries
+CLEANUP_INTERVAL = 60
+# A pending entry older than this is abandoned and may be taken over
+PENDING_TIMEOUT = 600
+
+ENTRY_PENDING = 'pending'
+ENTRY_COMPLETE = 'complete'
+
+
+class IdempotencyError(Exception):
+    """Raised when a request's idempotency key cannot be honoured"""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def validate_idempotency_key(key):
+    """
+    Raises:
+        IdempotencyError: 400 if the key is empty, too long or not printable ASCII
+    """
+    if not key or len(key) > MAX_KEY_LENGTH or not all(' ' <= char <= '~' for char in key):
+        raise IdempotencyError(
+            f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} printable ASCII characters", 400
+        )
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class IdempotencyCache:
+    """Pending and completed generation responses, keyed by idempotency key.
+
+    ``claim`` makes the caller the owner of a key, returns the cached
+    response, or reports that another request holds the key.
+    """
+
+    def __init__(self, directory, secret_path=None, ttl=3600, max_entries=1000):
+        self.directory = directory
+        # Kept apart from the ciphertexts; defaults to a file next to the directory
+        self.secret_path = secret_path or f'{directory.rstrip(os.sep)}.secret'
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._secret = None
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        # entry id -> (fingerprint, future) of requests running on this process's event loop
+        self._inflight = {}
+
+    def _get_secret(self):
+        with self._lock:
+            if self._secret is None:
+                path = self.secret_path
+                os.makedirs(os.path.dirname(path) or '.', mode=0o700, exist_ok=True)
+                try:
+                    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                except FileExistsError:
+                    pass
+                else:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(os.urandom(32))
+                # Another worker may still be writing it
+                for _ in range(50):
+                    with open(path, 'rb') as f:
+                        secret = f.read()
+                    if len(secret) == 32:
+                        break
+                    time.sleep(0.01)
+                else:
+                    raise RuntimeError(f"Invalid idempotency secret in {path}")
+                if self._same_volume(path):
+                    logger.warning(
+                        f"Idempotency secret {path} is on the same volume as {self.directory}; "
+                        "set IDEMPOTENCY_SECRET_PATH to a separately mounted secret"
+                    )
+                self._secret = secret
+            return self._secret
+
+    def _same_volume(self, path):
+        parent = os.path.dirname(os.path.abspath(self.directory))
+        try:
+            return os.stat(path).st_dev == os.stat(parent).st_dev
+        except OSError:
+            return False
+
+    def entry_id(self, key):
+        return hmac.new(self._get_secret(), key.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def fingerprint(self, kind, data):
+        """HMAC of a generation request, to detect a key reused for a different request"""
+        if isinstance(data, dict):
+            # The deadline may differ between retries of the same request
+            data = {name: value for name, value in data.items() if name != DEADLINE_FIELD}
+        encoded = json.dumps([kind, data], sort_keys=True, separators=(',', ':'), default=str)
+        return hmac.new(self._get_secret(), encoded.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def _path(self, entry_id):
+        """Path of a cached response"""
+        return os.path.join(self.directory, f'{entry_id}.json')
+
+    def _pending_path(self, entry_id):
+        """Path of the claim held by a running request"""
+        return os.path.join(self.directory, f'{entry_id}.pending')
+
+    def _cipher(self, key):
+        derived = HKDF(
+            algorithm=hashes.SHA256(), length=32, salt=self._get_secret(), info=b'keygen idempotency'
+        ).derive(key.encode('utf-8'))
+        return AESGCM(derived)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write(self, path, entry):
+        """Atomically replace an entry"""
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _is_stale(self, entry, now):
+        """Check whether an entry no longer counts: expired, or pending for a dead owner"""
+        if entry['state'] == ENTRY_COMPLETE:
+            return now - entry['completedAt'] > self.ttl
+        if now - entry['createdAt'] > PENDING_TIMEOUT:
+            return True
+        return entry.get('host') == socket.gethostname() and not _pid_alive(entry['pid'])
+
+    def _cached(self, key, entry_id, fingerprint):
+        """
+        Return the cached (body, status_code) for a key, or None.
+
+        Raises:
+            IdempotencyError: 422 if the key was used for a different request
+        """
+        path = self._path(entry_id)
+        entry = self._read(path)
+        if entry is None:
+            return None
+        if self._is_stale(entry, time.time()):
+            self._remove(path)
+            return None
+        if entry['fingerprint'] != fingerprint:
+            raise IdempotencyError(f"{IDEMPOTENCY_HEADER} was already used for a different request", 422)
+        try:
+            body = self._cipher(key).decrypt(
+                base64.b64decode(entry['nonce']), base64.b64decode(entry['body']), entry_id.encode('ascii')
+            )
+        except Exception as e:
+            logger.error(f"Unreadable idempotency entry {entry_id}: {str(e)}")
+            self._remove(path)
+            return None
+        return json.loads(body), entry['status']
+
+    def claim(self, key, fingerprint):
+        """
+        Claim an idempotency key for a request.
+
+        Returns:
+            tuple: ('owner', None) if the caller must run the request and then
+            call ``complete`` or ``release``; ('replay', (body, status_code))
+            for a completed request; ('pending', None) while another request
+            holds the key
+
+        Raises:
+            IdempotencyError: 422 if the key was used for a different request
+        """
+        self.cleanup()
+        entry_id = self.entry_id(key)
+        pending_path = self._pending_path(entry_id)
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        while True:
+            response = self._cached(key, entry_id, fingerprint)
+            if response is not None:
+                return 'replay', response
+            try:
+                fd = os.open(pending_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                pass
+            else:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({
+                        'state': ENTRY_PENDING,
+                        'fingerprint': fingerprint,
+                        'host': socket.gethostname(),
+                        'pid': os.getpid(),
+                        'createdAt': time.time()
+                    }, f)
+                # The previous owner may have completed after the check above
+                response = self._cached(key, entry_id, fingerprint)
+                if response is not None:
+                    self._remove(pending_path)
+                    return 'replay', response
+                return 'owner', None
+
+            entry = self._read(pending_path)
+            if entry is None:
+                # Completed, released or still being written by its owner
+                time.sleep(0.001)
+                continue
+            if self._is_stale(entry, time.time()):
+                self._remove(pending_path)
+                continue
+            if entry['fingerprint'] != fingerprint:
+                raise IdempotencyError(
+                    f"{IDEMPOTENCY_HEADER} was already used for a different request", 422
+                )
+            return 'pending', None
+
+    def complete(self, key, fingerprint, body, status):
+        """Cache the response of an owned key, or release the key if the request failed"""
+        if status != 200 or not body.get('success'):
+            self.release(key)
+            return
+        entry_id = self.entry_id(key)
+        nonce = os.urandom(12)
+        ciphertext = self._cipher(key).encrypt(
+            nonce, json.dumps(body).encode('utf-8'), entry_id.encode('ascii')
+        )
+        now = time.time()
+        self._write(self._path(entry_id), {
+            'state': ENTRY_COMPLETE,
+            'fingerprint': fingerprint,
+            'status': status,
+            'createdAt': now,
+            'completedAt': now,
+            'nonce': base64.b64encode(nonce).decode('ascii'),
+            'body': base64.b64encode(ciphertext).decode('ascii')
+        })
+        self._remove(self._pending_path(entry_id))
+        self._evict()
+
+    def release(self, key):
+        """Give up an owned key so the next request with it runs again"""
+        self._remove(self._pending_path(self.entry_id(key)))
+
+    def _entries(self, suffixes=('.json', '.pending')):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if name.endswith(suffixes)]
+
+    def _evict(self):
+        """Remove the oldest cached responses beyond ``max_entries``; claims are kept"""
+        paths = self._entries(('.json',))
+        if len(paths) <= self.max_entries:
+            return
+        aged = []
+        for path in paths:
+            try:
+                aged.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                pass
+        aged.sort()
+        for _, path in aged[:len(aged) - self.max_entries]:
+            self._remove(path)
+
+    def cleanup(self, force=False):
+        """Remove expired entries and abandoned pending ones"""
+        now = time.time()
+        if not force and now - self._last_cleanup < CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        for path in self._entries():
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+                if self._is_stale(entry, now):
+                    os.remove(path)
+            except (FileNotFoundError, json.JSONDecodeError, KeyError):
+                pass
+
+
+def _wait_seconds(deadline):
+    if deadline is None:
+        return MAX_WAIT_SECONDS
+    return min(MAX_WAIT_SECONDS, max(0.0, deadline - time.monotonic()))
+
+
+def _still_running():
+    return IdempotencyError(f"A request with this {IDEMPOTENCY_HEADER} is still in progress", 409)
+
+
+def run_idempotent(cache, key, kind, data, run, deadline=None):
+    """
+    Run a generation at most once per idempotency key.
+
+    Args:
+        cache (IdempotencyCache): Response cache
+        key (str): The request's Idempotency-Key
+        kind (str): Generation type
+        data (dict): Decoded request body
+        run: Function returning (body, status_code)
+        deadline (float): time.monotonic() after which a duplicate stops
+            waiting for the original request, or None
+
+    Returns:
+        tuple: (body, status_code, replayed)
+
+    Raises:
+        IdempotencyError: If the key is invalid, reused for a different
+            request, or still held by another request when waiting ends
+    """
+    validate_idempotency_key(key)
+    fingerprint = cache.fingerprint(kind, data)
+    give_up = time.monotonic() + _wait_seconds(deadline)
+    while True:
+        state, response = cache.claim(key, fingerprint)
+        if state == 'replay':
+            return response[0], response[1], True
+        if state == 'owner':
+            break
+        if time.monotonic() >= give_up:
+            raise _still_running()
+        time.sleep(POLL_INTERVAL)
+
+    try:
+        body, status = run()
+    except BaseException:
+        cache.release(key)
+        raise
+    cache.complete(key, fingerprint, body, status)
+    return body, status, False
+
+
+async def _in_thread(func, *args):
+    """Run blocking cache I/O off the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+
+async def arun_idempotent(cache, key, kind, data, run, deadline=None):
+    """
+    Async variant of ``run_idempotent`` for the ASGI server.
+
+    ``run`` is a coroutine function. Duplicates handled by the same event
+    loop attach to the running request and get its response or exception;
+    duplicates in other processes are found through the cache files, which
+    are read and written in threads so the event loop never blocks on them.
+    """
+    validate_idempotency_key(key)
+    fingerprint = await _in_thread(cache.fingerprint, kind, data)
+    entry_id = await _in_thread(cache.entry_id, key)
+    while entry_id in cache._inflight:
+        running_fingerprint, running = cache._inflight[entry_id]
+        if running_fingerprint != fingerprint:
+            raise IdempotencyError(f"{IDEMPOTENCY_HEADER} was already used for a different request", 422)
+        done, _ = await asyncio.wait({running}, timeout=_wait_seconds(deadline))
+        if not done:
+            raise _still_running()
+        if not running.cancelled():
+            body, status = running.result()
+            return body, status, True
+        # The original request was abandoned: run it here unless another duplicate already does
+
+    future = asyncio.get_running_loop().create_future()
+    # Retrieve the exception if no duplicate does, so it is not logged as unhandled
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    cache._inflight[entry_id] = (fingerprint, future)
+    try:
+        give_up = time.monotonic() + _wait_seconds(deadline)
+        while True:
+            state, response = await _in_thread(cache.claim, key, fingerprint)
+            if state == 'replay':
+                future.set_result(response)
+                return response[0], response[1], True
+            if state == 'owner':
+                break
+            if time.monotonic() >= give_up:
+                raise _still_running()
+            await asyncio.sleep(POLL_INTERVAL)
+
+        try:
+            body, status = await run()
+        except BaseException:
+            # Shielded: the claim is released even if the request is cancelled again
+            await asyncio.shield(_in_thread(cache.release, key))
+            raise
+        await _in_thread(cache.complete, key, fingerprint, body, status)
+        future.set_result((body, status))
+        return body, status, False
+    except Exception as e:
+        if not future.done():
+            future.set_exception(e)
+        raise
+    finally:
+        # Cancelled or abandoned: duplicates claim the key themselves
+        if not future.done():
+            future.cancel()
+        cache._inflight.pop(entry_id, None)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_idempotency_cache():
+    """
+    Return the process-wide idempotency cache.
+
+    Configured through IDEMPOTENCY_TTL (seconds, default 3600),
+    IDEMPOTENCY_MAX_ENTRIES (default 1000) and IDEMPOTENCY_SECRET_PATH
+    (default KEY_STORAGE_PATH/.idempotency.secret); entries are stored under
+    KEY_STORAGE_PATH/.idempotency.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            base_path = os.getenv('KEY_STORAGE_PATH', 'keys')
+            _cache = IdempotencyCache(
+                os.path.join(base_path, '.idempotency'),
+                secret_path=os.getenv('IDEMPOTENCY_SECRET_PATH') or None,
+                ttl=env_int('IDEMPOTENCY_TTL', 3600),
+                max_entries=env_int('IDEMPOTENCY_MAX_ENTRIES', 1000)
+            )
+        return _cache
@@ -0,0 +1,307 @@
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from utils.config import env_int
+from .handlers import HANDLERS, run_handler
+
+logger = logging.getLogger(__name__)
+
+# Job states as reported by /jobs/<id>
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+# Job IDs are uuid4 hex strings; anything else never reaches the filesystem
+JOB_ID_REGEX = re.compile(r'^[0-9a-f]{32}$')
+
+# Longest a single long-poll request may block
+MAX_WAIT_SECONDS = 30
+# Interval for polling jobs owned by another worker process
+POLL_INTERVAL = 0.1
+# Minimum interval between sweeps for expired job records
+CLEANUP_INTERVAL = 60
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job"""
+
+
+class JobPoolUnavailableError(Exception):
+    """Raised when no job worker process can be started"""
+
+
+class JobStore:
+    """Job records kept as JSON files so every worker process can serve them.
+
+    Records hold generated private keys, so files are written 0600 inside a
+    0700 directory and removed once they are older than ``ttl`` seconds.
+    """
+
+    def __init__(self, job_dir, ttl=3600):
+        self.job_dir = job_dir
+        self.ttl = ttl
+        self._last_cleanup = 0.0
+
+    def _path(self, job_id):
+        return os.path.join(self.job_dir, f'{job_id}.json')
+
+    def write(self, record):
+        """Atomically replace the record for ``record['jobId']``"""
+        os.makedirs(self.job_dir, mode=0o700, exist_ok=True)
+        path = self._path(record['jobId'])
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def read(self, job_id):
+        """Return the record for a job, or None if it does not exist"""
+        if not JOB_ID_REGEX.match(job_id or ''):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def update(self, job_id, **fields):
+        record = self.read(job_id)
+        if record is None:
+            return None
+        record.update(fields)
+        self.write(record)
+        return record
+
+    def cleanup(self, force=False):
+        """Remove finished job records older than the TTL"""
+        now = time.time()
+        if not force and now - self._last_cleanup < CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        try:
+            names = os.listdir(self.job_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.job_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _init_job_worker():
+    """Initializer for job processes"""
+    # Workers generate inline; the RSA key pool belongs to the web process
+    os.environ['RSA_KEY_POOL_ENABLED'] = '0'
+
+
+def _run_job(job_dir, ttl, job_id, kind, data):
+    """Run one generation inside a worker process and record its result"""
+    store = JobStore(job_dir, ttl)
+    store.update(job_id, status=JOB_RUNNING, startedAt=time.time())
+    body, status = run_handler(kind, data)
+    store.update(
+        job_id,
+        status=JOB_SUCCEEDED if body.get('success') else JOB_FAILED,
+        finishedAt=time.time(),
+        resultStatus=status,
+        result=body
+    )
+    return status
+
+
+class JobManager:
+    """Runs generation handlers in a bounded process pool.
+
+    ``workers`` caps the number of processes and ``max_pending`` caps how many
+    jobs this web worker may have queued or running at once.
+    """
+
+    def __init__(self, job_dir, workers=None, max_pending=100, ttl=3600):
+        self.store = JobStore(job_dir, ttl)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._executor = None
+        self._pid = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # A forked child must not reuse the parent's executor
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_job_worker
+            )
+            if self._pid != os.getpid():
+                self._futures = {}
+            self._pid = os.getpid()
+        return self._executor
+
+    def pending(self):
+        """Return the number of jobs queued or running in this process"""
+        with self._lock:
+            return sum(1 for future in self._futures.values() if not future.done())
+
+    def submit(self, kind, data):
+        """
+        Queue a generation job.
+
+        Returns:
+            dict: The new job record
+
+        Raises:
+            ValueError: If the generation type is unknown
+            QueueFullError: If too many jobs are already pending
+            JobPoolUnavailableError: If the worker pool is broken and cannot
+                be restarted
+        """
+        if kind not in HANDLERS:
+            raise ValueError(f"Invalid generation type. Must be one of: {', '.join(HANDLERS)}")
+
+        self.store.cleanup()
+        with self._lock:
+            executor = self._get_executor()
+            pending = sum(1 for future in self._futures.values() if not future.done())
+            if pending >= self.max_pending:
+                raise QueueFullError("Job queue is full, retry later")
+
+            job_id = uuid.uuid4().hex
+            record = {
+                'jobId': job_id,
+                'type': kind,
+                'status': JOB_QUEUED,
+                'createdAt': time.time()
+            }
+            self.store.write(record)
+            try:
+                future = self._submit(executor, job_id, kind, data)
+            except BrokenProcessPool as e:
+                logger.error(f"Job {job_id} could not be queued: {str(e)}")
+                self.store.update(
+                    job_id,
+                    status=JOB_FAILED,
+                    finishedAt=time.time(),
+                    resultStatus=503,
+                    result={'success': False, 'error_message': 'Job workers are unavailable'}
+                )
+                raise JobPoolUnavailableError("Job workers are unavailable, retry later")
+            self._futures[job_id] = future
+            executor = self._executor
+        future.add_done_callback(
+            lambda f, job_id=job_id, executor=executor: self._on_done(job_id, f, executor)
+        )
+        return record
+
+    def _submit(self, executor, job_id, kind, data):
+        """Submit a job, replacing the executor once if a worker died. Holds the lock."""
+        try:
+            return executor.submit(
+                _run_job, self.store.job_dir, self.store.ttl, job_id, kind, data
+            )
+        except BrokenProcessPool:
+            logger.warning("Job worker pool is broken, starting a new one")
+            self._discard_executor(executor)
+            return self._get_executor().submit(
+                _run_job, self.store.job_dir, self.store.ttl, job_id, kind, data
+            )
+
+    def _discard_executor(self, executor):
+        """Drop a broken executor so the next submit starts a new one. Holds the lock."""
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False)
+
+    def _on_done(self, job_id, future, executor):
+        with self._lock:
+            self._futures.pop(job_id, None)
+            if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                # A worker died; start a new pool for the next job
+                self._discard_executor(executor)
+        if future.cancelled():
+            error = 'Job was cancelled'
+        else:
+            exc = future.exception()
+            if exc is None:
+                return
+            error = f'Job failed: {str(exc)}'
+        logger.error(f"Job {job_id} did not complete: {error}")
+        self.store.update(
+            job_id,
+            status=JOB_FAILED,
+            finishedAt=time.time(),
+            resultStatus=500,
+            result={'success': False, 'error_message': error}
+        )
+
+    def get(self, job_id, wait_seconds=0):
+        """
+        Return a job record, optionally waiting for it to finish.
+
+        Args:
+            job_id (str): Job identifier
+            wait_seconds (float): Long-poll timeout, capped at MAX_WAIT_SECONDS
+
+        Returns:
+            dict or None: The job record, or None if it does not exist
+        """
+        record = self.store.read(job_id)
+        if record is None or record['status'] in FINISHED_STATES or wait_seconds <= 0:
+            return record
+
+        deadline = time.monotonic() + min(wait_seconds, MAX_WAIT_SECONDS)
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            # Owned by this process: block on the future instead of polling.
+            # Failures are recorded by a done callback that may still be running.
+            wait([future], timeout=max(0, deadline - time.monotonic()))
+            record = self.store.read(job_id)
+            if record is None or record['status'] in FINISHED_STATES:
+                return record
+
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            record = self.store.read(job_id)
+            if record is None or record['status'] in FINISHED_STATES:
+                return record
+        return record
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """
+    Return the process-wide job manager.
+
+    Configured through JOB_WORKERS, JOB_MAX_PENDING and JOB_TTL; records are
+    stored under KEY_STORAGE_PATH/.jobs.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            base_path = os.getenv('KEY_STORAGE_PATH', 'keys')
+            _manager = JobManager(
+                os.path.join(base_path, '.jobs'),
+                workers=env_int('JOB_WORKERS', 0) or None,
+                max_pending=env_int('JOB_MAX_PENDING', 100),
+                ttl=env_int('JOB_TTL', 3600)
+            )
+        return _manager
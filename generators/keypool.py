@@ -0,0 +1,318 @@
+import os
+import logging
+import threading
+import contextvars
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from utils.config import env_flag, env_int
+
+logger = logging.getLogger(__name__)
+
+# Key sizes the pool keeps ready material for
+POOL_KEY_SIZES = (2048, 4096)
+
+# Pooled keys handed to the current generation by another process, see use_rsa_private_keys
+_handed_keys = contextvars.ContextVar('rsa_handed_keys', default=None)
+
+
+def _generate_private_der(key_size):
+    """Generate an RSA private key and return it as unencrypted PKCS8 DER.
+
+    Runs inside a refill worker process, so it must stay importable at module level.
+    """
+    private_key = rsa.generate_private_key(
+        public_exponent=65537,
+        key_size=key_size
+    )
+    return private_key.private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+
+
+class RSAKeyPool:
+    """Pool of ready RSA private keys, refilled in the background.
+
+    Prime generation holds the GIL for the whole run, so refills happen in
+    separate worker processes and only the finished DER bytes are handed back.
+    Each key size is refilled up to ``high_watermark`` once its fill level
+    drops below ``low_watermark``. Callers that find the pool empty generate
+    the key inline and the miss is counted.
+    """
+
+    def __init__(self, key_sizes=POOL_KEY_SIZES, low_watermark=2, high_watermark=8, workers=1):
+        if low_watermark < 0 or high_watermark < 1:
+            raise ValueError("Pool watermarks must be positive")
+        if low_watermark > high_watermark:
+            raise ValueError("Pool low watermark must not exceed the high watermark")
+        if workers < 1:
+            raise ValueError("Pool needs at least one refill worker")
+
+        self.key_sizes = tuple(key_sizes)
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.workers = workers
+
+        self._keys = {size: deque() for size in self.key_sizes}
+        self._pending = {size: 0 for size in self.key_sizes}
+        # Sizes start out empty, so every size begins in the refilling state
+        self._refilling = {size: True for size in self.key_sizes}
+        self._hits = {size: 0 for size in self.key_sizes}
+        self._misses = {size: 0 for size in self.key_sizes}
+
+        self._cond = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._pid = None
+        self._stopped = False
+
+    def start(self):
+        """Start the refill thread for this process if it is not running yet"""
+        with self._cond:
+            # A forked child inherits the pool object but not its threads
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopped = False
+            self._executor = None
+            self._pending = {size: 0 for size in self.key_sizes}
+            self._thread = threading.Thread(
+                target=self._refill_loop,
+                name='rsa-key-pool',
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop refilling and shut down the worker processes"""
+        with self._cond:
+            self._stopped = True
+            thread = self._thread
+            self._thread = None
+            self._cond.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+
+    def acquire(self, key_size):
+        """Return an RSA private key of the given size.
+
+        Draws from the pool when a key is ready and falls back to inline
+        generation otherwise.
+        """
+        private_key = self.take(key_size)
+        if private_key is None:
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+        return private_key
+
+    def take(self, key_size):
+        """Return a ready RSA private key of the given size, or None.
+
+        Never generates inline: an empty pool counts as a miss and the caller
+        generates the key itself. Sizes outside the pool return None without
+        touching the counters.
+        """
+        if key_size not in self._keys:
+            return None
+
+        self.start()
+        with self._cond:
+            keys = self._keys[key_size]
+            private_key = keys.popleft() if keys else None
+            if private_key is not None:
+                self._hits[key_size] += 1
+            else:
+                self._misses[key_size] += 1
+            if len(keys) < self.low_watermark and not self._refilling[key_size]:
+                self._refilling[key_size] = True
+                self._cond.notify_all()
+        return private_key
+
+    def stats(self):
+        """Return fill level and hit/miss counters per key size"""
+        with self._cond:
+            sizes = {}
+            for size in self.key_sizes:
+                hits = self._hits[size]
+                misses = self._misses[size]
+                total = hits + misses
+                sizes[str(size)] = {
+                    'available': len(self._keys[size]),
+                    'pending': self._pending[size],
+                    'refilling': self._refilling[size],
+                    'hits': hits,
+                    'misses': misses,
+                    'hitRate': round(hits / total, 4) if total else None
+                }
+            return {
+                'lowWatermark': self.low_watermark,
+                'highWatermark': self.high_watermark,
+                'workers': self.workers,
+                'sizes': sizes
+            }
+
+    def _next_size(self):
+        """Pick the key size most in need of a refill, or None. Caller holds the lock."""
+        best = None
+        best_level = None
+        for size in self.key_sizes:
+            if not self._refilling[size]:
+                continue
+            level = len(self._keys[size]) + self._pending[size]
+            if level >= self.high_watermark:
+                continue
+            if best_level is None or level < best_level:
+                best, best_level = size, level
+        return best
+
+    def _refill_loop(self):
+        in_flight = {}
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    size = self._next_size() if len(in_flight) < self.workers else None
+                    if size is not None or in_flight:
+                        break
+                    self._cond.wait()
+                if self._stopped:
+                    break
+
+                while size is not None:
+                    if self._executor is None:
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.workers,
+                            mp_context=multiprocessing.get_context('spawn')
+                        )
+                    try:
+                        future = self._executor.submit(_generate_private_der, size)
+                    except BrokenProcessPool:
+                        self._executor = None
+                        break
+                    in_flight[future] = size
+                    self._pending[size] += 1
+                    size = self._next_size() if len(in_flight) < self.workers else None
+
+            if not in_flight:
+                continue
+
+            done, _ = wait(list(in_flight), timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                size = in_flight.pop(future)
+                private_key = None
+                try:
+                    private_key = serialization.load_der_private_key(
+                        future.result(),
+                        password=None,
+                        # The key was produced by our own worker process
+                        unsafe_skip_rsa_key_validation=True
+                    )
+                except Exception as e:
+                    logger.error(f"RSA key pool refill failed for {size}-bit key: {str(e)}")
+                    if isinstance(e, BrokenProcessPool):
+                        with self._cond:
+                            self._executor = None
+
+                with self._cond:
+                    self._pending[size] -= 1
+                    if private_key is not None:
+                        self._keys[size].append(private_key)
+                    if len(self._keys[size]) >= self.high_watermark:
+                        self._refilling[size] = False
+
+        executor = self._executor
+        self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_key_pool():
+    """Return the process-wide RSA key pool, or None when it is disabled.
+
+    Configured through RSA_KEY_POOL_ENABLED, RSA_KEY_POOL_LOW_WATERMARK,
+    RSA_KEY_POOL_HIGH_WATERMARK and RSA_KEY_POOL_WORKERS.
+    """
+    global _pool
+    if not env_flag('RSA_KEY_POOL_ENABLED'):
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = RSAKeyPool(
+                low_watermark=env_int('RSA_KEY_POOL_LOW_WATERMARK', 2),
+                high_watermark=env_int('RSA_KEY_POOL_HIGH_WATERMARK', 8),
+                workers=env_int('RSA_KEY_POOL_WORKERS', 1)
+            )
+        return _pool
+
+
+def take_rsa_private_keys(key_size, count):
+    """Draw up to ``count`` pooled keys for a generation that runs in another process.
+
+    Returns:
+        list: Unencrypted PKCS8 DER of the keys that were ready; empty when
+        the pool is disabled or empty
+    """
+    pool = get_key_pool()
+    if pool is None:
+        return []
+    keys = []
+    for _ in range(count):
+        private_key = pool.take(key_size)
+        if private_key is None:
+            break
+        keys.append(private_key.private_bytes(
+            encoding=serialization.Encoding.DER,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        ))
+    return keys
+
+
+@contextmanager
+def use_rsa_private_keys(keys):
+    """Hand keys from ``take_rsa_private_keys`` to ``get_rsa_private_key`` calls in this context"""
+    handed = deque(
+        serialization.load_der_private_key(der, password=None, unsafe_skip_rsa_key_validation=True)
+        for der in keys or ()
+    )
+    token = _handed_keys.set(handed)
+    try:
+        yield
+    finally:
+        _handed_keys.reset(token)
+
+
+def start_key_pool():
+    """Start refilling the pool when it is enabled, so the first requests find keys ready"""
+    pool = get_key_pool()
+    if pool is not None:
+        pool.start()
+
+
+def get_rsa_private_key(key_size):
+    """Return an RSA private key: a handed-over key, else one drawn from the pool when it is enabled"""
+    handed = _handed_keys.get()
+    if handed and handed[0].key_size == key_size:
+        return handed.popleft()
+    pool = get_key_pool()
+    if pool is None:
+        return rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    return pool.acquire(key_size)
+
+
+def get_pool_stats():
+    """Return pool statistics for monitoring"""
+    pool = get_key_pool()
+    if pool is None:
+        return {'enabled': False}
+    stats = pool.stats()
+    stats['enabled'] = True
+    return stats
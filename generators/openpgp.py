@@ -0,0 +1,607 @@
+"""In-process OpenPGP key generation (RFC 4880, RFC 6637).
+
+Builds a v4 transferable key -- primary key, user ID with its positive
+certification, encryption subkey with its binding signature -- from
+``cryptography`` keys and armors it, so a PGP key costs two key generations
+and no gpg subprocess. RSA keys get an RSA subkey; ECC keys get an ECDSA
+primary key with an ECDH subkey on the same curve, or Ed25519 with a
+Cv25519 subkey. The secret keys are protected with iterated and salted
+SHA-256 S2K at the highest count RFC 4880 allows, AES-256 in CFB mode and a
+SHA-1 checksum of the secret material. The output imports into gpg unchanged.
+
+The same packet code serves the gpg engine: ``protect_secret_key`` applies
+this protection to an unprotected gpg export and ``public_from_secret``
+derives the public key block from a secret one.
+"""
+import os
+import time
+import base64
+import struct
+import hashlib
+from abc import ABC, abstractmethod
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, ec, ed25519, x25519
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from cryptography.hazmat.primitives.serialization import Encoding, PrivateFormat, PublicFormat, NoEncryption
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from utils.timing import span
+from .keypool import get_rsa_private_key
+
+# Packet tags
+TAG_SIGNATURE = 2
+TAG_SECRET_KEY = 5
+TAG_PUBLIC_KEY = 6
+TAG_SECRET_SUBKEY = 7
+TAG_TRUST = 12
+TAG_USER_ID = 13
+TAG_PUBLIC_SUBKEY = 14
+
+# Algorithm IDs
+PUBKEY_RSA = 1
+PUBKEY_ECDH = 18
+PUBKEY_ECDSA = 19
+PUBKEY_EDDSA = 22
+HASH_SHA256 = 8
+HASH_SHA384 = 9
+HASH_SHA512 = 10
+HASH_SHA224 = 11
+CIPHER_3DES = 2
+CIPHER_AES128 = 7
+CIPHER_AES192 = 8
+CIPHER_AES256 = 9
+COMPRESSION_ZIP = 1
+COMPRESSION_ZLIB = 2
+COMPRESSION_BZIP2 = 3
+
+# Signature types
+SIG_POSITIVE_CERTIFICATION = 0x13
+SIG_SUBKEY_BINDING = 0x18
+
+# Signature subpacket types
+SUB_CREATION_TIME = 2
+SUB_KEY_EXPIRATION = 9
+SUB_PREFERRED_CIPHERS = 11
+SUB_ISSUER = 16
+SUB_PREFERRED_HASHES = 21
+SUB_PREFERRED_COMPRESSION = 22
+SUB_KEYSERVER_PREFERENCES = 23
+SUB_KEY_FLAGS = 27
+SUB_FEATURES = 30
+SUB_ISSUER_FINGERPRINT = 33
+
+# Key flags
+FLAG_CERTIFY = 0x01
+FLAG_SIGN = 0x02
+FLAG_ENCRYPT = 0x0C
+
+# Secret key protection: S2K usage 254 (SHA-1 checksum), iterated and salted S2K
+S2K_USAGE_SHA1 = 254
+S2K_ITERATED_SALTED = 3
+# Coded iteration count 0xFF = 65011712 bytes hashed, the most RFC 4880 allows
+S2K_CODED_COUNT = 0xFF
+
+# Key types the engine can generate
+KEY_TYPES = ('RSA', 'ECC')
+
+# OpenPGP hash ID -> (cryptography hash, hashlib name)
+HASHES = {
+    HASH_SHA256: (hashes.SHA256, 'sha256'),
+    HASH_SHA384: (hashes.SHA384, 'sha384'),
+    HASH_SHA512: (hashes.SHA512, 'sha512')
+}
+
+# ECDSA/ECDH curve -> (OID, cryptography curve, hash, ECDH key wrap cipher); the hash
+# is at least as wide as the curve, as gpg requires
+CURVES = {
+    'secp256k1': (bytes.fromhex('2b8104000a'), ec.SECP256K1, HASH_SHA256, CIPHER_AES128),
+    'secp384r1': (bytes.fromhex('2b81040022'), ec.SECP384R1, HASH_SHA384, CIPHER_AES192),
+    'secp521r1': (bytes.fromhex('2b81040023'), ec.SECP521R1, HASH_SHA512, CIPHER_AES256),
+    'brainpoolP256r1': (bytes.fromhex('2b2403030208010107'), ec.BrainpoolP256R1, HASH_SHA256, CIPHER_AES128),
+    'brainpoolP384r1': (bytes.fromhex('2b240303020801010b'), ec.BrainpoolP384R1, HASH_SHA384, CIPHER_AES192),
+    'brainpoolP512r1': (bytes.fromhex('2b240303020801010d'), ec.BrainpoolP512R1, HASH_SHA512, CIPHER_AES256)
+}
+ED25519_OID = bytes.fromhex('2b06010401da470f01')
+CV25519_OID = bytes.fromhex('2b060104019755010501')
+# Curve names that give an Ed25519 primary key with a Cv25519 subkey
+CURVES_25519 = ('ed25519', 'cv25519')
+
+ARMOR_LINE_LENGTH = 64
+
+
+def _s2k_count(coded):
+    return (16 + (coded & 15)) << ((coded >> 4) + 6)
+
+
+def _mpi(value):
+    """Encode an integer as an OpenPGP multiprecision integer"""
+    bits = value.bit_length()
+    return struct.pack('>H', bits) + value.to_bytes((bits + 7) // 8, 'big')
+
+
+def _packet(tag, body):
+    """Wrap a packet body in a new-format packet header"""
+    length = len(body)
+    if length < 192:
+        header = bytes([length])
+    elif length < 8384:
+        length -= 192
+        header = bytes([(length >> 8) + 192, length & 0xFF])
+    else:
+        header = b'\xff' + struct.pack('>I', length)
+    return bytes([0xC0 | tag]) + header + body
+
+
+def _subpacket(kind, data):
+    length = len(data) + 1
+    if length < 192:
+        header = bytes([length])
+    else:
+        length -= 192
+        header = bytes([(length >> 8) + 192, length & 0xFF])
+    return header + bytes([kind]) + data
+
+
+def _crc24(data):
+    crc = 0xB704CE
+    for byte in data:
+        crc ^= byte << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1864CFB
+    return crc & 0xFFFFFF
+
+
+def armor(kind, data):
+    """
+    ASCII-armor OpenPGP packets.
+
+    Args:
+        kind (str): 'PUBLIC KEY BLOCK' or 'PRIVATE KEY BLOCK'
+        data (bytes): Binary packets
+
+    Returns:
+        str: Armored text, formatted like gpg's output
+    """
+    encoded = base64.b64encode(data).decode('ascii')
+    lines = [encoded[i:i + ARMOR_LINE_LENGTH] for i in range(0, len(encoded), ARMOR_LINE_LENGTH)]
+    checksum = base64.b64encode(_crc24(data).to_bytes(3, 'big')).decode('ascii')
+    return '\n'.join(
+        [f'-----BEGIN PGP {kind}-----', ''] + lines + [f'={checksum}', f'-----END PGP {kind}-----', '']
+    )
+
+
+def dearmor(text):
+    """
+    Decode ASCII-armored OpenPGP data.
+
+    Raises:
+        ValueError: If the armor is malformed or its checksum does not match
+    """
+    lines = text.strip().splitlines()
+    if not lines or not lines[0].startswith('-----BEGIN PGP '):
+        raise ValueError("Not an armored OpenPGP block")
+    try:
+        start = lines.index('') + 1
+    except ValueError:
+        raise ValueError("Armor headers are not terminated")
+    body = [line for line in lines[start:] if not line.startswith('-----END PGP ')]
+    checksum = None
+    if body and body[-1].startswith('='):
+        checksum = base64.b64decode(body.pop()[1:])
+    data = base64.b64decode(''.join(body))
+    if checksum is not None and _crc24(data).to_bytes(3, 'big') != checksum:
+        raise ValueError("Armor checksum mismatch")
+    return data
+
+
+def read_packets(data):
+    """
+    Split binary OpenPGP data into packets, in either header format.
+
+    Returns:
+        list: (tag, body) pairs
+
+    Raises:
+        ValueError: If a packet header is malformed or uses partial lengths
+    """
+    packets = []
+    pos = 0
+    while pos < len(data):
+        ctb = data[pos]
+        if not ctb & 0x80:
+            raise ValueError("Invalid packet header")
+        if ctb & 0x40:
+            # New format
+            tag = ctb & 0x3F
+            first = data[pos + 1]
+            if first < 192:
+                length, pos = first, pos + 2
+            elif first < 224:
+                length, pos = ((first - 192) << 8) + data[pos + 2] + 192, pos + 3
+            elif first == 255:
+                length, pos = struct.unpack('>I', data[pos + 2:pos + 6])[0], pos + 6
+            else:
+                raise ValueError("Partial body lengths are not supported in key blocks")
+        else:
+            # Old format
+            tag = (ctb >> 2) & 0x0F
+            length_type = ctb & 0x03
+            if length_type == 3:
+                length, pos = len(data) - pos - 1, pos + 1
+            else:
+                size = 1 << length_type
+                length = int.from_bytes(data[pos + 1:pos + 1 + size], 'big')
+                pos += 1 + size
+        if pos + length > len(data):
+            raise ValueError("Truncated packet")
+        packets.append((tag, data[pos:pos + length]))
+        pos += length
+    return packets
+
+
+# Number of public MPIs per algorithm, for keys without a curve OID
+_PUBLIC_MPIS = {PUBKEY_RSA: 2, 2: 2, 3: 2, 16: 3, 17: 4}
+
+
+def _public_length(body):
+    """Length of the public key fields at the start of a v4 secret key packet body"""
+    if not body or body[0] != 4:
+        raise ValueError("Only v4 keys are supported")
+    algorithm = body[5]
+    pos = 6
+
+    def skip_mpi(pos):
+        return pos + 2 + (struct.unpack('>H', body[pos:pos + 2])[0] + 7) // 8
+
+    if algorithm in _PUBLIC_MPIS:
+        for _ in range(_PUBLIC_MPIS[algorithm]):
+            pos = skip_mpi(pos)
+    elif algorithm in (PUBKEY_ECDSA, PUBKEY_EDDSA, PUBKEY_ECDH):
+        pos = skip_mpi(pos + 1 + body[pos])
+        if algorithm == PUBKEY_ECDH:
+            pos += 1 + body[pos]
+    else:
+        raise ValueError(f"Unsupported public key algorithm {algorithm}")
+    if pos > len(body):
+        raise ValueError("Truncated key packet")
+    return pos
+
+
+def public_from_secret(private_key):
+    """
+    Derive the armored public key from an armored secret key export.
+
+    Secret key packets start with the public key fields, so the public key
+    block is the secret one with the secret material cut off and the key
+    packets retagged; user IDs and signatures are kept as they are. This is
+    what ``gpg --export`` returns, without starting gpg.
+
+    Args:
+        private_key (str): Armored 'PRIVATE KEY BLOCK'
+
+    Returns:
+        str: Armored 'PUBLIC KEY BLOCK'
+
+    Raises:
+        ValueError: If the block cannot be parsed
+    """
+    retag = {TAG_SECRET_KEY: TAG_PUBLIC_KEY, TAG_SECRET_SUBKEY: TAG_PUBLIC_SUBKEY}
+    packets = []
+    for tag, body in read_packets(dearmor(private_key)):
+        if tag in retag:
+            packets.append(_packet(retag[tag], body[:_public_length(body)]))
+        elif tag != TAG_TRUST:
+            packets.append(_packet(tag, body))
+    if not packets:
+        raise ValueError("Empty key block")
+    return armor('PUBLIC KEY BLOCK', b''.join(packets))
+
+
+def _oid(oid):
+    return bytes([len(oid)]) + oid
+
+
+def _point(value):
+    return _mpi(int.from_bytes(value, 'big'))
+
+
+def _raw_public(public_key):
+    """Native Curve25519 point, prefixed with 0x40 as OpenPGP stores it"""
+    return b'\x40' + public_key.public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+
+def _raw_private(private_key):
+    return private_key.private_bytes(Encoding.Raw, PrivateFormat.Raw, NoEncryption())
+
+
+class _Key(ABC):
+    """One generated key with its v4 public key packet body.
+
+    Subclasses provide the algorithm and the public and secret key material;
+    keys that can sign derive from ``_SigningKey``.
+    """
+
+    algorithm = None
+    hash_id = HASH_SHA256
+
+    def __init__(self, private_key, created):
+        self.private_key = private_key
+        self.created = created
+        self.public_body = (
+            bytes([4]) + struct.pack('>I', created) + bytes([self.algorithm]) + self.public_material()
+        )
+        self.fingerprint = hashlib.sha1(self.hash_prefix()).digest()
+        self.key_id = self.fingerprint[-8:]
+
+    def hash_prefix(self):
+        """The key as hashed into signatures over it"""
+        return b'\x99' + struct.pack('>H', len(self.public_body)) + self.public_body
+
+    @abstractmethod
+    def public_material(self):
+        """Algorithm-specific public key fields of the key packet"""
+
+    @abstractmethod
+    def secret_material(self):
+        """Algorithm-specific secret key fields, before protection"""
+
+
+class _SigningKey(_Key):
+    """A key that can issue signatures"""
+
+    @abstractmethod
+    def sign(self, data, digest):
+        """Return the signature MPIs over ``data``, whose hash is ``digest``"""
+
+
+class _RSAKey(_SigningKey):
+    algorithm = PUBKEY_RSA
+
+    def public_material(self):
+        numbers = self.private_key.public_key().public_numbers()
+        return _mpi(numbers.n) + _mpi(numbers.e)
+
+    def secret_material(self):
+        """Secret MPIs: d, p, q and u = p^-1 mod q with p < q"""
+        numbers = self.private_key.private_numbers()
+        p, q = numbers.p, numbers.q
+        if p > q:
+            p, q = q, p
+        return _mpi(numbers.d) + _mpi(p) + _mpi(q) + _mpi(pow(p, -1, q))
+
+    def sign(self, data, digest):
+        signature = self.private_key.sign(data, padding.PKCS1v15(), HASHES[self.hash_id][0]())
+        return _mpi(int.from_bytes(signature, 'big'))
+
+
+class _ECKey(_SigningKey):
+    """ECDSA key, or ECDH key when ``cipher`` is given"""
+
+    def __init__(self, private_key, created, curve, cipher=None):
+        self.oid, _, self.hash_id, _ = CURVES[curve]
+        self.cipher = cipher
+        self.algorithm = PUBKEY_ECDH if cipher else PUBKEY_ECDSA
+        super().__init__(private_key, created)
+
+    def public_material(self):
+        point = self.private_key.public_key().public_bytes(Encoding.X962, PublicFormat.UncompressedPoint)
+        material = _oid(self.oid) + _point(point)
+        if self.cipher:
+            # KDF parameters: reserved length 3, version 1, hash and key wrap cipher
+            material += bytes([3, 1, self.hash_id, self.cipher])
+        return material
+
+    def secret_material(self):
+        return _mpi(self.private_key.private_numbers().private_value)
+
+    def sign(self, data, digest):
+        r, s = decode_dss_signature(self.private_key.sign(data, ec.ECDSA(HASHES[self.hash_id][0]())))
+        return _mpi(r) + _mpi(s)
+
+
+class _Ed25519Key(_SigningKey):
+    algorithm = PUBKEY_EDDSA
+
+    def public_material(self):
+        return _oid(ED25519_OID) + _point(_raw_public(self.private_key.public_key()))
+
+    def secret_material(self):
+        return _point(_raw_private(self.private_key))
+
+    def sign(self, data, digest):
+        # OpenPGP EdDSA signs the hash digest, not the data
+        signature = self.private_key.sign(digest)
+        return _point(signature[:32]) + _point(signature[32:])
+
+
+class _Cv25519Key(_Key):
+    algorithm = PUBKEY_ECDH
+
+    def public_material(self):
+        return (_oid(CV25519_OID) + _point(_raw_public(self.private_key.public_key()))
+                + bytes([3, 1, HASH_SHA256, CIPHER_AES128]))
+
+    def secret_material(self):
+        # Stored clamped and in big-endian order, as gpg writes it
+        secret = bytearray(_raw_private(self.private_key))
+        secret[0] &= 248
+        secret[31] &= 127
+        secret[31] |= 64
+        return _point(bytes(reversed(secret)))
+
+
+def _generate_keys(key_type, key_length, curve, created):
+    """Return the primary key and the encryption subkey for a request"""
+    if key_type == 'RSA':
+        return (_RSAKey(get_rsa_private_key(key_length), created),
+                _RSAKey(get_rsa_private_key(key_length), created))
+    if curve in CURVES_25519:
+        return (_Ed25519Key(ed25519.Ed25519PrivateKey.generate(), created),
+                _Cv25519Key(x25519.X25519PrivateKey.generate(), created))
+    if curve not in CURVES:
+        raise ValueError(f"Native OpenPGP engine does not support curve {curve}")
+    _, ec_curve, _, cipher = CURVES[curve]
+    return (_ECKey(ec.generate_private_key(ec_curve()), created, curve),
+            _ECKey(ec.generate_private_key(ec_curve()), created, curve, cipher))
+
+
+def _signature(signer, sig_type, hashed_data, hashed_subpackets):
+    """
+    Build a v4 signature packet issued by ``signer``.
+
+    Args:
+        signer (_SigningKey): Key making the signature
+        sig_type (int): Signature type
+        hashed_data (bytes): Key and user ID material the signature covers
+        hashed_subpackets (list): Subpackets besides creation time and issuer fingerprint
+    """
+    hashed = b''.join([
+        _subpacket(SUB_CREATION_TIME, struct.pack('>I', signer.created)),
+        *hashed_subpackets,
+        _subpacket(SUB_ISSUER_FINGERPRINT, bytes([4]) + signer.fingerprint)
+    ])
+    unhashed = _subpacket(SUB_ISSUER, signer.key_id)
+    head = bytes([4, sig_type, signer.algorithm, signer.hash_id]) + struct.pack('>H', len(hashed)) + hashed
+    signed = hashed_data + head + b'\x04\xff' + struct.pack('>I', len(head))
+    digest = hashlib.new(HASHES[signer.hash_id][1], signed).digest()
+    body = head + struct.pack('>H', len(unhashed)) + unhashed + digest[:2] + signer.sign(signed, digest)
+    return _packet(TAG_SIGNATURE, body)
+
+
+def _s2k_key(passphrase, salt, coded_count):
+    """Derive an AES-256 key with the iterated and salted SHA-256 S2K"""
+    unit = salt + passphrase
+    count = max(_s2k_count(coded_count), len(unit))
+    digest = hashlib.sha256()
+    # Hash in large chunks; the iteration count is tens of megabytes
+    chunk = unit * max(1, (1 << 20) // len(unit))
+    while count >= len(chunk):
+        digest.update(chunk)
+        count -= len(chunk)
+    full, rest = divmod(count, len(unit))
+    digest.update(unit * full + unit[:rest])
+    return digest.digest()
+
+
+def _protect(public_body, material, aes_key, salt, coded_count):
+    """Public key body followed by the AES-256-CFB protected secret material"""
+    iv = os.urandom(16)
+    encryptor = Cipher(algorithms.AES(aes_key), modes.CFB(iv)).encryptor()
+    encrypted = encryptor.update(material + hashlib.sha1(material).digest()) + encryptor.finalize()
+    s2k = bytes([S2K_USAGE_SHA1, CIPHER_AES256, S2K_ITERATED_SALTED, HASH_SHA256]) + salt + bytes([coded_count])
+    return public_body + s2k + iv + encrypted
+
+
+def _secret_body(key, aes_key, salt, coded_count):
+    return _protect(key.public_body, key.secret_material(), aes_key, salt, coded_count)
+
+
+def protect_secret_key(private_key, passphrase, coded_count=S2K_CODED_COUNT):
+    """
+    Protect the secret keys of an unprotected armored export with a passphrase.
+
+    Applies the same protection as ``generate_openpgp_key``, so gpg can
+    generate and export keys without passphrase round trips through
+    gpg-agent, which cost seconds per key.
+
+    Args:
+        private_key (str): Armored 'PRIVATE KEY BLOCK' whose secret keys are unprotected
+        passphrase (str): Passphrase to protect them with
+        coded_count (int): S2K coded iteration count
+
+    Returns:
+        str: Armored 'PRIVATE KEY BLOCK'
+
+    Raises:
+        ValueError: If the block cannot be parsed or a secret key is already protected
+    """
+    salt = os.urandom(8)
+    aes_key = _s2k_key(passphrase.encode('utf-8'), salt, coded_count)
+    packets = []
+    for tag, body in read_packets(dearmor(private_key)):
+        if tag in (TAG_SECRET_KEY, TAG_SECRET_SUBKEY):
+            public_length = _public_length(body)
+            if body[public_length] != 0:
+                raise ValueError("Secret key is already protected")
+            material, checksum = body[public_length + 1:-2], body[-2:]
+            if sum(material) & 0xFFFF != struct.unpack('>H', checksum)[0]:
+                raise ValueError("Secret key checksum mismatch")
+            packets.append(_packet(tag, _protect(body[:public_length], material, aes_key, salt, coded_count)))
+        elif tag != TAG_TRUST:
+            packets.append(_packet(tag, body))
+    if not packets:
+        raise ValueError("Empty key block")
+    return armor('PRIVATE KEY BLOCK', b''.join(packets))
+
+
+def generate_openpgp_key(user_id, key_type, passphrase, key_length=None, curve=None, expires_at=None,
+                         coded_count=S2K_CODED_COUNT):
+    """
+    Generate a PGP key pair without gpg.
+
+    Args:
+        user_id (str): User ID, e.g. 'Name (comment) <email>'
+        key_type (str): One of KEY_TYPES
+        passphrase (str): Passphrase protecting the secret keys
+        key_length (int): RSA key size in bits for the primary key and the subkey
+        curve (str): ECC curve, from CURVES or CURVES_25519
+        expires_at (int, optional): Expiry of both keys as a Unix timestamp
+        coded_count (int): S2K coded iteration count
+
+    Returns:
+        dict: publicKey and privateKey (armored) and fingerprint (40 hex digits)
+
+    Raises:
+        ValueError: If the key type or curve is not supported
+    """
+    if key_type not in KEY_TYPES:
+        raise ValueError(f"Native OpenPGP engine does not support key type {key_type}")
+
+    created = int(time.time())
+    with span('pgp.keygen', algorithm=key_type, size=key_length if key_type == 'RSA' else curve):
+        primary, subkey = _generate_keys(key_type, key_length, curve, created)
+
+    expiry = []
+    if expires_at:
+        expiry = [_subpacket(SUB_KEY_EXPIRATION, struct.pack('>I', max(1, int(expires_at) - created)))]
+
+    with span('pgp.export_public'):
+        user_id_bytes = user_id.encode('utf-8')
+        certification = _signature(
+            primary, SIG_POSITIVE_CERTIFICATION,
+            primary.hash_prefix() + b'\xb4' + struct.pack('>I', len(user_id_bytes)) + user_id_bytes,
+            expiry + [
+                _subpacket(SUB_KEY_FLAGS, bytes([FLAG_CERTIFY | FLAG_SIGN])),
+                _subpacket(SUB_PREFERRED_CIPHERS, bytes([CIPHER_AES256, CIPHER_AES192, CIPHER_AES128, CIPHER_3DES])),
+                _subpacket(SUB_PREFERRED_HASHES, bytes([HASH_SHA512, HASH_SHA384, HASH_SHA256, HASH_SHA224])),
+                _subpacket(SUB_PREFERRED_COMPRESSION, bytes([COMPRESSION_ZLIB, COMPRESSION_BZIP2, COMPRESSION_ZIP])),
+                _subpacket(SUB_FEATURES, b'\x01'),
+                _subpacket(SUB_KEYSERVER_PREFERENCES, b'\x80')
+            ]
+        )
+        binding = _signature(
+            primary, SIG_SUBKEY_BINDING,
+            primary.hash_prefix() + subkey.hash_prefix(),
+            expiry + [_subpacket(SUB_KEY_FLAGS, bytes([FLAG_ENCRYPT]))]
+        )
+        user_id_packet = _packet(TAG_USER_ID, user_id_bytes)
+        public_key = armor('PUBLIC KEY BLOCK', b''.join([
+            _packet(TAG_PUBLIC_KEY, primary.public_body), user_id_packet, certification,
+            _packet(TAG_PUBLIC_SUBKEY, subkey.public_body), binding
+        ]))
+
+    with span('pgp.export_secret'):
+        # One derivation protects both keys; each gets its own IV
+        salt = os.urandom(8)
+        aes_key = _s2k_key(passphrase.encode('utf-8'), salt, coded_count)
+        private_key = armor('PRIVATE KEY BLOCK', b''.join([
+            _packet(TAG_SECRET_KEY, _secret_body(primary, aes_key, salt, coded_count)), user_id_packet,
+            certification, _packet(TAG_SECRET_SUBKEY, _secret_body(subkey, aes_key, salt, coded_count)), binding
+        ]))
+
+    return {
+        'publicKey': public_key,
+        'privateKey': private_key,
+        'fingerprint': primary.fingerprint.hex().upper()
+    }
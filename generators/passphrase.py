@@ -1,48 +1,190 @@
-import secrets
+import os
 import string
 import sys
 import traceback
+from functools import lru_cache
+from typing import NamedTuple
 
-def generate_passphrase(length=16, include_numbers=True, include_special=True, exclude_chars=''):
-    """Generate a secure passphrase with specified options"""
+# Passphrase limits
+MIN_LENGTH = 8
+MAX_LENGTH = 64
+# Maximum passphrases per generate_passphrase call
+MAX_COUNT = 10000
+
+# Bytes drawn from os.urandom per refill of the sampler
+ENTROPY_BLOCK_SIZE = 256 * 1024
+
+# Maximum number of distinct charset option combinations kept compiled
+CHARSET_CACHE_SIZE = 256
+
+class CompiledCharset(NamedTuple):
+    """Immutable, sampling-ready character pool"""
+    chars: str
+    table: bytes
+    reject: bytes
+    acceptance: float
+
+def _build_charset(include_numbers=True, include_special=True, exclude_chars=''):
+    """Return the character pool for the given options"""
+    # Define character sets
+    chars = string.ascii_letters
+    
+    if include_numbers:
+        chars += string.digits
+    
+    if include_special:
+        chars += string.punctuation
+    
+    # Remove excluded characters
+    if exclude_chars:
+        excluded = frozenset(exclude_chars)
+        chars = ''.join(c for c in chars if c not in excluded)
+    
+    return chars
+
+def _build_sampling_table(chars):
+    """
+    Build a byte translation table for unbiased sampling from ``chars``.
+    
+    Byte values below the largest multiple of len(chars) that fits in a byte
+    map to ``chars[b % len(chars)]``; the remaining values are rejected.
+    Every character is therefore hit by exactly the same number of byte
+    values, which keeps the output uniform.
+    
+    Returns:
+        tuple: (translation table, rejected byte values, acceptance ratio)
+    """
+    n = len(chars)
+    limit = 256 - (256 % n)
+    encoded = chars.encode('ascii')
+    table = bytes(encoded[b % n] if b < limit else 0 for b in range(256))
+    reject = bytes(range(limit, 256))
+    return table, reject, limit / 256
+
+@lru_cache(maxsize=CHARSET_CACHE_SIZE)
+def _compile_normalized(include_numbers, include_special, exclude_chars):
+    chars = _build_charset(include_numbers, include_special, exclude_chars)
+    if not chars:
+        return None
+    return CompiledCharset(chars, *_build_sampling_table(chars))
+
+def compile_charset(include_numbers=True, include_special=True, exclude_chars=''):
+    """
+    Return the compiled character pool for a set of passphrase options.
+    
+    Options are normalised first (exclusions deduplicated and sorted) so
+    equivalent requests share one cache entry.
+    
+    Returns:
+        CompiledCharset or None: None if no characters remain after exclusions
+    """
+    return _compile_normalized(
+        bool(include_numbers),
+        bool(include_special),
+        ''.join(sorted(set(exclude_chars or '')))
+    )
+
+def get_charset_cache_stats():
+    """Return hit/miss statistics of the compiled charset cache"""
+    info = _compile_normalized.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'maxSize': info.maxsize,
+        'hitRate': round(info.hits / lookups, 4) if lookups else None
+    }
+
+def _sample(charset, total):
+    """
+    Draw ``total`` characters uniformly from a compiled charset.
+    
+    Entropy comes from os.urandom in large blocks; rejection sampling and
+    the mapping to characters run inside bytes.translate, so no Python code
+    runs per character.
+    """
+    parts = []
+    remaining = total
+    while remaining > 0:
+        # Over-draw slightly so a single block usually covers the request
+        size = min(ENTROPY_BLOCK_SIZE, int(remaining / charset.acceptance * 1.05) + 32)
+        accepted = os.urandom(size).translate(charset.table, charset.reject)
+        parts.append(accepted[:remaining])
+        remaining -= min(len(accepted), remaining)
+    return b''.join(parts).decode('ascii')
+
+def generate_passphrases(count, length=16, include_numbers=True, include_special=True, exclude_chars=''):
+    """
+    Generate many passphrases with the same options.
+    
+    Args:
+        count (int): Number of passphrases
+        length (int): Length of each passphrase (8-64)
+        include_numbers (bool): Include digits
+        include_special (bool): Include punctuation
+        exclude_chars (str): Characters to leave out
+    
+    Returns:
+        list: Generated passphrases
+    
+    Raises:
+        ValueError: If the options are invalid
+    """
+    if length < MIN_LENGTH or length > MAX_LENGTH:
+        raise ValueError(f'Passphrase length must be between {MIN_LENGTH} and {MAX_LENGTH} characters')
+    if count < 1:
+        raise ValueError('Passphrase count must be at least 1')
+    
+    charset = compile_charset(include_numbers, include_special, exclude_chars)
+    
+    # Validate character pool
+    if charset is None:
+        raise ValueError('No valid characters available after exclusions')
+    
+    sampled = _sample(charset, length * count)
+    return [sampled[i:i + length] for i in range(0, length * count, length)]
+
+def generate_passphrase(length=16, include_numbers=True, include_special=True, exclude_chars='', count=None):
+    """Generate a secure passphrase with specified options
+    
+    When ``count`` is given, ``passphrases`` holds that many passphrases and
+    ``passphrase`` is the first of them.
+    """
     try:
-        # Validate length
-        if length < 8 or length > 64:
+        # Validate count
+        if count is not None and (count < 1 or count > MAX_COUNT):
             return {
                 'success': False,
-                'error_message': 'Passphrase length must be between 8 and 64 characters'
+                'error_message': f'Passphrase count must be between 1 and {MAX_COUNT}'
             }
         
-        # Define character sets
-        chars = string.ascii_letters
-        
-        if include_numbers:
-            chars += string.digits
-        
-        if include_special:
-            chars += string.punctuation
-        
-        # Remove excluded characters
-        if exclude_chars:
-            chars = ''.join(c for c in chars if c not in exclude_chars)
-        
-        # Validate character pool
-        if not chars:
+        # Generate passphrases
+        try:
+            passphrases = generate_passphrases(
+                count or 1,
+                length=length,
+                include_numbers=include_numbers,
+                include_special=include_special,
+                exclude_chars=exclude_chars
+            )
+        except ValueError as e:
             return {
                 'success': False,
-                'error_message': 'No valid characters available after exclusions'
+                'error_message': str(e)
             }
         
-        # Generate passphrase
-        passphrase = ''.join(secrets.choice(chars) for _ in range(length))
-        
-        return {
+        result = {
             'success': True,
-            'passphrase': passphrase,
+            'passphrase': passphrases[0],
             'length': length,
             'includeNumbers': include_numbers,
             'includeSpecial': include_special
         }
+        if count is not None:
+            result['passphrases'] = passphrases
+            result['count'] = count
+        return result
     
     except Exception as e:
         # Comprehensive error logging
@@ -1,16 +1,25 @@
 import os
 import gnupg
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import re
 from utils.response import info_response, error_response
-from utils.sanitize import validate_comment
-from utils.utils import create_output_directory, save_key_pair
+from utils.config import env_int
+from utils.deadline import track_process, cancelled
+from utils.metrics import GPG_SPAWNS, gpg_command
+from utils.timing import span
+from .openpgp import KEY_TYPES as OPENPGP_KEY_TYPES, generate_openpgp_key, protect_secret_key, public_from_secret
 # Subprocess is required for GPG operations and is used securely with input validation
 # nosec B404 - subprocess is necessary for GPG operations
 from subprocess import run, CalledProcessError
+import atexit
+import copy
+import queue
 import shutil
+import tempfile
+import threading
 import uuid
-from typing import Optional, Tuple
+from contextlib import contextmanager
+from typing import Optional
 import logging
 
 # Configure logging
@@ -20,6 +29,14 @@ logger = logging.getLogger(__name__)
 # Email validation regex
 EMAIL_REGEX = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
 
+# Key generation engines: in-process OpenPGP (see openpgp.py) or the gpg binary
+PGP_ENGINES = ('native', 'gpg')
+
+# Where the gpg engine generates keys: the shared GNUPGHOME keyring, the shared
+# keyring with each key deleted after export, or a throwaway home per key
+GPG_HOME_MODES = ('shared', 'delete', 'ephemeral')
+EPHEMERAL_HOME_PREFIX = 'keygen-gpg-'
+
 # Key type configurations
 KEY_TYPES = {
     "RSA": {
@@ -29,7 +46,10 @@ KEY_TYPES = {
     },
     "ECC": {
         "type": "ECC",
-        "curves": ["secp256k1", "secp384r1", "secp521r1", "brainpoolP256r1", "brainpoolP384r1", "brainpoolP512r1"],
+        "curves": [
+            "secp256k1", "secp384r1", "secp521r1", "brainpoolP256r1", "brainpoolP384r1", "brainpoolP512r1",
+            "ed25519", "cv25519"
+        ],
         "default_curve": "secp256k1"
     }
 }
@@ -80,6 +100,7 @@ def _check_gpg_installation():
             
         # Use the full path to GPG with input validation
         # nosec B603 - we are using a validated full path from shutil.which()
+        GPG_SPAWNS.labels('version').inc()
         result = run([gpg_path, '--version'], 
             capture_output=True, 
             text=True, 
@@ -91,6 +112,336 @@ def _check_gpg_installation():
     except Exception as e:
         return False, f"Unexpected error checking GPG: {str(e)}"
 
+class _CountingGPG(gnupg.GPG):
+    """gnupg.GPG that counts every gpg subprocess it starts and ties it to the
+    request's cancel scope, so gpg is killed when the client's deadline passes"""
+
+    def _open_subprocess(self, args, passphrase=False):
+        GPG_SPAWNS.labels(gpg_command(args)).inc()
+        process = super()._open_subprocess(args, passphrase)
+        track_process(process)
+        return process
+
+class _GPGContext:
+    """Per-process GPG handle for one GPG home directory.
+
+    Binary discovery and the version probe done by ``gnupg.GPG`` happen once
+    when the context is created instead of on every request.
+    """
+
+    def __init__(self, gpg_home: str, gpg_path: str):
+        self.gpg_home = gpg_home
+        self.gpg_path = gpg_path
+        self.pid = os.getpid()
+        try:
+            # Try newer versions of python-gnupg
+            self.gpg = _CountingGPG(gnupghome=gpg_home, gpgbinary=gpg_path)
+        except TypeError:
+            # Fall back for older versions
+            self.gpg = _CountingGPG(homedir=gpg_home, gpgbinary=gpg_path)
+        self.version = getattr(self.gpg, 'version', None)
+
+# Cached contexts keyed by GPG home, rebuilt after a fork or a failure
+_gpg_contexts = {}
+_gpg_contexts_lock = threading.Lock()
+
+def _get_gpg_context(gpg_home: str) -> _GPGContext:
+    """
+    Return the cached GPG context for this process and GPG home.
+
+    Raises:
+        RuntimeError: If GPG is not installed or cannot be started
+    """
+    with _gpg_contexts_lock:
+        context = _gpg_contexts.get(gpg_home)
+        if context is not None and context.pid == os.getpid():
+            return context
+
+        gpg_path = _get_gpg_path()
+        if not gpg_path:
+            raise RuntimeError("GPG is not installed or not in PATH")
+
+        os.makedirs(gpg_home, mode=0o700, exist_ok=True)  # Use 700 permissions to restrict access
+        try:
+            context = _GPGContext(gpg_home, gpg_path)
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"GPG error: {str(e)}")
+        _gpg_contexts[gpg_home] = context
+        return context
+
+def _invalidate_gpg_context(gpg_home: str) -> Optional[str]:
+    """
+    Drop the cached context after a failure and re-check the GPG binary.
+
+    Returns:
+        str or None: Error message if GPG is no longer usable
+    """
+    with _gpg_contexts_lock:
+        _gpg_contexts.pop(gpg_home, None)
+    gpg_ok, error_msg = _check_gpg_installation()
+    return None if gpg_ok else error_msg
+
+def _get_gpg_home_mode() -> str:
+    """Return the configured gpg home mode (PGP_GPG_HOME, default 'shared')"""
+    mode = os.environ.get('PGP_GPG_HOME', 'shared').lower()
+    if mode not in GPG_HOME_MODES:
+        raise ValueError(f"Invalid PGP_GPG_HOME. Must be one of: {', '.join(GPG_HOME_MODES)}")
+    return mode
+
+def _ephemeral_root() -> str:
+    """Directory for ephemeral homes: PGP_EPHEMERAL_HOME_DIR, else /dev/shm (tmpfs) when usable"""
+    root = os.environ.get('PGP_EPHEMERAL_HOME_DIR')
+    if root:
+        return root
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+def _on_tmpfs(path: str) -> bool:
+    """Check whether a path is on a memory-backed filesystem (tmpfs or ramfs)"""
+    path = os.path.realpath(path)
+    mount_point, fs_type = '', None
+    try:
+        with open('/proc/self/mounts') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                point = fields[1].replace('\\040', ' ')
+                # The longest matching mount point wins; later mounts shadow earlier ones
+                if ((path == point or path.startswith(point.rstrip('/') + '/'))
+                        and len(point) >= len(mount_point)):
+                    mount_point, fs_type = point, fields[2]
+    except OSError:
+        return False
+    return fs_type in ('tmpfs', 'ramfs')
+
+def _protect_in_process(home: str) -> bool:
+    """
+    Whether keys generated in ``home`` may be generated and exported without
+    a passphrase and protected in-process.
+
+    Only throwaway homes qualify: ephemeral and slot homes on tmpfs, from
+    which the key is removed after export. In the shared GNUPGHOME a failed
+    delete would leave an unprotected secret key on persistent storage.
+    """
+    if _get_gpg_home_mode() == 'shared':
+        return False
+    return os.path.basename(home).startswith(EPHEMERAL_HOME_PREFIX) and _on_tmpfs(home)
+
+def _remove_gpg_home(home: str, gpg_path: str):
+    """Stop the gpg-agent serving a home directory and delete the directory"""
+    gpgconf = os.path.join(os.path.dirname(gpg_path), 'gpgconf')
+    if os.path.exists(gpgconf):
+        try:
+            # nosec B603 - fixed arguments and a path next to the validated gpg binary
+            GPG_SPAWNS.labels('gpgconf').inc()
+            run([gpgconf, '--homedir', home, '--kill', 'gpg-agent'], capture_output=True, timeout=10)
+        except Exception as e:
+            logger.error(f"Failed to stop gpg-agent for {home}: {str(e)}")
+    shutil.rmtree(home, ignore_errors=True)
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+# Roots already swept for homes left behind by dead processes, per process
+_swept_roots = set()
+_swept_roots_lock = threading.Lock()
+
+def _sweep_ephemeral_homes(root: str, gpg_path: str) -> int:
+    """
+    Remove ephemeral homes whose process is gone (e.g. a worker killed mid-request).
+
+    Runs once per process and root.
+
+    Returns:
+        int: Number of homes removed
+    """
+    with _swept_roots_lock:
+        if (os.getpid(), root) in _swept_roots:
+            return 0
+        _swept_roots.add((os.getpid(), root))
+    removed = 0
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return 0
+    for name in names:
+        if not name.startswith(EPHEMERAL_HOME_PREFIX):
+            continue
+        pid = name[len(EPHEMERAL_HOME_PREFIX):].split('-', 1)[0]
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            _remove_gpg_home(os.path.join(root, name), gpg_path)
+            removed += 1
+    return removed
+
+def _delete_from_keyring(gpg, fingerprint: str, passphrase: str):
+    """Delete a secret key and its public key with a single gpg process"""
+    args = [gpg.gpgbinary, '--homedir', gpg.gnupghome, '--batch', '--yes',
+            '--delete-secret-and-public-key', fingerprint]
+    try:
+        # nosec B603 - validated gpg path; the fingerprint comes from gpg itself
+        GPG_SPAWNS.labels(gpg_command(args)).inc()
+        result = run(args, capture_output=True, text=True, timeout=30)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip())
+    except Exception as e:
+        logger.error(f"Failed to delete key {fingerprint} from the keyring: {str(e)}")
+        # Fall back to python-gnupg, which knows how to pass the passphrase to older gpg versions
+        try:
+            gpg.delete_keys(fingerprint, secret=True, passphrase=passphrase)
+            gpg.delete_keys(fingerprint)
+        except Exception as e:
+            logger.error(f"Failed to delete key {fingerprint} from the keyring: {str(e)}")
+
+def _public_key_block(gpg, fingerprint: str, private_key: str) -> str:
+    """Public key block for an exported secret key, from gpg --export if it cannot be parsed"""
+    try:
+        return public_from_secret(private_key)
+    except ValueError as e:
+        logger.warning(f"Could not derive the public key from the secret export: {str(e)}")
+        return gpg.export_keys(fingerprint)
+
+@contextmanager
+def _gpg_session(context: _GPGContext):
+    """
+    Yield the GPG handle to generate one key with, and a list to which the
+    caller appends (fingerprint, passphrase) of every key it created.
+
+    In 'delete' mode those keys are deleted from the shared keyring when the
+    block exits. In 'ephemeral' mode the handle points at a new home
+    directory on tmpfs, which is removed together with its gpg-agent when
+    the block exits. Both happen on errors too, so the keyring never grows.
+    The ephemeral handle is a copy of the cached one, so no version probe is
+    repeated.
+    """
+    mode = _get_gpg_home_mode()
+    created = []
+    if mode == 'shared':
+        yield context.gpg, created
+        return
+    if mode == 'delete':
+        try:
+            yield context.gpg, created
+        finally:
+            for fingerprint, passphrase in created:
+                _delete_from_keyring(context.gpg, fingerprint, passphrase)
+        return
+
+    root = _ephemeral_root()
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    _sweep_ephemeral_homes(root, context.gpg_path)
+    # mkdtemp creates the directory with mode 0700
+    home = tempfile.mkdtemp(prefix=f'{EPHEMERAL_HOME_PREFIX}{os.getpid()}-', dir=root)
+    if len(home) > 80:
+        # gpg-agent puts its sockets in the home; socket paths are limited to 108 bytes
+        logger.warning(f"Ephemeral GPG home path is long, gpg-agent may fail to start: {home}")
+    try:
+        gpg = copy.copy(context.gpg)
+        gpg.gnupghome = home
+        yield gpg, created
+    finally:
+        _remove_gpg_home(home, context.gpg_path)
+
+class _GPGSlots:
+    """Isolated GPG homes owned by one process, each with its own gpg-agent.
+
+    A generation takes a free slot for its whole gpg session, so no two
+    generations share a keyring or an agent, and at most ``size`` gpg
+    sessions of this process run at once. Slot homes are named like
+    ephemeral homes, so the homes of dead workers are swept the same way.
+    """
+
+    def __init__(self, size: int, root: str, gpg_path: str):
+        self.pid = os.getpid()
+        self.size = size
+        self.gpg_path = gpg_path
+        self.homes = [os.path.join(root, f'{EPHEMERAL_HOME_PREFIX}{self.pid}-slot{i}') for i in range(size)]
+        # LIFO: the most recently used slot has the warmest gpg-agent
+        self._free = queue.LifoQueue()
+        for home in reversed(self.homes):
+            self._free.put(home)
+
+    @contextmanager
+    def acquire(self, timeout: float):
+        """
+        Hold a free slot home for the duration of the block.
+
+        Raises:
+            PGPGenerationError: If no slot is freed within ``timeout`` seconds
+        """
+        try:
+            with span('pgp.slot_wait'):
+                home = self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise PGPGenerationError("All GPG slots are busy, please try again later")
+        try:
+            yield home
+        finally:
+            self._free.put(home)
+
+    def close(self):
+        """Stop the slot agents and delete the slot homes"""
+        if self.pid != os.getpid():
+            return
+        for home in self.homes:
+            if os.path.isdir(home):
+                _remove_gpg_home(home, self.gpg_path)
+
+# The slots of this process, rebuilt after a fork
+_gpg_slots = None
+_gpg_slots_lock = threading.Lock()
+
+def _get_gpg_slots() -> Optional[_GPGSlots]:
+    """
+    Return this process's GPG slots, or None when PGP_GPG_SLOTS is 0 and every
+    process generates in GNUPGHOME.
+
+    Raises:
+        RuntimeError: If GPG is not installed
+    """
+    global _gpg_slots
+    size = env_int('PGP_GPG_SLOTS', 0)
+    if size <= 0:
+        return None
+    with _gpg_slots_lock:
+        if _gpg_slots is not None and _gpg_slots.pid == os.getpid() and _gpg_slots.size == size:
+            return _gpg_slots
+        gpg_path = _get_gpg_path()
+        if not gpg_path:
+            raise RuntimeError("GPG is not installed or not in PATH")
+        root = _ephemeral_root()
+        os.makedirs(root, mode=0o700, exist_ok=True)
+        _sweep_ephemeral_homes(root, gpg_path)
+        _gpg_slots = _GPGSlots(size, root, gpg_path)
+        atexit.register(_gpg_slots.close)
+        return _gpg_slots
+
+@contextmanager
+def _gpg_home():
+    """
+    Yield the GPG home to generate one key in: a slot home of this process
+    (waiting up to PGP_GPG_SLOT_TIMEOUT seconds for a free one) or GNUPGHOME.
+
+    Raises:
+        PGPGenerationError: If GPG is missing or every slot stays busy
+    """
+    try:
+        slots = _get_gpg_slots()
+    except RuntimeError as e:
+        raise PGPGenerationError(str(e))
+    if slots is None:
+        yield os.environ.get('GNUPGHOME', os.path.join(os.getcwd(), 'keys', 'gpg'))
+        return
+    with slots.acquire(env_int('PGP_GPG_SLOT_TIMEOUT', 30)) as home:
+        yield home
+
 def _sanitize_name(name: str) -> str:
     """
     Sanitize and validate name input.
@@ -158,6 +509,128 @@ def _sanitize_comment(comment: Optional[str]) -> Optional[str]:
     # Limit comment length
     return sanitized_comment[:100] or None
 
+class PGPGenerationError(Exception):
+    """Key generation failed; the message is returned to the client"""
+
+def _get_pgp_engine() -> str:
+    """Return the configured PGP engine (PGP_ENGINE, default 'gpg')"""
+    engine = os.environ.get('PGP_ENGINE', 'gpg').lower()
+    if engine not in PGP_ENGINES:
+        raise ValueError(f"Invalid PGP_ENGINE. Must be one of: {', '.join(PGP_ENGINES)}")
+    return engine
+
+def _expire_timestamp(expire_date: str) -> Optional[int]:
+    """Convert an expiry from _calculate_expire_date to a Unix timestamp, None for never"""
+    if expire_date == '0':
+        return None
+    return int(datetime.strptime(expire_date, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp())
+
+def _gpg_key_parameters(key_type: str, key_length: Optional[int], curve: Optional[str]) -> dict:
+    """Key and subkey parameters for gpg --gen-key"""
+    if key_type == 'RSA':
+        return {'key_type': 'RSA', 'key_length': key_length, 'subkey_type': 'RSA', 'subkey_length': key_length}
+    if curve in ('ed25519', 'cv25519'):
+        return {'key_type': 'EDDSA', 'key_curve': 'ed25519', 'subkey_type': 'ECDH', 'subkey_curve': 'cv25519'}
+    return {'key_type': 'ECDSA', 'key_curve': curve, 'subkey_type': 'ECDH', 'subkey_curve': curve}
+
+def _generate_with_gpg(
+    name_string: str,
+    email: str,
+    key_type: str,
+    key_length: Optional[int],
+    curve: Optional[str],
+    passphrase: str,
+    expire_date: str
+) -> dict:
+    """
+    Generate and export a key pair with gpg.
+
+    Returns:
+        dict: publicKey, privateKey (armored) and fingerprint
+
+    Raises:
+        PGPGenerationError: If gpg fails
+    """
+    with _gpg_home() as gpg_home:
+        # Reuse the per-process GPG handle for this home directory
+        try:
+            context = _get_gpg_context(gpg_home)
+        except RuntimeError as e:
+            logger.error(f"GPG initialization failed: {str(e)}")
+            raise PGPGenerationError(str(e))
+
+        with _gpg_session(context) as (gpg, created):
+            # Keys in throwaway homes are generated and exported without protection and
+            # protected in-process: passphrase round trips through gpg-agent cost seconds per key
+            protect_in_process = _protect_in_process(gpg.gnupghome)
+
+            # Create key input string in the format expected by GPG
+            logger.debug(f"Generating key with params: name={name_string}, email={email}, key_type={key_type}")
+            protection = {'no_protection': True} if protect_in_process else {'passphrase': passphrase}
+            key_input = gpg.gen_key_input(
+                name_real=name_string,
+                name_email=email,
+                expire_date=expire_date,
+                **protection,
+                **_gpg_key_parameters(key_type, key_length, curve)
+            )
+
+            # Generate key
+            try:
+                with span('pgp.keygen', algorithm=key_type, size=key_length if key_type == 'RSA' else curve):
+                    key = gpg.gen_key(key_input)
+            except Exception as e:
+                logger.error(f"Key generation failed: {str(e)}")
+                error_message = _invalidate_gpg_context(gpg_home)
+                raise PGPGenerationError(error_message or f"Failed to generate PGP key: {str(e)}")
+    
+            if not key and cancelled():
+                # gpg was killed, not broken: keep the cached context
+                raise PGPGenerationError("Request deadline exceeded")
+            if not key:
+                logger.error("Key generation returned empty result")
+                error_message = _invalidate_gpg_context(gpg_home)
+                raise PGPGenerationError(error_message or "Failed to generate PGP key")
+            created.append((str(key), passphrase))
+
+            # Export private key. gpg --gen-key cannot write the secret key out, so
+            # this second gpg process is the floor per key; --export is not run
+            try:
+                with span('pgp.export_secret'):
+                    if protect_in_process:
+                        ascii_armored_private_key = protect_secret_key(
+                            gpg.export_keys(str(key), secret=True, expect_passphrase=False),
+                            passphrase
+                        )
+                    else:
+                        ascii_armored_private_key = gpg.export_keys(
+                            str(key), 
+                            secret=True, 
+                            passphrase=passphrase
+                        )
+            except Exception as e:
+                logger.error(f"Private key export failed: {str(e)}")
+                raise PGPGenerationError(f"Failed to export private key: {str(e)}")
+
+            # Derive the public key from the secret export instead of running gpg --export
+            try:
+                with span('pgp.export_public'):
+                    ascii_armored_public_key = _public_key_block(gpg, str(key), ascii_armored_private_key)
+            except Exception as e:
+                logger.error(f"Public key export failed: {str(e)}")
+                raise PGPGenerationError(f"Failed to export public key: {str(e)}")
+
+            if not ascii_armored_public_key or not ascii_armored_private_key:
+                logger.error("Exported keys are empty")
+                raise PGPGenerationError("Failed to export generated keys")
+
+            return {
+                'publicKey': ascii_armored_public_key,
+                'privateKey': ascii_armored_private_key,
+                'fingerprint': str(key)
+            }
+
+
 def generate_pgp_key(
     name: str, 
     email: str, 
@@ -172,152 +645,76 @@ def generate_pgp_key(
     Generate a PGP key pair with enhanced security and validation.
     """
     try:
-        # Validate and sanitize inputs
-        try:
-            name = _sanitize_name(name)
-            email = _sanitize_email(email)
-            comment = _sanitize_comment(comment)
-        except ValueError as e:
-            logger.error(f"Input validation error: {str(e)}")
-            return error_response(str(e))
+        with span('pgp.validate'):
+            # Validate and sanitize inputs
+            try:
+                name = _sanitize_name(name)
+                email = _sanitize_email(email)
+                comment = _sanitize_comment(comment)
+            except ValueError as e:
+                logger.error(f"Input validation error: {str(e)}")
+                return error_response(str(e))
         
-        # Ensure a passphrase is provided for key export
-        if not passphrase:
-            passphrase = str(uuid.uuid4())  # Generate a random passphrase
+            # Ensure a passphrase is provided for key export
+            if not passphrase:
+                passphrase = str(uuid.uuid4())  # Generate a random passphrase
         
-        # Get GPG path
-        gpg_path = _get_gpg_path()
-        if not gpg_path:
-            logger.error("GPG is not installed or not in PATH")
-            return error_response("GPG is not installed or not in PATH")
-            
-        # Check GPG installation
-        gpg_ok, error_msg = _check_gpg_installation()
-        if not gpg_ok:
-            logger.error(f"GPG installation check failed: {error_msg}")
-            return error_response(error_msg)
-
-        # Validate key type
-        key_type = key_type.upper()
-        if key_type not in ["RSA", "ECC"]:
-            logger.error(f"Invalid key type: {key_type}")
-            return error_response("Invalid key type. Must be 'RSA' or 'ECC'")
-
-        # Validate and set key length for RSA
-        if key_type == "RSA":
-            if not key_length:
-                key_length = 2048
-            if key_length not in [2048, 3072, 4096]:
-                logger.error(f"Invalid RSA key length: {key_length}")
-                return error_response("Invalid key length for RSA. Must be 2048, 3072, or 4096")
-
-        # Validate curve for ECC
-        if key_type == "ECC":
-            if not curve:
-                curve = "secp256k1"
-            valid_curves = ["secp256k1", "secp384r1", "secp521r1", "brainpoolP256r1", "brainpoolP384r1", "brainpoolP512r1"]
-            if curve not in valid_curves:
-                logger.error(f"Invalid ECC curve: {curve}")
-                return error_response(f"Invalid curve. Must be one of: {', '.join(valid_curves)}")
+            # Validate key type
+            key_type = key_type.upper()
+            if key_type not in ["RSA", "ECC"]:
+                logger.error(f"Invalid key type: {key_type}")
+                return error_response("Invalid key type. Must be 'RSA' or 'ECC'")
 
-        try:
-            expire_date = _calculate_expire_date(expire_time)
-        except ValueError as e:
-            logger.error(f"Invalid expiration time: {expire_time}")
-            return error_response(str(e))
+            # Validate and set key length for RSA
+            if key_type == "RSA":
+                if not key_length:
+                    key_length = 2048
+                if key_length not in [2048, 3072, 4096]:
+                    logger.error(f"Invalid RSA key length: {key_length}")
+                    return error_response("Invalid key length for RSA. Must be 2048, 3072, or 4096")
 
-        # Create gpg home directory if it doesn't exist
-        gpg_home = os.environ.get('GNUPGHOME', os.path.join(os.getcwd(), 'keys', 'gpg'))
-        os.makedirs(gpg_home, mode=0o700, exist_ok=True)  # Use 700 permissions to restrict access
+            # Validate curve for ECC
+            if key_type == "ECC":
+                if not curve:
+                    curve = "secp256k1"
+                valid_curves = KEY_TYPES["ECC"]["curves"]
+                if curve not in valid_curves:
+                    logger.error(f"Invalid ECC curve: {curve}")
+                    return error_response(f"Invalid curve. Must be one of: {', '.join(valid_curves)}")
 
-        # Initialize GPG with cross-platform compatibility
-        try:
-            # Try newer versions of python-gnupg
-            gpg = gnupg.GPG(gnupghome=gpg_home, gpgbinary=gpg_path)
-        except TypeError:
-            # Fall back for older versions
-            gpg = gnupg.GPG(homedir=gpg_home, gpgbinary=gpg_path)
-            
-        # Try to list keys to verify GPG is working
-        try:
-            gpg.list_keys()
-        except Exception as e:
-            logger.error(f"GPG key listing failed: {str(e)}")
-            error_msg = str(e).lower()
-            if "not installed" in error_msg or "cannot run" in error_msg:
-                gpg_installed, error_message = _check_gpg_installation()
-                if not gpg_installed:
-                    return error_response(error_message)
-            return error_response(f"GPG error: {str(e)}")
+            try:
+                expire_date = _calculate_expire_date(expire_time)
+            except ValueError as e:
+                logger.error(f"Invalid expiration time: {expire_time}")
+                return error_response(str(e))
 
         # Prepare key input string
         name_string = name
         if comment:
             name_string = f"{name} ({comment})"
-        
-        # Create key input string in the format expected by GPG
-        logger.debug(f"Generating key with params: name={name_string}, email={email}, key_type={key_type}")
-        key_input = gpg.gen_key_input(
-            name_real=name_string,
-            name_email=email,
-            expire_date=expire_date,
-            key_type='RSA' if key_type == 'RSA' else 'DSA',
-            key_length=key_length if key_type == 'RSA' else 2048,
-            subkey_type='RSA',
-            subkey_length=key_length if key_type == 'RSA' else 2048,
-            passphrase=passphrase
-        )
-
-        # Generate key
-        try:
-            key = gpg.gen_key(key_input)
-        except Exception as e:
-            logger.error(f"Key generation failed: {str(e)}")
-            return error_response(f"Failed to generate PGP key: {str(e)}")
-        
-        if not key:
-            logger.error("Key generation returned empty result")
-            return error_response("Failed to generate PGP key")
-
-        # Export public key
-        try:
-            ascii_armored_public_key = gpg.export_keys(str(key))
-        except Exception as e:
-            logger.error(f"Public key export failed: {str(e)}")
-            return error_response(f"Failed to export public key: {str(e)}")
-        
-        # Export private key
-        try:
-            ascii_armored_private_key = gpg.export_keys(
-                str(key), 
-                secret=True, 
-                passphrase=passphrase
-            )
-        except Exception as e:
-            logger.error(f"Private key export failed: {str(e)}")
-            return error_response(f"Failed to export private key: {str(e)}")
-
-        if not ascii_armored_public_key or not ascii_armored_private_key:
-            logger.error("Exported keys are empty")
-            return error_response("Failed to export generated keys")
 
-        # Create a directory for the key using a modified directory name
-        safe_comment = re.sub(r'\W+', '_', comment) if comment else ''
-        key_dir = create_output_directory('pgp', safe_comment or email.replace('@', '_at_'))
+        generated = None
+        if key_type in OPENPGP_KEY_TYPES and _get_pgp_engine() == 'native':
+            try:
+                generated = generate_openpgp_key(
+                    f"{name_string} <{email}>", key_type, passphrase, key_length=key_length, curve=curve,
+                    expires_at=_expire_timestamp(expire_date)
+                )
+            except Exception as e:
+                # The gpg engine stays available as a fallback
+                logger.error(f"Native OpenPGP generation failed, falling back to gpg: {str(e)}", exc_info=True)
 
-        # Save keys using save_key_pair
-        private_path, public_path = save_key_pair(
-            ascii_armored_private_key,
-            ascii_armored_public_key,
-            key_dir,
-            'pgp'
-        )
+        if generated is None:
+            try:
+                generated = _generate_with_gpg(name_string, email, key_type, key_length, curve, passphrase, expire_date)
+            except PGPGenerationError as e:
+                return error_response(str(e))
 
         # Prepare response data
         response_data = {
-            'publicKey': ascii_armored_public_key,
-            'privateKey': ascii_armored_private_key,
-            'keyId': str(key),
+            'publicKey': generated['publicKey'],
+            'privateKey': generated['privateKey'],
+            'keyId': generated['fingerprint'],
             'keyType': key_type,
             'keyLength': key_length if key_type == 'RSA' else None,
             'curve': curve if key_type == 'ECC' else None,
@@ -1,7 +1,22 @@
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives import serialization
 from utils.response import info_response, error_response
 from utils.sanitize import validate_comment
+from utils.timing import span
+from .keypool import get_rsa_private_key
+
+# Valid RSA key sizes in bits
+RSA_KEY_SIZES = (2048, 4096)
+
+def validate_rsa_key_size(key_size):
+    """
+    Validate an RSA key size.
+
+    Raises:
+        ValueError: If the size is not one of RSA_KEY_SIZES
+    """
+    if key_size not in RSA_KEY_SIZES:
+        raise ValueError("Invalid key size. Must be 2048 or 4096 bits")
+    return key_size
 
 def generate_rsa_key(key_size=2048, comment=None, passphrase=None):
     """
@@ -16,22 +31,23 @@ def generate_rsa_key(key_size=2048, comment=None, passphrase=None):
         dict: Response containing the generated keys and status
     """
     try:
-        # Validate key size
-        if key_size not in [2048, 4096]:
-            return error_response("Invalid key size. Must be 2048 or 4096 bits")
+        with span('rsa.validate'):
+            # Validate key size
+            try:
+                validate_rsa_key_size(key_size)
+            except ValueError as e:
+                return error_response(str(e))
 
-        # Validate and sanitize comment if provided
-        try:
-            if comment:
-                comment = validate_comment(comment)
-        except ValueError as e:
-            return error_response(str(e))
+            # Validate and sanitize comment if provided
+            try:
+                if comment:
+                    comment = validate_comment(comment)
+            except ValueError as e:
+                return error_response(str(e))
 
-        # Generate private key
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=key_size
-        )
+        # Generate private key, drawing from the key pool when enabled
+        with span('rsa.keygen', size=key_size):
+            private_key = get_rsa_private_key(key_size)
         
         # Get public key
         public_key = private_key.public_key()
@@ -43,17 +59,19 @@ def generate_rsa_key(key_size=2048, comment=None, passphrase=None):
         else:
             encryption = serialization.NoEncryption()
             
-        private_pem = private_key.private_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.PKCS8,
-            encryption_algorithm=encryption
-        )
+        with span('rsa.serialize', encrypted=not isinstance(encryption, serialization.NoEncryption)):
+            private_pem = private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=encryption
+            )
         
         # Serialize public key
-        public_pem = public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
+        with span('rsa.public'):
+            public_pem = public_key.public_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo
+            )
         
         return info_response({
             'publicKey': public_pem.decode('utf-8'),
@@ -1,10 +1,11 @@
 import os
 import sys
-import uuid
 import traceback
 import paramiko
 from utils.response import info_response, error_response
 from utils.sanitize import validate_comment
+from utils.timing import span
+from .keypool import get_rsa_private_key
 
 # Ensure proper encoding is set
 os.environ['LC_ALL'] = 'en_US.UTF-8'
@@ -13,6 +14,38 @@ os.environ['LANG'] = 'en_US.UTF-8'
 from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
 from cryptography.hazmat.primitives import serialization
 
+# Valid key sizes per key type; the first is the default
+SSH_KEY_SIZES = {
+    'rsa': (2048, 4096),
+    'ecdsa': (256, 384, 521),
+    'ed25519': (256,)
+}
+
+def validate_ssh_key(key_type, key_size=None):
+    """
+    Validate an SSH key type and size and apply the default size.
+
+    Args:
+        key_type (str): rsa, ecdsa or ed25519 (case-insensitive)
+        key_size (int, optional): Key size in bits
+
+    Returns:
+        tuple: (key_type, key_size) normalized
+
+    Raises:
+        ValueError: If the type or size is invalid
+    """
+    key_type = key_type.lower()
+    if key_type not in SSH_KEY_SIZES:
+        raise ValueError("Invalid key type. Must be 'rsa', 'ecdsa', or 'ed25519'")
+    if key_size is None:
+        key_size = SSH_KEY_SIZES[key_type][0]
+    if key_type == 'rsa' and key_size not in SSH_KEY_SIZES['rsa']:
+        raise ValueError("RSA key size must be 2048 or 4096 bits")
+    if key_type == 'ecdsa' and key_size not in SSH_KEY_SIZES['ecdsa']:
+        raise ValueError("ECDSA key size must be 256, 384, or 521 bits")
+    return key_type, key_size
+
 def generate_ssh_key(key_type="rsa", key_size=None, comment=None, passphrase=None):
     """
     Generate an SSH key pair.
@@ -27,43 +60,28 @@ def generate_ssh_key(key_type="rsa", key_size=None, comment=None, passphrase=Non
         dict: Response containing the generated keys and status
     """
     try:
-        # Validate key type
-        key_type = key_type.lower()
-        if key_type not in ["rsa", "ecdsa", "ed25519"]:
-            return error_response("Invalid key type. Must be 'rsa', 'ecdsa', or 'ed25519'")
+        with span('ssh.validate'):
+            # Validate key type and size, applying the default size
+            try:
+                key_type, key_size = validate_ssh_key(key_type, key_size)
+            except ValueError as e:
+                return error_response(str(e))
 
-        # Validate and sanitize comment if provided
-        try:
-            if comment:
-                comment = validate_comment(comment)
-        except ValueError as e:
-            return error_response(str(e))
-
-        # Set default key sizes
-        if key_size is None:
-            if key_type == 'rsa':
-                key_size = 2048
-            elif key_type == 'ecdsa':
-                key_size = 256
-            elif key_type == 'ed25519':
-                key_size = 256
+            # Validate and sanitize comment if provided
+            try:
+                if comment:
+                    comment = validate_comment(comment)
+            except ValueError as e:
+                return error_response(str(e))
 
         # Generate key based on type
         if key_type == 'rsa':
-            if key_size not in [2048, 4096]:
-                return error_response("RSA key size must be 2048 or 4096 bits")
-            
-            # Generate RSA key using cryptography library
-            private_key = rsa.generate_private_key(
-                public_exponent=65537,
-                key_size=key_size
-            )
+            # Generate RSA key, drawing from the key pool when enabled
+            with span('ssh.keygen', algorithm=key_type, size=key_size):
+                private_key = get_rsa_private_key(key_size)
             key_name = 'ssh-rsa'
         
         elif key_type == 'ecdsa':
-            if key_size not in [256, 384, 521]:
-                return error_response("ECDSA key size must be 256, 384, or 521 bits")
-            
             # Map ECDSA key sizes to curves
             curve_map = {
                 256: ec.SECP256R1(),
@@ -73,69 +91,56 @@ def generate_ssh_key(key_type="rsa", key_size=None, comment=None, passphrase=Non
             curve = curve_map[key_size]
             
             # Generate ECDSA key
-            private_key = ec.generate_private_key(curve)
+            with span('ssh.keygen', algorithm=key_type, size=key_size):
+                private_key = ec.generate_private_key(curve)
             key_name = f'ecdsa-sha2-nistp{key_size}'
         
         elif key_type == 'ed25519':
             # ED25519 has a fixed key size
-            private_key = ed25519.Ed25519PrivateKey.generate()
+            with span('ssh.keygen', algorithm=key_type, size=key_size):
+                private_key = ed25519.Ed25519PrivateKey.generate()
             key_name = 'ssh-ed25519'
         
-        # Serialize keys
-        if passphrase:
-            # For encrypted keys: Use PKCS8 format with PEM encoding
-            encryption = serialization.BestAvailableEncryption(passphrase.encode())
-            private_key_pem = private_key.private_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PrivateFormat.PKCS8,
-                encryption_algorithm=encryption
-            )
-        else:
-            # For unencrypted keys:
-            # - RSA keys: Use TraditionalOpenSSL format (which is PKCS1 for RSA)
-            # - ED25519 keys: Use OpenSSH format
-            # - Other keys: Use TraditionalOpenSSL format
-            if key_type == 'ed25519':
+        # Serialize keys; with a passphrase this includes the key derivation
+        with span('ssh.serialize', encrypted=bool(passphrase)):
+            if passphrase:
+                # For encrypted keys: Use PKCS8 format with PEM encoding
+                encryption = serialization.BestAvailableEncryption(passphrase.encode())
                 private_key_pem = private_key.private_bytes(
                     encoding=serialization.Encoding.PEM,
-                    format=serialization.PrivateFormat.OpenSSH,
-                    encryption_algorithm=serialization.NoEncryption()
+                    format=serialization.PrivateFormat.PKCS8,
+                    encryption_algorithm=encryption
                 )
             else:
-                private_key_pem = private_key.private_bytes(
-                    encoding=serialization.Encoding.PEM,
-                    format=serialization.PrivateFormat.TraditionalOpenSSL,
-                    encryption_algorithm=serialization.NoEncryption()
-                )
+                # For unencrypted keys:
+                # - RSA keys: Use TraditionalOpenSSL format (which is PKCS1 for RSA)
+                # - ED25519 keys: Use OpenSSH format
+                # - Other keys: Use TraditionalOpenSSL format
+                if key_type == 'ed25519':
+                    private_key_pem = private_key.private_bytes(
+                        encoding=serialization.Encoding.PEM,
+                        format=serialization.PrivateFormat.OpenSSH,
+                        encryption_algorithm=serialization.NoEncryption()
+                    )
+                else:
+                    private_key_pem = private_key.private_bytes(
+                        encoding=serialization.Encoding.PEM,
+                        format=serialization.PrivateFormat.TraditionalOpenSSL,
+                        encryption_algorithm=serialization.NoEncryption()
+                    )
         
-        public_key = private_key.public_key()
-        public_key_ssh = public_key.public_bytes(
-            encoding=serialization.Encoding.OpenSSH,
-            format=serialization.PublicFormat.OpenSSH
-        )
+        with span('ssh.public'):
+            public_key = private_key.public_key()
+            public_key_ssh = public_key.public_bytes(
+                encoding=serialization.Encoding.OpenSSH,
+                format=serialization.PublicFormat.OpenSSH
+            )
         
         # Add comment to public key if provided
         public_key_str = public_key_ssh.decode()
         if comment:
             public_key_str += f' {comment}'
             
-        # Generate unique directory for key storage
-        key_dir = os.path.join(os.environ.get('KEY_STORAGE_PATH', '/tmp'), str(uuid.uuid4()))
-        os.makedirs(key_dir, mode=0o700, exist_ok=True)
-        
-        # Define key paths
-        private_path = os.path.join(key_dir, 'id_' + key_type)
-        public_path = os.path.join(key_dir, 'id_' + key_type + '.pub')
-        
-        # Write keys to files
-        with open(private_path, 'wb') as f:
-            os.chmod(private_path, 0o600)
-            f.write(private_key_pem)
-            
-        with open(public_path, 'w') as f:
-            os.chmod(public_path, 0o644)
-            f.write(public_key_str)
-        
         return info_response({
             'privateKey': private_key_pem.decode(),
             'publicKey': public_key_str,
@@ -0,0 +1,21 @@
+"""Gunicorn settings picked up automatically from the working directory.
+
+Prometheus multiprocess mode: every worker writes its metric samples under
+PROMETHEUS_MULTIPROC_DIR, which is emptied when the master starts. Samples
+of exited workers are dropped from live gauges.
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, mode=0o700, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
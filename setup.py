@@ -9,6 +9,7 @@ setup(
         'cryptography',
         'python-gnupg',
         'pycryptodome',
+        'prometheus-client',
     ],
     python_requires='>=3.8',
     description="A secure key generation service",
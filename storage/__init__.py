@@ -0,0 +1,102 @@
+import os
+import threading
+from utils.config import env_flag, env_int
+from .base import KeyStore, KEY_TYPES, new_record
+from .filesystem import FilesystemKeyStore
+from .index import KeyIndex
+from .layout import LAYOUTS
+from .sqlite import SQLiteKeyStore
+from .memory import MemoryKeyStore
+from .packfile import PackFileKeyStore
+
+__all__ = [
+    'KeyStore', 'KEY_TYPES', 'new_record',
+    'FilesystemKeyStore', 'SQLiteKeyStore', 'MemoryKeyStore', 'PackFileKeyStore',
+    'KeyIndex', 'get_keystore', 'get_key_index'
+]
+
+BACKENDS = ('filesystem', 'sqlite', 'memory', 'packfile')
+
+_stores = {}
+_indexes = {}
+_stores_lock = threading.Lock()
+
+def _index_path():
+    if not env_flag('KEY_INDEX', '1'):
+        return None
+    return os.getenv('KEY_INDEX_PATH') or os.path.join(os.getenv('KEY_STORAGE_PATH', 'keys'), 'index.db')
+
+def _keystore_config():
+    backend = os.getenv('KEY_STORE_BACKEND', 'filesystem').lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Invalid KEY_STORE_BACKEND. Must be one of: {', '.join(BACKENDS)}")
+    base_path = os.getenv('KEY_STORAGE_PATH', 'keys')
+    if backend == 'filesystem':
+        layout = os.getenv('KEY_STORAGE_LAYOUT', 'flat').lower()
+        if layout not in LAYOUTS:
+            raise ValueError(f"Invalid KEY_STORAGE_LAYOUT. Must be one of: {', '.join(LAYOUTS)}")
+        return (backend, base_path, layout)
+    if backend == 'sqlite':
+        return (backend, os.getenv('KEY_STORE_SQLITE_PATH') or os.path.join(base_path, 'keys.db'))
+    if backend == 'packfile':
+        return (
+            backend,
+            os.getenv('KEY_STORE_PACK_PATH') or os.path.join(base_path, 'packs'),
+            env_int('KEY_STORE_PACK_MAX_SIZE', 64 * 1024 * 1024),
+            env_int('KEY_STORE_PACK_TTL', 0)
+        )
+    return (backend, env_int('KEY_STORE_MEMORY_TTL', 3600), env_int('KEY_STORE_MEMORY_MAX_KEYS', 10000))
+
+def get_keystore():
+    """Return the key store selected by configuration
+
+    KEY_STORE_BACKEND picks 'filesystem' (default, files under
+    KEY_STORAGE_PATH in the KEY_STORAGE_LAYOUT 'flat' or 'sharded'), 'sqlite' (KEY_STORE_SQLITE_PATH, default
+    KEY_STORAGE_PATH/keys.db), 'packfile' (KEY_STORE_PACK_PATH, default
+    KEY_STORAGE_PATH/packs, rotated at KEY_STORE_PACK_MAX_SIZE bytes, records
+    expiring after KEY_STORE_PACK_TTL seconds if set) or 'memory'
+    (KEY_STORE_MEMORY_TTL seconds, at most KEY_STORE_MEMORY_MAX_KEYS pairs).
+
+    Persistent stores get the metadata index from ``get_key_index``
+    attached; memory keys expire, so they are not indexed.
+
+    Returns:
+        KeyStore: One shared instance per configuration
+    """
+    config = _keystore_config()
+    if config[0] != 'memory':
+        config += (_index_path(),)
+    with _stores_lock:
+        store = _stores.get(config)
+        if store is None:
+            backend = config[0]
+            if backend == 'filesystem':
+                store = FilesystemKeyStore(config[1], layout=config[2])
+            elif backend == 'sqlite':
+                store = SQLiteKeyStore(config[1])
+            elif backend == 'packfile':
+                store = PackFileKeyStore(config[1], max_pack_size=config[2], ttl=config[3])
+            else:
+                store = MemoryKeyStore(ttl=config[1], max_keys=config[2])
+            if backend != 'memory' and config[-1] is not None:
+                store.index = _get_index(config[-1])
+            _stores[config] = store
+        return store
+
+def _get_index(path):
+    """Return the shared index for a path. Caller holds the lock."""
+    index = _indexes.get(path)
+    if index is None:
+        index = _indexes[path] = KeyIndex(path)
+    return index
+
+def get_key_index():
+    """Return the metadata index, or None when KEY_INDEX is disabled
+
+    The index lives in KEY_INDEX_PATH (default KEY_STORAGE_PATH/index.db).
+    """
+    path = _index_path()
+    if path is None:
+        return None
+    with _stores_lock:
+        return _get_index(path)
@@ -0,0 +1,135 @@
+import time
+import uuid
+import logging
+from abc import ABC, abstractmethod
+from utils.metrics import STORAGE_WRITE_DURATION, STORAGE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Key types every backend accepts
+KEY_TYPES = ('ssh', 'rsa', 'pgp')
+
+
+def new_record(key_id, private_key, public_key, key_type, comment='', metadata=None):
+    """Build the record dict passed between the write paths and the backends"""
+    return {
+        'keyId': key_id,
+        'keyType': key_type,
+        'comment': comment or '',
+        'privateKey': private_key,
+        'publicKey': public_key,
+        'createdAt': time.time(),
+        'metadata': metadata or {}
+    }
+
+
+class KeyStore(ABC):
+    """Interface for persisting generated key pairs.
+
+    Every key pair is written through exactly one ``put`` (or ``put_many``)
+    call. Backends identify stored pairs by a string key ID that callers
+    treat as opaque and hand back to clients as the storage handle.
+
+    When a ``KeyIndex`` is attached, every write and delete is mirrored into
+    it. Index failures are logged and never fail the write itself.
+    """
+
+    #: Backend name as used by KEY_STORE_BACKEND
+    name = None
+
+    #: Metadata index kept in step with writes, or None
+    index = None
+
+    def new_key_id(self, key_type, comment=''):
+        """Allocate a key ID before the pair is written"""
+        return uuid.uuid4().hex
+
+    def put(self, private_key, public_key, key_type, comment='', key_id=None, metadata=None):
+        """
+        Store a key pair.
+
+        Args:
+            private_key (str): Private key content
+            public_key (str): Public key content
+            key_type (str): Type of key ('ssh', 'rsa', 'pgp')
+            comment (str): Optional comment used for naming
+            key_id (str): Pre-allocated key ID from ``new_key_id``
+            metadata (dict): Optional index fields known to the generator
+
+        Returns:
+            dict: storageHandle plus backend-specific location fields
+        """
+        if key_type not in KEY_TYPES:
+            raise ValueError("Invalid key type. Must be one of: ssh, rsa, pgp")
+        if key_id is None:
+            key_id = self.new_key_id(key_type, comment)
+        record = new_record(key_id, private_key, public_key, key_type, comment, metadata)
+        self._timed_write([record], durable=False)
+        self._index(records=[record])
+        return self.describe(key_id)
+
+    def put_many(self, records):
+        """Store several records built with ``new_record`` with one durable flush"""
+        for record in records:
+            if record['keyType'] not in KEY_TYPES:
+                raise ValueError("Invalid key type. Must be one of: ssh, rsa, pgp")
+        self._timed_write(records, durable=True)
+        self._index(records=records)
+
+    def delete(self, key_id):
+        """Delete a stored key pair; returns True if it existed"""
+        try:
+            existed = self._delete(key_id)
+        except Exception:
+            STORAGE_ERRORS.labels(self.name, 'delete').inc()
+            raise
+        self._index(removed=key_id)
+        return existed
+
+    def describe(self, key_id):
+        """Return the storage handle and location fields for a key ID"""
+        return {'storageHandle': key_id}
+
+    def _timed_write(self, records, durable):
+        """Run ``_write`` and record its latency, or count the failure"""
+        start = time.perf_counter()
+        try:
+            self._write(records, durable)
+        except Exception:
+            STORAGE_ERRORS.labels(self.name, 'write').inc()
+            raise
+        STORAGE_WRITE_DURATION.labels(self.name, 'batch' if durable else 'single').observe(
+            time.perf_counter() - start
+        )
+
+    def _index(self, records=(), removed=None):
+        if self.index is None:
+            return
+        try:
+            if records:
+                self.index.add(self.name, records)
+            if removed is not None:
+                self.index.remove(removed)
+        except Exception as e:
+            STORAGE_ERRORS.labels(self.name, 'index').inc()
+            logger.error(f"Failed to update the key index: {str(e)}")
+
+    @abstractmethod
+    def _write(self, records, durable):
+        """Write records; ``durable`` asks for an fsync before returning"""
+
+    @abstractmethod
+    def get(self, key_id):
+        """Return the stored record for a key ID, or None"""
+
+    @abstractmethod
+    def exists(self, key_id):
+        """Check whether a key ID has been stored"""
+
+    @abstractmethod
+    def _delete(self, key_id):
+        """Delete a stored key pair; returns True if it existed"""
+
+    @abstractmethod
+    def iter_key_ids(self):
+        """Yield the key ID of every stored key pair"""
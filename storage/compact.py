@@ -0,0 +1,33 @@
+"""Compact the pack-file key store, dropping deleted and expired records.
+
+Usage:
+    python -m storage.compact
+
+Reads the same configuration as the service (KEY_STORE_BACKEND=packfile,
+KEY_STORE_PACK_PATH, KEY_STORE_PACK_TTL, ...). Safe to run while the
+service is writing; appends wait for the compaction to finish.
+"""
+import sys
+import argparse
+from . import get_keystore
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args(argv)
+
+    store = get_keystore()
+    if store.name != 'packfile':
+        print(f"KEY_STORE_BACKEND is {store.name}; compaction only applies to packfile", file=sys.stderr)
+        return 1
+    stats = store.compact()
+    print(
+        f"kept {stats['live']} records, dropped {stats['dropped']}; "
+        f"{stats['packsBefore']} packs ({stats['bytesBefore']} bytes) -> "
+        f"{stats['packsAfter']} packs ({stats['bytesAfter']} bytes) in {store.pack_dir}"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import os
+import re
+import uuid
+from utils.sanitize import sanitize_comment
+from utils.utils import get_output_directory, save_key_pair
+from .base import KeyStore, KEY_TYPES
+from .layout import LAYOUT_FLAT, LAYOUT_SHARDED, LAYOUTS, key_directory
+
+# Filesystem key IDs look like '<key type>/<directory name>/<file id>'
+KEY_ID_REGEX = re.compile(r'^(ssh|rsa|pgp)/([\w-][\w.-]*)/([0-9a-f]{8})$')
+
+
+def _write_file(path, content, mode):
+    """Write a file atomically with the given mode and fsync it"""
+    tmp_path = f'{path}.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        os.fchmod(fd, mode)
+        os.write(fd, content.encode('utf-8'))
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
+
+
+def _fsync_directory(dir_path):
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FilesystemKeyStore(KeyStore):
+    """Stores key pairs as files under ``<base>/<type>/<comment or uuid>/``.
+
+    With the sharded layout the key directory sits below two levels of
+    hash-prefix directories (see ``storage.layout``). Key IDs do not depend
+    on the layout; reads also look in the other layout so a tree can be
+    migrated while the service is running.
+
+    Directories are 0700, private keys 0600 and public keys 0644. The public
+    key file is written last, so its presence marks a complete pair.
+    """
+
+    name = 'filesystem'
+
+    def __init__(self, base_path, layout=LAYOUT_FLAT):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Invalid storage layout. Must be one of: {', '.join(LAYOUTS)}")
+        self.base_path = base_path
+        self.layout = layout
+        self._fallback_layout = LAYOUT_FLAT if layout == LAYOUT_SHARDED else LAYOUT_SHARDED
+
+    def _directory_name(self, comment):
+        # Directory names are limited to 40 characters by get_output_directory
+        name = sanitize_comment(comment or '')[:40]
+        if name in ('', '.', '..'):
+            return str(uuid.uuid4())
+        return name
+
+    def _parse(self, key_id, layout=None):
+        """Return (directory, file id) for a key ID, or None if it is malformed"""
+        match = KEY_ID_REGEX.match(key_id or '')
+        if not match or match.group(2) in ('.', '..'):
+            return None
+        key_type, dir_name, file_id = match.groups()
+        return key_directory(self.base_path, key_type, dir_name, layout or self.layout), file_id
+
+    def _paths(self, key_id, layout=None):
+        """Return (directory, private path, public path) for a key ID, or None"""
+        parsed = self._parse(key_id, layout)
+        if parsed is None:
+            return None
+        dir_path, file_id = parsed
+        return (
+            dir_path,
+            os.path.join(dir_path, f'{file_id}.private'),
+            os.path.join(dir_path, f'{file_id}.public')
+        )
+
+    def _find(self, key_id):
+        """Return the paths of a stored key ID, checking the configured layout first"""
+        paths = self._paths(key_id)
+        if paths is None or os.path.exists(paths[2]):
+            return paths
+        fallback = self._paths(key_id, self._fallback_layout)
+        return fallback if os.path.exists(fallback[2]) else paths
+
+    def new_key_id(self, key_type, comment=''):
+        dir_path = get_output_directory(key_type, self._directory_name(comment), self.base_path)
+        return f'{key_type}/{os.path.basename(dir_path)}/{str(uuid.uuid4())[:8]}'
+
+    def describe(self, key_id):
+        dir_path, private_path, public_path = self._paths(key_id)
+        return {
+            'storageHandle': key_id,
+            'directory': dir_path,
+            'privatePath': private_path,
+            'publicPath': public_path
+        }
+
+    def _write(self, records, durable):
+        if not durable:
+            for record in records:
+                dir_path, file_id = self._parse(record['keyId'])
+                os.makedirs(dir_path, mode=0o700, exist_ok=True)
+                os.chmod(dir_path, 0o700)
+                save_key_pair(record['privateKey'], record['publicKey'], dir_path,
+                              record['keyType'], key_id=file_id)
+            return
+
+        # Group by directory so each one is created and fsynced once per batch
+        directories = {}
+        for record in records:
+            dir_path, private_path, public_path = self._paths(record['keyId'])
+            directories.setdefault(dir_path, []).append((record, private_path, public_path))
+
+        for dir_path, entries in directories.items():
+            os.makedirs(dir_path, mode=0o700, exist_ok=True)
+            os.chmod(dir_path, 0o700)
+            for record, private_path, public_path in entries:
+                _write_file(private_path, record['privateKey'], 0o600)
+                _write_file(public_path, record['publicKey'], 0o644)
+            _fsync_directory(dir_path)
+
+    def get(self, key_id):
+        paths = self._find(key_id)
+        if paths is None:
+            return None
+        dir_path, private_path, public_path = paths
+        try:
+            with open(private_path) as f:
+                private_key = f.read()
+            with open(public_path) as f:
+                public_key = f.read()
+            created_at = os.path.getmtime(public_path)
+        except FileNotFoundError:
+            return None
+        return {
+            'keyId': key_id,
+            'keyType': key_id.split('/', 1)[0],
+            'comment': os.path.basename(dir_path),
+            'privateKey': private_key,
+            'publicKey': public_key,
+            'createdAt': created_at
+        }
+
+    def exists(self, key_id):
+        paths = self._find(key_id)
+        return paths is not None and os.path.exists(paths[2])
+
+    def _delete(self, key_id):
+        paths = self._find(key_id)
+        if paths is None:
+            return False
+        existed = False
+        for path in paths[1:]:
+            try:
+                os.remove(path)
+                existed = True
+            except FileNotFoundError:
+                pass
+        return existed
+
+    def iter_key_ids(self):
+        for key_type in KEY_TYPES:
+            for root, _, files in os.walk(os.path.join(self.base_path, key_type)):
+                dir_name = os.path.basename(root)
+                for name in files:
+                    if not name.endswith('.public'):
+                        continue
+                    key_id = f'{key_type}/{dir_name}/{name[:-len(".public")]}'
+                    if KEY_ID_REGEX.match(key_id):
+                        yield key_id
@@ -0,0 +1,219 @@
+import os
+import json
+import base64
+import sqlite3
+import threading
+from .metadata import key_metadata
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS key_index (
+        key_id TEXT PRIMARY KEY,
+        backend TEXT NOT NULL,
+        key_type TEXT NOT NULL,
+        algorithm TEXT,
+        key_size INTEGER,
+        comment TEXT NOT NULL DEFAULT '',
+        fingerprint TEXT,
+        pgp_key_id TEXT,
+        email TEXT,
+        expires_at TEXT,
+        created_at REAL NOT NULL
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS key_index_created ON key_index (created_at, key_id)',
+    'CREATE INDEX IF NOT EXISTS key_index_type ON key_index (key_type, created_at, key_id)',
+    'CREATE INDEX IF NOT EXISTS key_index_comment ON key_index (comment, created_at, key_id)',
+    'CREATE INDEX IF NOT EXISTS key_index_fingerprint ON key_index (fingerprint)',
+    'CREATE INDEX IF NOT EXISTS key_index_pgp_key_id ON key_index (pgp_key_id)',
+    'CREATE INDEX IF NOT EXISTS key_index_email ON key_index (email, created_at, key_id)',
+    'CREATE INDEX IF NOT EXISTS key_index_expires ON key_index (expires_at)'
+)
+
+COLUMNS = (
+    'key_id', 'backend', 'key_type', 'algorithm', 'key_size', 'comment', 'fingerprint',
+    'pgp_key_id', 'email', 'expires_at', 'created_at'
+)
+
+# Response field for every column
+FIELDS = (
+    'storageHandle', 'backend', 'keyType', 'algorithm', 'keySize', 'comment', 'fingerprint',
+    'pgpKeyId', 'email', 'expiresAt', 'createdAt'
+)
+
+# Search filter -> SQL condition
+FILTERS = {
+    'keyType': 'key_type = ?',
+    'algorithm': 'algorithm = ?',
+    'keySize': 'key_size = ?',
+    'comment': 'comment = ?',
+    'fingerprint': 'fingerprint = ?',
+    'pgpKeyId': 'pgp_key_id = ?',
+    'email': 'email = ?',
+    'createdAfter': 'created_at >= ?',
+    'createdBefore': 'created_at < ?',
+    'expiresBefore': 'expires_at < ?'
+}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def _encode_cursor(created_at, key_id):
+    raw = json.dumps([created_at, key_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    try:
+        created_at, key_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(created_at), str(key_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+class KeyIndex:
+    """SQLite catalog of stored key pairs, without the key material.
+
+    Every key store write adds a row with the key's type, algorithm, size,
+    comment, fingerprint, PGP key ID/email/expiry and creation time, so
+    listing and searching keys are index seeks instead of directory scans. The database file is 0600 and opened in WAL mode.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connection()
+
+    def _create(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, mode=0o700, exist_ok=True)
+        # Create the file with restricted permissions before SQLite opens it
+        fd = os.open(self.db_path, os.O_RDWR | os.O_CREAT, 0o600)
+        os.close(fd)
+        os.chmod(self.db_path, 0o600)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # The index is derived data; if its file was removed, start a new one
+        if (conn is None or getattr(self._local, 'pid', None) != os.getpid()
+                or not os.path.exists(self.db_path)):
+            if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+                conn.close()
+            self._create()
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def add(self, backend, records):
+        """
+        Index stored records.
+
+        Args:
+            backend (str): Name of the key store holding the records
+            records (list): Records built with ``new_record``
+        """
+        rows = []
+        for record in records:
+            metadata = key_metadata(record['keyType'], record['publicKey'], record.get('metadata'))
+            rows.append((
+                record['keyId'], backend, record['keyType'], metadata['algorithm'],
+                metadata['keySize'], record['comment'], metadata['fingerprint'],
+                metadata['pgpKeyId'], metadata['email'], metadata['expiresAt'],
+                record['createdAt']
+            ))
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO key_index ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows
+            )
+
+    def remove(self, key_id):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM key_index WHERE key_id = ?', (key_id,))
+
+    def get(self, key_id):
+        """Return the indexed metadata for a key ID, or None"""
+        row = self._connection().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM key_index WHERE key_id = ?", (key_id,)
+        ).fetchone()
+        return dict(zip(FIELDS, row)) if row is not None else None
+
+    def search(self, filters=None, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """
+        List indexed keys, newest first.
+
+        Pages are addressed by an opaque cursor (keyset pagination), so
+        deep pages cost the same index seek as the first one.
+
+        Args:
+            filters (dict): Exact-match filters, keys from ``FILTERS``
+            limit (int): Page size, at most MAX_PAGE_SIZE
+            cursor (str): ``nextCursor`` of the previous page
+
+        Returns:
+            dict: keys (list of metadata dicts) and nextCursor (None on the last page)
+
+        Raises:
+            ValueError: On unknown filters, bad limits or cursors
+        """
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"Limit must be between 1 and {MAX_PAGE_SIZE}")
+
+        conditions = []
+        params = []
+        for name, value in (filters or {}).items():
+            if name not in FILTERS:
+                raise ValueError(f"Invalid filter. Must be one of: {', '.join(FILTERS)}")
+            conditions.append(FILTERS[name])
+            params.append(value)
+        if cursor:
+            created_at, key_id = _decode_cursor(cursor)
+            conditions.append('(created_at < ? OR (created_at = ? AND key_id < ?))')
+            params.extend([created_at, created_at, key_id])
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = self._connection().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM key_index {where} "
+            'ORDER BY created_at DESC, key_id DESC LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+
+        keys = [dict(zip(FIELDS, row)) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = _encode_cursor(keys[-1]['createdAt'], keys[-1]['storageHandle'])
+        return {'keys': keys, 'nextCursor': next_cursor}
+
+    def rebuild(self, store):
+        """
+        Re-index every key pair held by a store.
+
+        Returns:
+            int: Number of key pairs indexed
+        """
+        count = 0
+        batch = []
+        for key_id in store.iter_key_ids():
+            record = store.get(key_id)
+            if record is None:
+                continue
+            batch.append(record)
+            if len(batch) >= 500:
+                self.add(store.name, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.add(store.name, batch)
+            count += len(batch)
+        return count
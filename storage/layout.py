@@ -0,0 +1,174 @@
+import os
+import re
+import hashlib
+
+# Directory layouts for the filesystem key store
+LAYOUT_FLAT = 'flat'
+LAYOUT_SHARDED = 'sharded'
+LAYOUTS = (LAYOUT_FLAT, LAYOUT_SHARDED)
+
+# Shard directories are '+' and two hex digits. Key directory names are
+# sanitized comments or uuids and never contain '+', so the two cannot collide.
+SHARD_MARKER = '+'
+SHARD_REGEX = re.compile(r'^\+[0-9a-f]{2}$')
+# Directories generate_ssh_key used to create directly under KEY_STORAGE_PATH
+LEGACY_SSH_REGEX = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+def shard_prefix(dir_name):
+    """Return the two hash-prefix shard directory names for a key directory name"""
+    digest = hashlib.sha256(dir_name.encode('utf-8')).hexdigest()
+    return SHARD_MARKER + digest[:2], SHARD_MARKER + digest[2:4]
+
+
+def key_directory(base_path, key_type, dir_name, layout=LAYOUT_FLAT):
+    """
+    Return the path of a key directory under the given layout.
+
+    flat:    <base>/<type>/<dir name>
+    sharded: <base>/<type>/+<h0h1>/+<h2h3>/<dir name>, h = sha256(dir name)
+
+    Args:
+        base_path (str): Storage root
+        key_type (str): Type of key ('ssh', 'rsa', 'pgp')
+        dir_name (str): Comment or uuid naming the key directory
+        layout (str): 'flat' or 'sharded'
+
+    Returns:
+        str: Path of the key directory
+    """
+    if layout == LAYOUT_SHARDED:
+        first, second = shard_prefix(dir_name)
+        return os.path.join(base_path, key_type, first, second, dir_name)
+    if layout == LAYOUT_FLAT:
+        return os.path.join(base_path, key_type, dir_name)
+    raise ValueError(f"Invalid storage layout. Must be one of: {', '.join(LAYOUTS)}")
+
+
+def _is_shard_directory(path):
+    """Shard directories are told apart from key directories by their name"""
+    return bool(SHARD_REGEX.match(os.path.basename(path)))
+
+
+def _move_directory(source, target):
+    """Move a key directory, merging into the target if it already exists"""
+    os.makedirs(os.path.dirname(target), mode=0o700, exist_ok=True)
+    try:
+        os.rename(source, target)
+        return
+    except OSError:
+        if not os.path.isdir(target):
+            raise
+    # Keys were already written under the new layout; move file by file
+    for name in os.listdir(source):
+        os.rename(os.path.join(source, name), os.path.join(target, name))
+    os.rmdir(source)
+
+
+def _iter_flat(type_path):
+    for entry in os.scandir(type_path):
+        if entry.is_dir(follow_symlinks=False) and not _is_shard_directory(entry.path):
+            yield entry.name, entry.path
+
+
+def _iter_sharded(type_path):
+    for first in os.scandir(type_path):
+        if not first.is_dir(follow_symlinks=False) or not _is_shard_directory(first.path):
+            continue
+        for second in os.scandir(first.path):
+            if not second.is_dir(follow_symlinks=False) or not _is_shard_directory(second.path):
+                continue
+            for entry in os.scandir(second.path):
+                if entry.is_dir(follow_symlinks=False):
+                    yield entry.name, entry.path
+
+
+def _iter_legacy_ssh(base_path):
+    for entry in os.scandir(base_path):
+        if not entry.is_dir(follow_symlinks=False) or not LEGACY_SSH_REGEX.match(entry.name):
+            continue
+        with os.scandir(entry.path) as files:
+            # Renamed key files remain if an earlier run stopped before the move
+            if any(f.name.startswith('id_') or f.name.endswith('.public') for f in files):
+                yield entry.name, entry.path
+
+
+def _rename_legacy_files(dir_path):
+    """
+    Rename ``id_<type>`` / ``id_<type>.pub`` pairs to the store's
+    ``<file id>.private`` / ``<file id>.public`` names. The file id is derived
+    from the file name, so an interrupted rename can be re-run.
+    """
+    for name in os.listdir(dir_path):
+        if not name.startswith('id_') or name.endswith('.pub') or name.endswith('.tmp'):
+            continue
+        file_id = hashlib.sha256(name.encode('utf-8')).hexdigest()[:8]
+        private_path = os.path.join(dir_path, name)
+        os.chmod(private_path, 0o600)
+        os.rename(private_path, os.path.join(dir_path, f'{file_id}.private'))
+        # The public key is renamed last: its presence marks a complete pair
+        public_path = f'{private_path}.pub'
+        if os.path.exists(public_path):
+            os.rename(public_path, os.path.join(dir_path, f'{file_id}.public'))
+
+
+def migrate(base_path, layout, key_types=('ssh', 'rsa', 'pgp'), dry_run=False, progress=None):
+    """
+    Re-shard an existing key tree in place.
+
+    Key directories already in the target layout are left alone, so the
+    migration can be interrupted and re-run, and may run while the service
+    keeps writing. Legacy ``<base>/<uuid>/id_*`` directories left by older
+    versions of generate_ssh_key are moved under ``ssh/`` as well, with their
+    key files renamed so the store can read them.
+
+    Args:
+        base_path (str): Storage root
+        layout (str): Target layout, 'flat' or 'sharded'
+        key_types (tuple): Key type subdirectories to migrate
+        dry_run (bool): Only count what would move
+        progress (callable): Optional callback(moved count)
+
+    Returns:
+        int: Number of key directories moved
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Invalid storage layout. Must be one of: {', '.join(LAYOUTS)}")
+
+    moved = 0
+    if 'ssh' in key_types and os.path.isdir(base_path):
+        for dir_name, source in list(_iter_legacy_ssh(base_path)):
+            if not dry_run:
+                _rename_legacy_files(source)
+                _move_directory(source, key_directory(base_path, 'ssh', dir_name, layout))
+            moved += 1
+            if progress is not None:
+                progress(moved)
+
+    for key_type in key_types:
+        type_path = os.path.join(base_path, key_type)
+        if not os.path.isdir(type_path):
+            continue
+
+        source_entries = _iter_flat if layout == LAYOUT_SHARDED else _iter_sharded
+        # Materialise the listing first so moves do not disturb iteration
+        for dir_name, source in list(source_entries(type_path)):
+            target = key_directory(base_path, key_type, dir_name, layout)
+            if source == target:
+                continue
+            if not dry_run:
+                _move_directory(source, target)
+            moved += 1
+            if progress is not None:
+                progress(moved)
+
+        if layout == LAYOUT_FLAT and not dry_run:
+            # Drop the now empty shard directories
+            for first in list(os.scandir(type_path)):
+                if first.is_dir(follow_symlinks=False) and _is_shard_directory(first.path):
+                    for second in list(os.scandir(first.path)):
+                        if not any(os.scandir(second.path)):
+                            os.rmdir(second.path)
+                    if not any(os.scandir(first.path)):
+                        os.rmdir(first.path)
+    return moved
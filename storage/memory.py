@@ -0,0 +1,55 @@
+import time
+import threading
+from collections import OrderedDict
+from .base import KeyStore
+
+
+class MemoryKeyStore(KeyStore):
+    """Keeps key pairs in process memory for ``ttl`` seconds.
+
+    Nothing touches the disk. At most ``max_keys`` pairs are held; the oldest
+    are evicted first. Data is per process and lost on restart.
+    """
+
+    name = 'memory'
+
+    def __init__(self, ttl=3600, max_keys=10000):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        """Drop expired records from the front of the queue. Caller holds the lock."""
+        while self._records:
+            key_id, record = next(iter(self._records.items()))
+            if now - record['createdAt'] <= self.ttl:
+                break
+            del self._records[key_id]
+
+    def _write(self, records, durable):
+        with self._lock:
+            self._expire(time.time())
+            for record in records:
+                self._records[record['keyId']] = dict(record)
+            while len(self._records) > self.max_keys:
+                self._records.popitem(last=False)
+
+    def get(self, key_id):
+        with self._lock:
+            self._expire(time.time())
+            record = self._records.get(key_id)
+            return dict(record) if record is not None else None
+
+    def exists(self, key_id):
+        return self.get(key_id) is not None
+
+    def _delete(self, key_id):
+        with self._lock:
+            return self._records.pop(key_id, None) is not None
+
+    def iter_key_ids(self):
+        with self._lock:
+            self._expire(time.time())
+            key_ids = list(self._records)
+        return iter(key_ids)
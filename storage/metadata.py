@@ -0,0 +1,185 @@
+import re
+import base64
+import hashlib
+import logging
+from datetime import datetime, timezone
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+logger = logging.getLogger(__name__)
+
+# OpenPGP public key algorithm IDs (RFC 4880 section 9.1, RFC 6637)
+PGP_ALGORITHMS = {
+    '1': 'RSA',
+    '16': 'ELG',
+    '17': 'DSA',
+    '18': 'ECDH',
+    '19': 'ECDSA',
+    '22': 'EDDSA'
+}
+
+# OpenPGP packet tags and the key expiration subpacket (RFC 4880 sections 4.3, 5.2.3.6)
+PGP_TAG_SIGNATURE = 2
+PGP_TAG_PUBLIC_KEY = 6
+PGP_TAG_USER_ID = 13
+PGP_SUBPACKET_KEY_EXPIRATION = 9
+
+# Curve OID -> key size, sized like the SSH keys (Ed25519 and Cv25519 count as 256)
+PGP_CURVE_SIZES = {
+    bytes.fromhex('2a8648ce3d030107'): 256,
+    bytes.fromhex('2b81040022'): 384,
+    bytes.fromhex('2b81040023'): 521,
+    bytes.fromhex('2b8104000a'): 256,
+    bytes.fromhex('2b2403030208010107'): 256,
+    bytes.fromhex('2b240303020801010b'): 384,
+    bytes.fromhex('2b240303020801010d'): 512,
+    bytes.fromhex('2b06010401da470f01'): 256,
+    bytes.fromhex('2b060104019755010501'): 256
+}
+
+EMAIL_IN_UID_REGEX = re.compile(r'<([^<>]+)>\s*$')
+
+METADATA_FIELDS = ('algorithm', 'keySize', 'fingerprint', 'pgpKeyId', 'email', 'expiresAt')
+
+
+def _sha256_fingerprint(blob):
+    """OpenSSH-style SHA256 fingerprint of a public key blob"""
+    digest = base64.b64encode(hashlib.sha256(blob).digest()).decode('ascii')
+    return f"SHA256:{digest.rstrip('=')}"
+
+
+def _key_size(public_key):
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return public_key.key_size
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        return public_key.curve.key_size
+    # Ed25519
+    return 256
+
+
+def _ssh_metadata(public_key):
+    algorithm, blob = public_key.split()[:2]
+    key = serialization.load_ssh_public_key(f'{algorithm} {blob}'.encode('ascii'))
+    return {
+        'algorithm': algorithm,
+        'keySize': _key_size(key),
+        'fingerprint': _sha256_fingerprint(base64.b64decode(blob))
+    }
+
+
+def _rsa_metadata(public_key):
+    key = serialization.load_pem_public_key(public_key.encode('ascii'))
+    der = key.public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return {
+        'algorithm': 'RSA',
+        'keySize': key.key_size,
+        'fingerprint': _sha256_fingerprint(der)
+    }
+
+
+def _pgp_subpackets(data):
+    """Yield (type, body) for each subpacket of a signature subpacket area"""
+    pos = 0
+    while pos < len(data):
+        first = data[pos]
+        if first < 192:
+            length, pos = first, pos + 1
+        elif first < 255:
+            length, pos = ((first - 192) << 8) + data[pos + 1] + 192, pos + 2
+        else:
+            length, pos = int.from_bytes(data[pos + 1:pos + 5], 'big'), pos + 5
+        if length:
+            yield data[pos] & 0x7F, data[pos + 1:pos + length]
+        pos += length
+
+
+def _pgp_metadata(public_key):
+    """Read PGP metadata from the primary key, user ID and self-signature packets"""
+    # Imported lazily: the generators package depends on storage, not the reverse
+    from generators.openpgp import dearmor, read_packets
+    primary = None
+    email = None
+    expires = None
+    in_user_id = False
+    for tag, body in read_packets(dearmor(public_key)):
+        if tag == PGP_TAG_PUBLIC_KEY and primary is None:
+            if body[0] != 4:
+                raise ValueError("Only v4 keys are supported")
+            primary = body
+        elif tag == PGP_TAG_USER_ID and email is None:
+            match = EMAIL_IN_UID_REGEX.search(body.decode('utf-8', 'replace'))
+            email = match.group(1) if match else None
+            in_user_id = True
+            continue
+        elif tag == PGP_TAG_SIGNATURE and in_user_id and body[0] == 4 and expires is None:
+            # The key expiration time lives in the user ID self-signature
+            hashed_length = int.from_bytes(body[4:6], 'big')
+            for kind, value in _pgp_subpackets(body[6:6 + hashed_length]):
+                if kind == PGP_SUBPACKET_KEY_EXPIRATION:
+                    expires = int.from_bytes(value, 'big') or None
+            continue
+        in_user_id = False
+    if primary is None:
+        return {}
+
+    created = int.from_bytes(primary[1:5], 'big')
+    algorithm = primary[5]
+    if algorithm == 1:
+        key_size = int.from_bytes(primary[6:8], 'big')
+    else:
+        key_size = PGP_CURVE_SIZES.get(primary[7:7 + primary[6]])
+    # v4 fingerprint: SHA-1 over the public key packet with an old-format header
+    fingerprint = hashlib.sha1(b'\x99' + len(primary).to_bytes(2, 'big') + primary).hexdigest()
+    return {
+        'algorithm': PGP_ALGORITHMS.get(str(algorithm), str(algorithm)),
+        'keySize': key_size,
+        'fingerprint': fingerprint,
+        'email': email,
+        'expiresAt': (
+            datetime.fromtimestamp(created + expires, tz=timezone.utc).strftime('%Y-%m-%d')
+            if expires else None
+        )
+    }
+
+
+def key_metadata(key_type, public_key, known=None):
+    """
+    Describe a public key for the metadata index.
+
+    Values already known to the generator (``known``) are used as they are;
+    the rest is derived from the public key. PGP keys are read from their
+    packets, so a key indexed at generation time and the same key re-indexed
+    later get the same algorithm and size.
+
+    Args:
+        key_type (str): Type of key ('ssh', 'rsa', 'pgp')
+        public_key (str): Public key content
+        known (dict): Optional metadata fields from the generator
+
+    Returns:
+        dict: algorithm, keySize, fingerprint, pgpKeyId, email and expiresAt;
+        fields that cannot be determined are None
+    """
+    metadata = dict.fromkeys(METADATA_FIELDS)
+    known = {k: v for k, v in (known or {}).items() if v is not None}
+    try:
+        if key_type == 'ssh':
+            metadata.update(_ssh_metadata(public_key))
+        elif key_type == 'rsa':
+            metadata.update(_rsa_metadata(public_key))
+        elif key_type == 'pgp':
+            metadata.update(_pgp_metadata(public_key))
+    except Exception as e:
+        logger.warning(f"Could not read {key_type} key metadata: {str(e)}")
+    metadata.update(known)
+
+    if key_type == 'pgp' and metadata['fingerprint']:
+        metadata['fingerprint'] = metadata['fingerprint'].upper()
+        # The long key ID is the low 64 bits of a v4 fingerprint
+        metadata['pgpKeyId'] = metadata['fingerprint'][-16:]
+    if metadata['email']:
+        metadata['email'] = metadata['email'].lower()
+    return metadata
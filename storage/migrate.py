@@ -0,0 +1,40 @@
+"""Re-shard an existing filesystem key tree in place.
+
+Usage:
+    python -m storage.migrate --layout sharded [--base-path keys] [--dry-run]
+
+Run it before (or while) switching KEY_STORAGE_LAYOUT; the filesystem store
+resolves keys in either layout, so the service can keep running.
+"""
+import os
+import sys
+import argparse
+from .base import KEY_TYPES
+from .layout import LAYOUTS, migrate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--layout', choices=LAYOUTS, default=os.getenv('KEY_STORAGE_LAYOUT', 'sharded'),
+                        help='target layout')
+    parser.add_argument('--base-path', default=os.getenv('KEY_STORAGE_PATH', 'keys'),
+                        help='storage root, defaults to KEY_STORAGE_PATH')
+    parser.add_argument('--dry-run', action='store_true', help='only count directories to move')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.base_path):
+        print(f"Storage path does not exist: {args.base_path}", file=sys.stderr)
+        return 1
+
+    def progress(moved):
+        if moved % 10000 == 0:
+            print(f"{moved} directories moved", file=sys.stderr)
+
+    moved = migrate(args.base_path, args.layout, KEY_TYPES, dry_run=args.dry_run, progress=progress)
+    verb = 'would move' if args.dry_run else 'moved'
+    print(f"{verb} {moved} key directories to the {args.layout} layout under {args.base_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
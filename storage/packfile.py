@@ -0,0 +1,403 @@
+import os
+import re
+import json
+import time
+import zlib
+import fcntl
+import struct
+import threading
+from contextlib import contextmanager
+from .base import KeyStore
+
+# Pack record: magic, kind, payload length, CRC-32 of the payload
+RECORD_HEADER = struct.Struct('>4sBII')
+RECORD_MAGIC = b'KPK1'
+# Index entry: raw key ID, kind, record offset, record length
+INDEX_ENTRY = struct.Struct('>16sBQI')
+
+KIND_PUT = 0
+KIND_DELETE = 1
+
+KEY_ID_REGEX = re.compile(r'^[0-9a-f]{32}$')
+PACK_NAME_REGEX = re.compile(r'^pack-(\d{8})\.pack$')
+
+# Record fields written to the pack; index metadata is not duplicated here
+RECORD_FIELDS = ('keyId', 'keyType', 'comment', 'privateKey', 'publicKey', 'createdAt')
+
+
+def _encode(kind, payload):
+    return RECORD_HEADER.pack(RECORD_MAGIC, kind, len(payload), zlib.crc32(payload)) + payload
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _fsync_directory(dir_path):
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class PackFileKeyStore(KeyStore):
+    """Appends key pairs to size-rotated pack files.
+
+    Each pack ``pack-<seq>.pack`` is a sequence of CRC-checked records and
+    has a sidecar ``pack-<seq>.idx`` of fixed-size (key ID, offset, length)
+    entries. The idx files are loaded into memory, so reads by key ID are a
+    single ``pread``. Deletes append tombstones; ``compact`` rewrites the
+    live records into new packs and drops deleted and expired ones.
+
+    Appends from all processes are serialised with ``flock`` on
+    ``<pack dir>/.lock``. A durable batch costs one fsync of the active
+    pack. The idx files are not fsynced: they are rebuilt from the packs if
+    they fall behind after a crash. Pack files are 0600 in a 0700 directory.
+    """
+
+    name = 'packfile'
+
+    def __init__(self, pack_dir, max_pack_size=64 * 1024 * 1024, ttl=0):
+        self.pack_dir = pack_dir
+        self.max_pack_size = max_pack_size
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._lock_fd = None
+        self._pid = None
+        self._fds = {}
+
+        os.makedirs(pack_dir, mode=0o700, exist_ok=True)
+        os.chmod(pack_dir, 0o700)
+        with self._exclusive():
+            self._recover()
+
+    def _pack_path(self, seq):
+        return os.path.join(self.pack_dir, f'pack-{seq:08d}.pack')
+
+    def _idx_path(self, seq):
+        return os.path.join(self.pack_dir, f'pack-{seq:08d}.idx')
+
+    def _check_pid(self):
+        """Reset per-process state in a new process. Caller holds the lock."""
+        if self._pid == os.getpid():
+            return
+        # A lock fd inherited across fork would share the parent's lock
+        self._lock_fd = os.open(os.path.join(self.pack_dir, '.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        self._pid = os.getpid()
+        self._fds = {}
+        self._reload()
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the process-wide and the cross-process append lock"""
+        with self._lock:
+            self._check_pid()
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _reload(self):
+        """Rebuild the in-memory index from every idx file. Caller holds the lock."""
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
+        self._entries = {}
+        self._ends = {}
+        self._idx_read = 0
+        self._seqs = sorted(
+            int(m.group(1)) for m in map(PACK_NAME_REGEX.match, os.listdir(self.pack_dir)) if m
+        )
+        for seq in self._seqs:
+            self._idx_read = self._load_idx(seq, 0)
+
+    def _load_idx(self, seq, start):
+        """Apply idx entries from byte ``start``; returns the bytes consumed"""
+        try:
+            with open(self._idx_path(seq), 'rb') as f:
+                f.seek(start)
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        end = self._ends.get(seq, 0)
+        for key, kind, offset, length in INDEX_ENTRY.iter_unpack(data[:usable]):
+            if kind == KIND_PUT:
+                self._entries[key] = (seq, offset)
+            else:
+                self._entries.pop(key, None)
+            end = max(end, offset + length)
+        self._ends[seq] = end
+        return start + usable
+
+    def _refresh(self):
+        """Pick up appends made by other processes. Caller holds the lock."""
+        self._check_pid()
+        if not self._seqs:
+            self._reload()
+            return
+
+        active = self._seqs[-1]
+        if not os.path.exists(self._pack_path(active)):
+            # Compacted away by another process
+            self._reload()
+            return
+        self._idx_read = self._load_idx(active, self._idx_read)
+        while os.path.exists(self._pack_path(self._seqs[-1] + 1)):
+            self._seqs.append(self._seqs[-1] + 1)
+            self._idx_read = self._load_idx(self._seqs[-1], 0)
+
+    def _scan_pack(self, seq):
+        """Read the valid records of a pack, truncating a torn tail"""
+        entries = []
+        path = self._pack_path(seq)
+        with open(path, 'r+b') as f:
+            data = f.read()
+            offset = 0
+            while offset + RECORD_HEADER.size <= len(data):
+                magic, kind, length, crc = RECORD_HEADER.unpack_from(data, offset)
+                start = offset + RECORD_HEADER.size
+                payload = data[start:start + length]
+                if magic != RECORD_MAGIC or len(payload) != length or zlib.crc32(payload) != crc:
+                    break
+                key = bytes.fromhex(json.loads(payload)['keyId'])
+                entries.append(INDEX_ENTRY.pack(key, kind, offset, RECORD_HEADER.size + length))
+                offset = start + length
+            if offset != len(data):
+                f.truncate(offset)
+        return entries
+
+    def _recover(self):
+        """Rebuild idx files that disagree with their pack. Caller holds the lock."""
+        rebuilt = False
+        for seq in self._seqs:
+            size = os.path.getsize(self._pack_path(seq))
+            if self._ends.get(seq, 0) == size:
+                continue
+            entries = self._scan_pack(seq)
+            tmp_path = f'{self._idx_path(seq)}.tmp'
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                _write_all(fd, b''.join(entries))
+            finally:
+                os.close(fd)
+            os.replace(tmp_path, self._idx_path(seq))
+            rebuilt = True
+        if rebuilt:
+            self._reload()
+
+    def _fd(self, seq):
+        fd = self._fds.get(seq)
+        if fd is None:
+            fd = self._fds[seq] = os.open(self._pack_path(seq), os.O_RDONLY)
+        return fd
+
+    def _append(self, items, durable):
+        """Append (kind, key, payload) items as one batch. Caller holds the exclusive lock."""
+        self._refresh()
+        if self._seqs and os.path.getsize(self._pack_path(self._seqs[-1])) != self._ends[self._seqs[-1]]:
+            # A writer crashed between appending to the pack and its idx
+            self._recover()
+
+        created = False
+        if not self._seqs or self._ends[self._seqs[-1]] >= self.max_pack_size:
+            self._seqs.append(self._seqs[-1] + 1 if self._seqs else 1)
+            self._ends[self._seqs[-1]] = 0
+            self._idx_read = 0
+            created = True
+        seq = self._seqs[-1]
+
+        offset = self._ends[seq]
+        records = bytearray()
+        entries = bytearray()
+        for kind, key, payload in items:
+            encoded = _encode(kind, payload)
+            entries += INDEX_ENTRY.pack(key, kind, offset + len(records), len(encoded))
+            records += encoded
+
+        fd = os.open(self._pack_path(seq), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            _write_all(fd, records)
+            if durable:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        if created and durable:
+            _fsync_directory(self.pack_dir)
+
+        fd = os.open(self._idx_path(seq), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            _write_all(fd, entries)
+        finally:
+            os.close(fd)
+        self._idx_read = self._load_idx(seq, self._idx_read)
+
+    def _key(self, key_id):
+        if not KEY_ID_REGEX.match(key_id or ''):
+            return None
+        return bytes.fromhex(key_id)
+
+    def _write(self, records, durable):
+        items = [
+            (KIND_PUT, bytes.fromhex(r['keyId']),
+             json.dumps({field: r[field] for field in RECORD_FIELDS}).encode('utf-8'))
+            for r in records
+        ]
+        with self._exclusive():
+            self._append(items, durable)
+
+    def _read(self, seq, offset):
+        fd = self._fd(seq)
+        magic, kind, length, crc = RECORD_HEADER.unpack(os.pread(fd, RECORD_HEADER.size, offset))
+        payload = os.pread(fd, length, offset + RECORD_HEADER.size)
+        if magic != RECORD_MAGIC or zlib.crc32(payload) != crc:
+            raise ValueError(f"Corrupt record at {self._pack_path(seq)}:{offset}")
+        return json.loads(payload)
+
+    def _expired(self, record, now):
+        return self.ttl > 0 and now - record['createdAt'] > self.ttl
+
+    def get(self, key_id):
+        key = self._key(key_id)
+        if key is None:
+            return None
+        with self._lock:
+            for _ in range(2):
+                self._refresh()
+                location = self._entries.get(key)
+                if location is None:
+                    return None
+                try:
+                    record = self._read(*location)
+                    break
+                except FileNotFoundError:
+                    # The pack was compacted away; reload and retry once
+                    self._reload()
+            else:
+                return None
+        return None if self._expired(record, time.time()) else record
+
+    def exists(self, key_id):
+        if self.ttl > 0:
+            return self.get(key_id) is not None
+        key = self._key(key_id)
+        if key is None:
+            return False
+        with self._lock:
+            self._refresh()
+            return key in self._entries
+
+    def _delete(self, key_id):
+        key = self._key(key_id)
+        if key is None:
+            return False
+        with self._exclusive():
+            self._refresh()
+            if key not in self._entries:
+                return False
+            self._append([(KIND_DELETE, key, json.dumps({'keyId': key_id}).encode('utf-8'))], durable=False)
+        return True
+
+    def iter_key_ids(self):
+        with self._lock:
+            self._refresh()
+            keys = list(self._entries)
+        return (key.hex() for key in keys)
+
+    def compact(self):
+        """
+        Rewrite live records into new packs, dropping deleted and expired ones.
+
+        New packs get higher sequence numbers than the old ones, which are
+        only removed, oldest first, once the new packs are synced. A crash
+        at any point leaves a readable store.
+
+        Returns:
+            dict: live and dropped record counts, packs and bytes before/after
+        """
+        with self._exclusive():
+            self._reload()
+            self._recover()
+            old_seqs = list(self._seqs)
+            bytes_before = sum(os.path.getsize(self._pack_path(seq)) for seq in old_seqs)
+            total = sum(
+                os.path.getsize(self._idx_path(seq)) // INDEX_ENTRY.size
+                for seq in old_seqs if os.path.exists(self._idx_path(seq))
+            )
+            now = time.time()
+            seq = old_seqs[-1] if old_seqs else 0
+            new_seqs = []
+            pack_fd = None
+            pack_size = 0
+            entries = bytearray()
+            live = 0
+            expired = []
+            try:
+                # Copy records in pack order so neighbouring keys stay together
+                for key, (old_seq, offset) in sorted(self._entries.items(), key=lambda item: item[1]):
+                    fd = self._fd(old_seq)
+                    magic, kind, length, crc = RECORD_HEADER.unpack(os.pread(fd, RECORD_HEADER.size, offset))
+                    encoded = os.pread(fd, RECORD_HEADER.size + length, offset)
+                    if self.ttl > 0 and self._expired(json.loads(encoded[RECORD_HEADER.size:]), now):
+                        expired.append(key.hex())
+                        continue
+                    if pack_fd is None or pack_size >= self.max_pack_size:
+                        if pack_fd is not None:
+                            self._seal(pack_fd, seq, entries)
+                        seq += 1
+                        new_seqs.append(seq)
+                        pack_fd = os.open(self._pack_path(seq), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                        pack_size = 0
+                        entries = bytearray()
+                    _write_all(pack_fd, encoded)
+                    entries += INDEX_ENTRY.pack(key, KIND_PUT, pack_size, len(encoded))
+                    pack_size += len(encoded)
+                    live += 1
+                if pack_fd is not None:
+                    self._seal(pack_fd, seq, entries)
+                    pack_fd = None
+            finally:
+                if pack_fd is not None:
+                    os.close(pack_fd)
+            _fsync_directory(self.pack_dir)
+            bytes_after = sum(os.path.getsize(self._pack_path(new_seq)) for new_seq in new_seqs)
+
+            # A put never sits in a later pack than its tombstone, so removing
+            # the oldest first cannot resurrect deleted keys after a crash
+            for old_seq in old_seqs:
+                for path in (self._idx_path(old_seq), self._pack_path(old_seq)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            self._reload()
+
+        for key_id in expired:
+            self._index(removed=key_id)
+        return {
+            'live': live,
+            'dropped': total - live,
+            'packsBefore': len(old_seqs),
+            'packsAfter': len(new_seqs),
+            'bytesBefore': bytes_before,
+            'bytesAfter': bytes_after
+        }
+
+    def _seal(self, pack_fd, seq, entries):
+        """Sync and close a pack written by ``compact`` and write its idx"""
+        try:
+            os.fsync(pack_fd)
+        finally:
+            os.close(pack_fd)
+        tmp_path = f'{self._idx_path(seq)}.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            _write_all(fd, entries)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, self._idx_path(seq))
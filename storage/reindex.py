@@ -0,0 +1,30 @@
+"""Rebuild the key metadata index from the configured key store.
+
+Usage:
+    python -m storage.reindex
+
+Use it after enabling the index on an existing tree, or if the index
+database was lost. Configuration is read from the same environment
+variables as the service (KEY_STORE_BACKEND, KEY_INDEX_PATH, ...).
+"""
+import sys
+import argparse
+from . import get_keystore, get_key_index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args(argv)
+
+    index = get_key_index()
+    if index is None:
+        print("The key index is disabled (KEY_INDEX=0)", file=sys.stderr)
+        return 1
+    store = get_keystore()
+    count = index.rebuild(store)
+    print(f"indexed {count} key pairs from the {store.name} store into {index.db_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
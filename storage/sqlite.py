@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import threading
+from .base import KeyStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS key_pairs (
+    key_id TEXT PRIMARY KEY,
+    key_type TEXT NOT NULL,
+    comment TEXT NOT NULL DEFAULT '',
+    private_key TEXT NOT NULL,
+    public_key TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+
+class SQLiteKeyStore(KeyStore):
+    """Stores key pairs as rows of a single SQLite database.
+
+    The database file is created 0600 and opened in WAL mode so several
+    worker processes can write to it. Each thread gets its own connection.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, mode=0o700, exist_ok=True)
+        # Create the file with restricted permissions before SQLite opens it
+        fd = os.open(db_path, os.O_RDWR | os.O_CREAT, 0o600)
+        os.close(fd)
+        os.chmod(db_path, 0o600)
+
+        with self._connection() as conn:
+            conn.execute(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _write(self, records, durable):
+        conn = self._connection()
+        # FULL syncs the WAL on every commit; NORMAL only at checkpoints
+        conn.execute(f"PRAGMA synchronous={'FULL' if durable else 'NORMAL'}")
+        with conn:
+            conn.executemany(
+                'INSERT INTO key_pairs (key_id, key_type, comment, private_key, public_key, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (r['keyId'], r['keyType'], r['comment'], r['privateKey'], r['publicKey'], r['createdAt'])
+                    for r in records
+                ]
+            )
+
+    def get(self, key_id):
+        row = self._connection().execute(
+            'SELECT key_id, key_type, comment, private_key, public_key, created_at '
+            'FROM key_pairs WHERE key_id = ?',
+            (key_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'keyId': row[0],
+            'keyType': row[1],
+            'comment': row[2],
+            'privateKey': row[3],
+            'publicKey': row[4],
+            'createdAt': row[5]
+        }
+
+    def exists(self, key_id):
+        row = self._connection().execute(
+            'SELECT 1 FROM key_pairs WHERE key_id = ?', (key_id,)
+        ).fetchone()
+        return row is not None
+
+    def _delete(self, key_id):
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute('DELETE FROM key_pairs WHERE key_id = ?', (key_id,))
+        return cursor.rowcount > 0
+
+    def iter_key_ids(self):
+        cursor = self._connection().execute('SELECT key_id FROM key_pairs ORDER BY created_at')
+        for row in cursor:
+            yield row[0]
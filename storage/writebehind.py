@@ -0,0 +1,321 @@
+import os
+import json
+import uuid
+import fcntl
+import queue
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from utils.config import env_flag, env_int
+from .base import new_record
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_STORED = 'stored'
+STATUS_FAILED = 'failed'
+
+# Failed handles remembered for status queries, oldest forgotten first
+MAX_FAILED = 1000
+
+
+class WriteBehindQueue:
+    """Persists key pairs to a key store on a background writer thread.
+
+    ``enqueue`` records the pair in an append-only journal, fsyncs it and
+    returns; concurrent enqueues share one fsync. The writer drains the
+    queue in batches through ``put_many``, so the store flushes once per
+    batch, and once the queue is empty the next enqueue starts a new journal
+    and removes the drained one. Records whose write failed are carried into
+    the new journal, so a journal is only removed once everything in it is
+    stored or journaled again. Journals are flock-ed by their owner, so a
+    journal left behind by a crashed worker is replayed by the next queue
+    that starts. Journals hold private keys and are created 0600 in a 0700
+    spool directory.
+    """
+
+    def __init__(self, store, spool_dir, max_pending=1000, batch_size=64):
+        self.store = store
+        self.spool_dir = spool_dir
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        # Handles queued by this process, and handles whose write failed
+        self._pending = set()
+        self._failed = OrderedDict()
+        # Records of the current journal whose write failed: keyId -> record
+        self._unstored = {}
+        # Journals of other processes: name -> (bytes read, handles seen)
+        self._other_journals = {}
+        self._thread = None
+        self._journal = None
+        self._journal_path = None
+        self._drained = False
+        # Records appended to the current journal, and the journal and
+        # record count covered by the last fsync
+        self._written = 0
+        self._synced_journal = None
+        self._synced = 0
+        self._pid = None
+
+    def start(self):
+        """Open the journal, replay orphaned journals and start the writer"""
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.max_pending)
+            self._pending = set()
+            self._unstored = {}
+            self._other_journals = {}
+            os.makedirs(self.spool_dir, mode=0o700, exist_ok=True)
+            os.chmod(self.spool_dir, 0o700)
+            self._open_journal()
+            self._replay_orphans()
+            self._thread = threading.Thread(target=self._writer_loop, name='key-write-behind', daemon=True)
+            self._thread.start()
+
+    def _open_journal(self):
+        """Start a new journal owned by this process. Holds the lock."""
+        self._journal_path = os.path.join(self.spool_dir, f'journal-{uuid.uuid4().hex}.ndjson')
+        fd = os.open(self._journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        self._journal = os.fdopen(fd, 'a')
+        self._drained = False
+        self._written = 0
+        # Make the new directory entry durable before records are acknowledged
+        dir_fd = os.open(self.spool_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _rotate_journal(self):
+        """
+        Replace a drained journal with a new one. Records whose write failed
+        are carried into the new journal before the old one is removed.
+        Holds the lock.
+        """
+        old_journal, old_path = self._journal, self._journal_path
+        self._open_journal()
+        self._unstored = {key_id: record for key_id, record in self._unstored.items()
+                          if not self.store.exists(key_id)}
+        if self._unstored:
+            for record in self._unstored.values():
+                self._journal.write(json.dumps(record) + '\n')
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        old_journal.close()
+        os.remove(old_path)
+
+    def _replay_orphans(self):
+        for name in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, name)
+            if not name.startswith('journal-') or path == self._journal_path:
+                continue
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Still owned by a live writer
+                    continue
+                with os.fdopen(os.dup(fd)) as f:
+                    records = [json.loads(line) for line in f if line.strip()]
+                pending = [r for r in records if not self.store.exists(r['keyId'])]
+                if pending:
+                    logger.info(f"Replaying {len(pending)} key pairs from {name}")
+                # Keep the journal for the next start if any record is still unstored
+                if not pending or self._write_batch(pending):
+                    os.remove(path)
+            except Exception as e:
+                logger.error(f"Failed to replay write-behind journal {name}: {str(e)}")
+            finally:
+                os.close(fd)
+
+    def enqueue(self, private_key, public_key, key_type, comment='', metadata=None):
+        """
+        Queue a key pair for persistence. When the queue is full the pair is
+        written on the calling thread instead, and a failed write raises.
+
+        Returns:
+            dict: The storage handle and location fields the pair will have,
+            and its storageStatus
+        """
+        self.start()
+        key_id = self.store.new_key_id(key_type, comment)
+        record = new_record(key_id, private_key, public_key, key_type, comment, metadata)
+        with self._lock:
+            if self._queue.full():
+                full = True
+            else:
+                full = False
+                if self._drained:
+                    self._rotate_journal()
+                self._journal.write(json.dumps(record) + '\n')
+                self._journal.flush()
+                self._written += 1
+                journal_path, written = self._journal_path, self._written
+                # fsync a duplicate: the journal may be rotated and closed meanwhile
+                journal_fd = os.dup(self._journal.fileno())
+                self._pending.add(key_id)
+                self._queue.put_nowait(record)
+        if full:
+            # Apply backpressure by writing on the request path
+            self.store.put_many([record])
+            return {**self.store.describe(key_id), 'storageStatus': STATUS_STORED}
+        try:
+            self._sync(journal_path, written, journal_fd)
+        finally:
+            os.close(journal_fd)
+        return {**self.store.describe(key_id), 'storageStatus': STATUS_PENDING}
+
+    def _sync(self, journal_path, written, journal_fd):
+        """
+        fsync the journal up to record ``written``. Enqueues that wait here
+        while another fsync runs are covered by a single fsync afterwards.
+        """
+        with self._sync_lock:
+            if self._synced_journal == journal_path and self._synced >= written:
+                return
+            with self._lock:
+                # Records appended since are covered too, unless the journal was rotated
+                target = self._written if self._journal_path == journal_path else written
+            os.fsync(journal_fd)
+            if self._synced_journal != journal_path:
+                self._synced_journal, self._synced = journal_path, 0
+            self._synced = max(self._synced, target)
+
+    def status(self, handle):
+        """
+        Return the persistence status of a storage handle.
+
+        Returns:
+            str or None: 'stored', 'pending', 'failed', or None if unknown
+        """
+        if self.store.exists(handle):
+            return STATUS_STORED
+        with self._lock:
+            if handle in self._failed:
+                return STATUS_FAILED
+            if handle in self._pending:
+                return STATUS_PENDING
+        if self._journaled(handle):
+            return STATUS_PENDING
+        return None
+
+    def _journaled(self, handle):
+        """
+        Check whether another process's journal still holds the handle.
+
+        Journals are append-only, so only what was appended since the last
+        check is read.
+        """
+        try:
+            names = [name for name in os.listdir(self.spool_dir) if name.startswith('journal-')]
+        except FileNotFoundError:
+            return False
+        own = os.path.basename(self._journal_path or '')
+        with self._lock:
+            journals = {name: self._other_journals.get(name, (0, set())) for name in names if name != own}
+        for name, (offset, handles) in journals.items():
+            try:
+                with open(os.path.join(self.spool_dir, name), 'rb') as f:
+                    f.seek(offset)
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            # Leave a partly written last line for the next check
+            complete = data[:data.rfind(b'\n') + 1]
+            for line in complete.splitlines():
+                try:
+                    handles.add(json.loads(line)['keyId'])
+                except (ValueError, KeyError):
+                    continue
+            journals[name] = (offset + len(complete), handles)
+        with self._lock:
+            self._other_journals = journals
+        return any(handle in handles for _, handles in journals.values())
+
+    def flush(self):
+        """Block until everything queued so far is written"""
+        self._queue.join()
+
+    def _write_batch(self, records):
+        """
+        Write a batch of key pairs with a single durable flush.
+
+        Returns:
+            bool: Whether the batch was stored
+        """
+        try:
+            self.store.put_many(records)
+            return True
+        except Exception as e:
+            logger.error(f"Write-behind persistence failed for {len(records)} key pairs: {str(e)}")
+            with self._lock:
+                for record in records:
+                    self._failed[record['keyId']] = str(e)
+                    self._failed.move_to_end(record['keyId'])
+                while len(self._failed) > MAX_FAILED:
+                    self._failed.popitem(last=False)
+            return False
+
+    def _writer_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stored = self._write_batch(batch)
+
+            with self._lock:
+                for record in batch:
+                    if not stored:
+                        self._unstored[record['keyId']] = record
+                    self._pending.discard(record['keyId'])
+                    self._queue.task_done()
+                # Everything journaled so far is stored, or carried over on
+                # rotation, once the queue is empty
+                if self._queue.empty():
+                    self._drained = True
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_write_behind_queue(store):
+    """
+    Return the process-wide write-behind queue, or None when disabled.
+
+    Enabled with KEY_WRITE_BEHIND; sized by KEY_WRITE_BEHIND_MAX_PENDING and
+    KEY_WRITE_BEHIND_BATCH_SIZE. Journals live under KEY_STORAGE_PATH/.spool.
+
+    Args:
+        store (KeyStore): Store the queue writes to
+    """
+    global _queue
+    if not env_flag('KEY_WRITE_BEHIND'):
+        return None
+    with _queue_lock:
+        if _queue is None or _queue.store is not store:
+            base_path = os.getenv('KEY_STORAGE_PATH', 'keys')
+            _queue = WriteBehindQueue(
+                store,
+                os.path.join(base_path, '.spool'),
+                max_pending=env_int('KEY_WRITE_BEHIND_MAX_PENDING', 1000),
+                batch_size=env_int('KEY_WRITE_BEHIND_BATCH_SIZE', 64)
+            )
+            atexit.register(_queue.flush)
+        return _queue
@@ -1,6 +1,7 @@
 import pytest
 import json
 import os
+import signal
 import tempfile
 import stat
 from pathlib import Path
@@ -47,6 +48,34 @@ def test_health_check(client):
     assert response.status_code == 200
     assert response.json['status'] == 'healthy'
 
+def test_ready(client):
+    """Test the readiness endpoint reports the worker's generations in flight"""
+    response = client.get('/ready')
+    assert response.status_code == 200
+    assert response.json['status'] == 'ready'
+    assert response.json['inFlight'] == 0
+
+def test_admission_rejects_over_in_flight_limit(client, monkeypatch):
+    """Test a worker at its in-flight limit rejects generations with 429 and reports overloaded"""
+    from generators import executors
+    limit = executors.InFlightLimit(1)
+    monkeypatch.setattr(executors, '_in_flight_limit', limit)
+    with limit.admit('rsa', {'keySize': 4096}):
+        response = client.post('/generate/rsa', json={'keySize': 2048})
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == str(response.json['retryAfter'])
+        assert response.json['success'] is False
+
+        # Passphrases are not counted
+        assert client.post('/generate/passphrase', json={'length': 16}).status_code == 200
+
+        response = client.get('/ready')
+        assert response.status_code == 503
+        assert response.json == {'status': 'overloaded', 'inFlight': 1, 'maxInFlight': 1}
+
+    assert client.post('/generate/ssh', json={'keyType': 'ed25519'}).status_code == 200
+    assert client.get('/ready').status_code == 200
+
 def test_generate_passphrase(client):
     """Test passphrase generation endpoint"""
     response = client.post('/generate/passphrase',
@@ -57,6 +86,16 @@ def test_generate_passphrase(client):
     assert isinstance(data['data']['passphrase'], str)
     assert len(data['data']['passphrase']) == 16
 
+def test_generate_passphrase_count(client):
+    """Test bulk passphrase generation endpoint"""
+    response = client.post('/generate/passphrase',
+                         json={'length': 20, 'count': 25})
+    assert response.status_code == 200
+    data = response.json['data']
+    assert data['count'] == 25
+    assert len(data['passphrases']) == 25
+    assert all(len(p) == 20 for p in data['passphrases'])
+
 def test_generate_ssh(client):
     """Test SSH key generation endpoint"""
     response = client.post('/generate/ssh',
@@ -132,3 +171,299 @@ def test_invalid_input(client, gpg_home):
     assert response.status_code == 400
     assert response.json['success'] is False
     assert 'error_message' in response.json
+
+def test_generate_batch(client):
+    """Test batch generation streams one NDJSON line per key"""
+    response = client.post('/generate/batch',
+                         json={'specs': [
+                             {'type': 'ssh', 'repeat': 3, 'keyType': 'ed25519', 'comment': 'batch'},
+                             {'type': 'passphrase', 'repeat': 2, 'length': 20, 'count': 4}
+                         ]})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert len(lines) == 6
+    keys, summary = lines[:-1], lines[-1]
+    assert [line['index'] for line in keys] == [0, 1, 2, 3, 4]
+    assert all(line['success'] for line in keys)
+    assert keys[0]['type'] == 'ssh'
+    assert keys[0]['data']['publicKey'].startswith('ssh-ed25519')
+    assert keys[4]['spec'] == 1
+    assert len(keys[4]['data']['passphrase']) == 20
+    # count is the passphrase endpoint's own parameter
+    assert len(keys[4]['data']['passphrases']) == 4
+    assert summary == {'done': True, 'total': 5, 'succeeded': 5, 'failed': 0}
+
+def test_generate_batch_invalid_specs(client):
+    """Test batch requests are validated before streaming starts"""
+    response = client.post('/generate/batch', json={'specs': []})
+    assert response.status_code == 400
+    assert response.json['success'] is False
+
+    response = client.post('/generate/batch', json={'specs': [{'type': 'invalid'}]})
+    assert response.status_code == 400
+    assert 'invalid type' in response.json['error_message']
+
+    response = client.post('/generate/batch', json=[{'type': 'ssh', 'repeat': 100000}])
+    assert response.status_code == 400
+    assert 'limited to' in response.json['error_message']
+
+    # A count on a key spec is ambiguous with the passphrase count
+    response = client.post('/generate/batch', json=[{'type': 'ssh', 'count': 3}])
+    assert response.status_code == 400
+    assert "use 'repeat'" in response.json['error_message']
+
+@pytest.fixture
+def job_manager(monkeypatch):
+    """Use a fresh job manager with a single worker process"""
+    from generators import jobs
+    monkeypatch.setenv('JOB_WORKERS', '1')
+    monkeypatch.setattr(jobs, '_manager', None)
+    yield
+    if jobs._manager is not None and jobs._manager._executor is not None:
+        jobs._manager._executor.shutdown(wait=True)
+    jobs._manager = None
+
+def test_generate_async_job(client, job_manager):
+    """Test async generation returns a job that can be long-polled"""
+    response = client.post('/generate/ssh?async=true',
+                         json={'keyType': 'ed25519', 'comment': 'async'})
+    assert response.status_code == 202
+    job = response.json['data']
+    assert job['status'] == 'queued'
+    assert response.headers['Location'] == f"/jobs/{job['jobId']}"
+
+    response = client.get(f"/jobs/{job['jobId']}?wait=30")
+    assert response.status_code == 200
+    job = response.json['data']
+    assert job['status'] == 'succeeded'
+    assert job['resultStatus'] == 200
+    assert job['result']['data']['publicKey'].startswith('ssh-ed25519')
+
+def test_generate_async_job_failure(client, job_manager):
+    """Test failed generations are reported through the job result"""
+    response = client.post('/generate/rsa',
+                         json={'keySize': 1024},
+                         headers={'Prefer': 'respond-async'})
+    assert response.status_code == 202
+
+    job_id = response.json['data']['jobId']
+    job = client.get(f'/jobs/{job_id}?wait=30').json['data']
+    assert job['status'] == 'failed'
+    assert job['resultStatus'] == 400
+    assert job['result']['success'] is False
+
+def test_generate_async_job_after_worker_died(client, job_manager):
+    """Test a killed job worker fails its job and the pool is restarted"""
+    from generators import jobs
+    from concurrent.futures.process import BrokenProcessPool
+    response = client.post('/generate/ssh?async=true', json={'keyType': 'ed25519'})
+    assert client.get(f"/jobs/{response.json['data']['jobId']}?wait=30").json['data']['status'] == 'succeeded'
+
+    manager = jobs._manager
+    for process in list(manager._executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+    response = client.post('/generate/ssh?async=true', json={'keyType': 'ed25519'})
+    assert response.status_code == 202
+    job = client.get(f"/jobs/{response.json['data']['jobId']}?wait=30").json['data']
+    assert job['status'] in ('succeeded', 'failed')
+    response = client.post('/generate/ssh?async=true', json={'keyType': 'ed25519'})
+    assert response.status_code == 202
+    job = client.get(f"/jobs/{response.json['data']['jobId']}?wait=30").json['data']
+    assert job['status'] == 'succeeded'
+
+    # A pool that cannot be restarted fails the request with JSON, not HTML
+    class BrokenExecutor:
+        def submit(self, *args, **kwargs):
+            raise BrokenProcessPool('worker died')
+
+        def shutdown(self, wait=True):
+            pass
+    manager._executor.shutdown(wait=True)
+    manager._executor = BrokenExecutor()
+    manager._get_executor = lambda: manager._executor or BrokenExecutor()
+    response = client.post('/generate/ssh?async=true', json={'keyType': 'ed25519'})
+    assert response.status_code == 503
+    assert response.json['success'] is False
+    assert not any(manager.store.read(name[:-5])['status'] == 'queued'
+                   for name in os.listdir(manager.store.job_dir) if name.endswith('.json'))
+
+def test_job_not_found(client):
+    """Test unknown and malformed job IDs return 404"""
+    assert client.get('/jobs/' + 'a' * 32).status_code == 404
+    assert client.get('/jobs/..%2Fsecret').status_code == 404
+
+def test_job_wait_validation(client, monkeypatch):
+    """Test long-poll timeouts must be finite and non-negative, and are capped"""
+    from generators import jobs
+    for wait in ('soon', '-1', 'nan', 'inf'):
+        response = client.get(f"/jobs/{'a' * 32}?wait={wait}")
+        assert response.status_code == 400
+        assert response.json['error_message'] == 'wait must be a number of seconds'
+
+    waits = []
+    manager = jobs.get_job_manager()
+    monkeypatch.setattr(manager, 'get', lambda job_id, wait_seconds=0: waits.append(wait_seconds))
+    client.get(f"/jobs/{'a' * 32}?wait=3600")
+    assert waits == [jobs.MAX_WAIT_SECONDS]
+
+def test_generate_write_behind(client, monkeypatch):
+    """Test write-behind mode returns a storage handle that can be confirmed"""
+    from storage import writebehind, get_keystore
+    monkeypatch.setenv('KEY_WRITE_BEHIND', '1')
+    monkeypatch.setattr(writebehind, '_queue', None)
+
+    response = client.post('/generate/ssh',
+                         json={'keyType': 'ed25519', 'comment': 'deferred'})
+    assert response.status_code == 200
+    data = response.json['data']
+    assert data['storageStatus'] == 'pending'
+
+    writebehind.get_write_behind_queue(get_keystore()).flush()
+    response = client.get(f"/storage/{data['storageHandle']}")
+    assert response.status_code == 200
+    assert response.json['data']['storageStatus'] == 'stored'
+    assert os.path.exists(data['privatePath'])
+
+def test_generate_writes_key_once(client):
+    """Test a generated key pair is persisted exactly once"""
+    base_path = Path(os.environ['KEY_STORAGE_PATH'])
+    before = set(base_path.rglob('*'))
+    response = client.post('/generate/ssh',
+                         json={'keyType': 'ed25519', 'comment': 'single_write'})
+    assert response.status_code == 200
+    created = [p for p in set(base_path.rglob('*')) - before
+               if p.is_file() and not p.name.startswith('index.db')]
+    assert sorted(p.suffix for p in created) == ['.private', '.public']
+
+    handle = response.json['data']['storageHandle']
+    response = client.get(f'/storage/{handle}')
+    assert response.json['data']['storageStatus'] == 'stored'
+
+@pytest.fixture
+def idempotency_cache(monkeypatch, tmp_path):
+    """Use a fresh idempotency cache"""
+    from generators import idempotency
+    cache = idempotency.IdempotencyCache(str(tmp_path / 'idempotency'))
+    monkeypatch.setattr(idempotency, '_cache', cache)
+    return cache
+
+def test_idempotency_key_replays_response(client, idempotency_cache):
+    """Test a retried request with the same Idempotency-Key gets the first key pair"""
+    base_path = Path(os.environ['KEY_STORAGE_PATH'])
+    before = set(base_path.rglob('*'))
+    headers = {'Idempotency-Key': 'order-42'}
+    first = client.post('/generate/rsa', json={'keySize': 2048}, headers=headers)
+    assert first.status_code == 200
+    assert 'Idempotent-Replayed' not in first.headers
+    # A retry may carry a different deadline
+    retry = client.post('/generate/rsa', json={'keySize': 2048, 'requestTimeout': 30}, headers=headers)
+    assert retry.status_code == 200
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.json == first.json
+    created = [p for p in set(base_path.rglob('*')) - before
+               if p.is_file() and not p.name.startswith('index.db')]
+    assert sorted(p.suffix for p in created) == ['.private', '.public']
+
+    # Private material is encrypted at rest and the key does not appear in file names
+    entries = list(Path(idempotency_cache.directory).glob('*.json'))
+    assert len(entries) == 1
+    assert 'order-42' not in entries[0].name
+    assert 'PRIVATE KEY' not in entries[0].read_text()
+    assert os.stat(entries[0]).st_mode & 0o777 == 0o600
+
+    response = client.post('/generate/rsa', json={'keySize': 4096}, headers=headers)
+    assert response.status_code == 422
+    response = client.post('/generate/rsa', json={'keySize': 2048}, headers={'Idempotency-Key': 'x' * 256})
+    assert response.status_code == 400
+
+    # Failed requests are not cached
+    for _ in range(2):
+        response = client.post('/generate/rsa', json={'keySize': 1024}, headers={'Idempotency-Key': 'bad-size'})
+        assert response.status_code == 400
+        assert 'Idempotent-Replayed' not in response.headers
+
+def test_list_and_search_keys(client, monkeypatch, tmp_path):
+    """Test generated keys are listed and searchable through the metadata index"""
+    monkeypatch.setenv('KEY_INDEX_PATH', str(tmp_path / 'index.db'))
+    handles = []
+    for comment in ('indexed_a', 'indexed_b', 'indexed_c'):
+        response = client.post('/generate/ssh', json={'keyType': 'ed25519', 'comment': comment})
+        handles.append(response.json['data']['storageHandle'])
+
+    response = client.get('/keys?keyType=ssh&limit=2')
+    assert response.status_code == 200
+    page = response.json['data']
+    assert [k['storageHandle'] for k in page['keys']] == handles[:0:-1]
+    assert 'privateKey' not in page['keys'][0]
+    assert page['keys'][0]['algorithm'] == 'ssh-ed25519'
+    assert page['keys'][0]['fingerprint'].startswith('SHA256:')
+
+    response = client.get(f"/keys?keyType=ssh&limit=2&cursor={page['nextCursor']}")
+    assert [k['storageHandle'] for k in response.json['data']['keys']] == handles[:1]
+    assert response.json['data']['nextCursor'] is None
+
+    fingerprint = page['keys'][1]['fingerprint']
+    response = client.get('/keys/search', query_string={'fingerprint': fingerprint})
+    assert [k['storageHandle'] for k in response.json['data']['keys']] == [handles[1]]
+
+    assert client.get('/keys/search').status_code == 400
+    assert client.get('/keys?cursor=invalid').status_code == 400
+    assert client.get('/keys?limit=0').status_code == 400
+
+def test_search_keys_expires_before(client, gpg_home, monkeypatch, tmp_path):
+    """Test keys that never expire are not matched by expiresBefore"""
+    monkeypatch.setenv('KEY_INDEX_PATH', str(tmp_path / 'index.db'))
+    handles = {}
+    for expire_time in ('never', '1y'):
+        response = client.post('/generate/pgp', json={
+            'name': 'Test User',
+            'email': 'expiry@example.com',
+            'keyType': 'ECC',
+            'curve': 'ed25519',
+            'expireTime': expire_time,
+            'passphrase': 'test123',
+            'comment': f'expires_{expire_time}'
+        })
+        assert response.status_code == 200
+        handles[expire_time] = response.json['data']['storageHandle']
+
+    response = client.get('/keys/search', query_string={'expiresBefore': '9999-01-01'})
+    assert [k['storageHandle'] for k in response.json['data']['keys']] == [handles['1y']]
+    response = client.get('/keys/search', query_string={'email': 'expiry@example.com'})
+    expires = {k['storageHandle']: k['expiresAt'] for k in response.json['data']['keys']}
+    assert expires[handles['never']] is None
+
+def test_metrics(client):
+    """Test /metrics exposes route, generation and storage metrics"""
+    client.post('/generate/ssh', json={'keyType': 'ecdsa', 'keySize': 384})
+    client.post('/generate/rsa', json={'keySize': 1024})
+    client.get('/jobs/' + '0' * 32)
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    body = response.get_data(as_text=True)
+    assert 'keygen_http_request_duration_seconds_count{method="POST",route="/generate/ssh",status="200"}' in body
+    assert 'route="/jobs/<job_id>"' in body
+    assert 'keygen_generation_duration_seconds_count{algorithm="ecdsa",size="384",type="ssh"}' in body
+    assert 'keygen_generation_errors_total{type="rsa"}' in body
+    assert 'keygen_storage_write_duration_seconds_count{backend="filesystem",mode="single"}' in body
+    assert 'keygen_http_requests_in_flight{route="/metrics"} 1.0' in body
+
+def test_server_timing(client, monkeypatch):
+    """Test /generate/* responses break their latency down in Server-Timing"""
+    response = client.post('/generate/ssh', json={'keyType': 'ed25519', 'passphrase': 'secret'})
+    assert response.status_code == 200
+    metrics = [entry.split(';')[0] for entry in response.headers['Server-Timing'].split(', ')]
+    assert metrics == ['validate', 'keygen', 'serialize', 'persist', 'json', 'total']
+    assert all(float(entry.split('dur=')[1]) >= 0 for entry in response.headers['Server-Timing'].split(', '))
+
+    response = client.post('/generate/rsa', json={'keySize': 1024})
+    assert response.status_code == 400
+    assert response.headers['Server-Timing'].startswith('validate;dur=')
+
+    assert 'Server-Timing' not in client.get('/health').headers
+    monkeypatch.setenv('SERVER_TIMING', '0')
+    assert 'Server-Timing' not in client.post('/generate/passphrase', json={}).headers
@@ -0,0 +1,387 @@
+import pytest
+import json
+import math
+import time
+import asyncio
+import threading
+import asgi
+from generators import executors
+from generators.executors import GenerationExecutors, OverloadedError, cost_class, cpu_capacity
+from utils.deadline import DeadlineExceeded
+
+
+@pytest.fixture
+def generation_executors(monkeypatch):
+    """Small lanes for each test, shut down afterwards"""
+    pool = GenerationExecutors({'cheap': 2, 'standard': 1, 'heavy': 1})
+    monkeypatch.setattr(executors, '_executors', pool)
+    yield pool
+    pool.shutdown()
+
+
+async def _request(method, path, body=None, headers=None):
+    """Drive one request through the ASGI app; returns (status, headers, body)"""
+    path, _, query = path.partition('?')
+    if body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+        headers = dict({'content-type': 'application/json'}, **(headers or {}))
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode('latin-1'),
+        'root_path': '',
+        'query_string': query.encode('latin-1'),
+        'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in (headers or {}).items()],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 50000)
+    }
+    received = False
+    messages = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': body or b'', 'more_body': False}
+        # The client stays connected until the response is complete
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi.app(scope, receive, send)
+    start = messages[0]
+    response_headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in start['headers']}
+    return start['status'], response_headers, b''.join(m.get('body', b'') for m in messages[1:])
+
+
+def test_health_and_index():
+    """Test the event loop serves /health and / itself"""
+    status, headers, body = asyncio.run(_request('GET', '/health'))
+    assert status == 200
+    assert json.loads(body) == {'status': 'healthy'}
+    status, headers, body = asyncio.run(_request('GET', '/'))
+    assert status == 200
+    assert headers['content-type'].startswith('text/html')
+    assert b'<html' in body.lower()
+
+
+def test_generate_routes(generation_executors):
+    """Test generation responses match the Flask app's"""
+    status, headers, body = asyncio.run(_request('POST', '/generate/passphrase', {'length': 24}))
+    assert status == 200
+    assert len(json.loads(body)['data']['passphrase']) == 24
+    assert headers['server-timing'].endswith(tuple('0123456789'))
+
+    status, headers, body = asyncio.run(_request('POST', '/generate/ssh', {'keyType': 'ed25519'}))
+    assert status == 200
+    data = json.loads(body)['data']
+    assert data['publicKey'].startswith('ssh-ed25519 ')
+    assert data['storageStatus'] == 'stored'
+    # Spans recorded in the executor process reach Server-Timing
+    metrics = [entry.split(';')[0] for entry in headers['server-timing'].split(', ')]
+    assert metrics == ['validate', 'keygen', 'serialize', 'persist', 'json', 'total']
+
+    status, _, body = asyncio.run(_request('POST', '/generate/rsa', {'keySize': 1024}))
+    assert status == 400
+    assert json.loads(body)['success'] is False
+
+    status, _, body = asyncio.run(_request('POST', '/generate/rsa', b'not json', {'content-type': 'text/plain'}))
+    assert status == 400
+    assert json.loads(body)['error_message'].startswith('Invalid request body')
+
+
+def test_generate_unexpected_error(generation_executors, monkeypatch):
+    """Test an unexpected failure is answered with a 500 JSON body"""
+    async def broken(kind, data, deadline=None):
+        raise RuntimeError('Generation process exited unexpectedly')
+
+    monkeypatch.setattr(generation_executors, 'run', broken)
+    status, headers, body = asyncio.run(_request('POST', '/generate/rsa', {'keySize': 2048}))
+    assert status == 500
+    assert headers['content-type'] == 'application/json'
+    assert json.loads(body) == {
+        'success': False,
+        'error_message': 'Internal server error: Generation process exited unexpectedly'
+    }
+
+
+def test_batch_streams_results(generation_executors):
+    """Test batches stream one NDJSON line per key and a summary"""
+    specs = {'specs': [{'type': 'passphrase', 'repeat': 2}, {'type': 'ssh', 'keyType': 'ed25519'}]}
+    status, headers, body = asyncio.run(_request('POST', '/generate/batch', specs))
+    assert status == 200
+    assert headers['content-type'] == 'application/x-ndjson'
+    records = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    assert [record.get('type') for record in records[:3]] == ['passphrase', 'passphrase', 'ssh']
+    assert records[-1] == {'done': True, 'total': 3, 'succeeded': 3, 'failed': 0}
+
+    status, _, body = asyncio.run(_request('POST', '/generate/batch', {'specs': []}))
+    assert status == 400
+
+
+def test_other_routes_use_flask():
+    """Test routes without a native handler are served by the Flask app"""
+    status, _, body = asyncio.run(_request('GET', '/stats/charset-cache'))
+    assert status == 200
+    assert isinstance(json.loads(body), dict)
+    status, _, _ = asyncio.run(_request('GET', '/generate/rsa'))
+    assert status == 405
+
+
+def test_loop_serves_health_during_slow_generation(generation_executors):
+    """Test /health and passphrases are answered while RSA keys are generated"""
+    async def scenario():
+        slow = [asyncio.create_task(_request('POST', '/generate/rsa', {'keySize': 4096})) for _ in range(3)]
+        await asyncio.sleep(0.2)
+        latencies = []
+        while not all(task.done() for task in slow):
+            start = time.perf_counter()
+            status, _, _ = await _request('GET', '/health')
+            assert status == 200
+            status, _, _ = await _request('POST', '/generate/passphrase', {})
+            assert status == 200
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+        return latencies, [await task for task in slow]
+
+    latencies, results = asyncio.run(scenario())
+    assert all(status == 200 for status, _, _ in results)
+    assert len(latencies) > 5
+    assert max(latencies) < 0.1
+
+
+def test_bulk_passphrases_leave_the_event_loop(generation_executors, monkeypatch):
+    """Test bulk passphrase requests run in the cheap lane's threads and honour the deadline"""
+    assert generation_executors.execution('passphrase', 'cheap', {'length': 64}) == 'inline'
+    assert generation_executors.execution('passphrase', 'cheap', {'length': 64, 'count': 10000}) == 'thread'
+    assert generation_executors.execution('passphrase', 'cheap', {'count': 'many'}) == 'inline'
+
+    loop_thread = threading.get_ident()
+    threads = []
+    run_collecting = executors._run_collecting
+
+    def recording(kind, data, scope=None, rsa_keys=None):
+        threads.append(threading.get_ident())
+        return run_collecting(kind, data, scope, rsa_keys)
+
+    monkeypatch.setattr(executors, '_run_collecting', recording)
+    body, status = asyncio.run(generation_executors.run('passphrase', {'length': 32, 'count': 1000}))
+    assert status == 200
+    assert len(body['data']['passphrases']) == 1000
+    assert threads and loop_thread not in threads
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(generation_executors.run('passphrase', {'count': 1000}, deadline=time.monotonic() - 1))
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(generation_executors.run('passphrase', {}, deadline=time.monotonic() - 1))
+
+
+@pytest.mark.parametrize('kind,data,expected', [
+    ('passphrase', {}, 'cheap'),
+    ('ssh', {'keyType': 'ed25519'}, 'cheap'),
+    ('ssh', {'keyType': 'ECDSA', 'keySize': 521}, 'cheap'),
+    ('ssh', {}, 'standard'),
+    ('ssh', {'keyType': 'rsa', 'keySize': 4096}, 'heavy'),
+    ('ssh', {'keyType': 'rsa', 'keySize': 8192}, 'cheap'),
+    ('rsa', {}, 'standard'),
+    ('rsa', {'keySize': '4096'}, 'heavy'),
+    ('rsa', {'keySize': 'large'}, 'cheap'),
+    ('pgp', {'name': 'A', 'email': 'a@example.com'}, 'heavy'),
+    ('pgp', {'name': 'A', 'email': 'a@example.com', 'keyType': 'ecc'}, 'standard'),
+    ('pgp', {'keyType': 'RSA'}, 'cheap')
+])
+def test_cost_class(kind, data, expected):
+    """Test requests are classified with the generators' validation; invalid ones are cheap"""
+    assert cost_class(kind, data) == expected
+
+
+def test_cheap_lane_under_heavy_load(generation_executors):
+    """Test ed25519 SSH keys do not queue behind RSA-4096 keys"""
+    async def scenario():
+        heavy = [asyncio.create_task(generation_executors.run('rsa', {'keySize': 4096})) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        stats = generation_executors.stats()
+        latencies = []
+        for _ in range(10):
+            start = time.perf_counter()
+            body, status = await generation_executors.run('ssh', {'keyType': 'ed25519'})
+            assert status == 200
+            latencies.append(time.perf_counter() - start)
+        heavy_pending = sum(not task.done() for task in heavy)
+        await asyncio.gather(*heavy)
+        return stats, latencies, heavy_pending
+
+    stats, latencies, heavy_pending = asyncio.run(scenario())
+    assert stats['heavy'] == {'budget': 1, 'running': 1, 'queued': 2}
+    assert heavy_pending > 0
+    assert max(latencies) < 0.5
+
+
+def test_admission_rejects_work_over_latency_budget(monkeypatch):
+    """Test requests that would queue past the latency budget get 429 with Retry-After"""
+    pool = GenerationExecutors({'cheap': 2, 'standard': 1, 'heavy': 1}, latency_budget=4.5, capacity=1)
+    monkeypatch.setattr(executors, '_executors', pool)
+
+    async def scenario():
+        # Four expected RSA-4096 seconds are running or queued: the fifth would take about five
+        for _ in range(50):
+            pool.record_cost('rsa', 'heavy', 1.0)
+        heavy = [asyncio.create_task(pool.run('rsa', {'keySize': 4096})) for _ in range(4)]
+        await asyncio.sleep(0.1)
+        latency = pool.estimated_latency('heavy', pool.estimated_cost('rsa', 'heavy'))
+        with pytest.raises(OverloadedError) as error:
+            await pool.run('rsa', {'keySize': 4096})
+        rejected = await _request('POST', '/generate/rsa', {'keySize': 4096})
+        # Other lanes are admitted
+        cheap, _ = await pool.run('ssh', {'keyType': 'ed25519'})
+        ready = await _request('GET', '/ready')
+        await asyncio.gather(*heavy)
+        return latency, error.value, rejected, cheap, ready
+
+    try:
+        latency, error, rejected, cheap, ready = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert latency > 4.5
+    assert 1 <= error.retry_after <= math.ceil(latency - 4.5)
+    status, headers, body = rejected
+    assert status == 429
+    assert int(headers['retry-after']) >= 1
+    assert json.loads(body)['retryAfter'] == int(headers['retry-after'])
+    assert cheap['success'] is True
+
+    status, _, body = ready
+    assert status == 200
+    body = json.loads(body)
+    assert body['status'] == 'ready'
+    assert body['lanes']['heavy']['running'] == 1
+    assert body['lanes']['heavy']['queued'] == 3
+    assert body['lanes']['heavy']['estimatedLatencySeconds'] > 4.5
+
+
+def test_cpu_capacity_reads_cgroup_limit(tmp_path, monkeypatch):
+    """Test the cgroup CPU limit caps the CPUs used for budgets and estimates"""
+    cpu_max = tmp_path / 'cpu.max'
+    monkeypatch.setattr(executors, 'CGROUP_CPU_LIMITS', ((str(cpu_max), None),))
+    cpu_max.write_text('50000 100000\n')
+    assert cpu_capacity() == 0.5
+    pool = GenerationExecutors()
+    assert pool.budgets == {'cheap': 4, 'standard': 1, 'heavy': 1}
+    cpu_max.write_text('max 100000\n')
+    assert cpu_capacity() >= 1
+
+
+def _cancellations(kind, stage):
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value('keygen_generation_cancellations_total', {'type': kind, 'stage': stage}) or 0
+
+
+def test_deadline_cancels_queued_and_running_work(generation_executors):
+    """Test work past its deadline is dropped from the queue or has its process killed"""
+    before = {stage: _cancellations('rsa', stage) for stage in ('admission', 'queued', 'running')}
+
+    async def scenario():
+        # Estimates low enough that the queued request is admitted
+        for _ in range(50):
+            generation_executors.record_cost('rsa', 'heavy', 0.001)
+        now = time.monotonic()
+        # The first request starts a generation process, so it is still running at its deadline
+        running = asyncio.create_task(generation_executors.run('rsa', {'keySize': 4096}, deadline=now + 0.2))
+        await asyncio.sleep(0.05)
+        worker = next(iter(generation_executors._executors()[0]._all))
+        queued = asyncio.create_task(generation_executors.run('rsa', {'keySize': 4096}, deadline=now + 0.1))
+        results = await asyncio.gather(running, queued, return_exceptions=True)
+        stats = generation_executors.stats()
+        with pytest.raises(DeadlineExceeded):
+            await generation_executors.run('rsa', {'keySize': 4096}, deadline=time.monotonic() - 1)
+        # A new process takes over for the next request
+        body, status = await generation_executors.run('rsa', {'keySize': 2048})
+        return results, worker, stats, status
+
+    results, worker, stats, status = asyncio.run(scenario())
+    assert all(isinstance(result, DeadlineExceeded) for result in results)
+    worker.process.join(timeout=5)
+    assert not worker.process.is_alive()
+    assert stats['heavy'] == {'budget': 1, 'running': 0, 'queued': 0}
+    assert status == 200
+    assert _cancellations('rsa', 'running') == before['running'] + 1
+    assert _cancellations('rsa', 'queued') == before['queued'] + 1
+    assert _cancellations('rsa', 'admission') == before['admission'] + 1
+
+
+def test_deadline_keeps_thread_slot_until_thread_finishes(generation_executors, monkeypatch):
+    """Test a thread still running past its request's deadline keeps its lane slot"""
+    finish = threading.Event()
+    run_collecting = executors._run_collecting
+
+    def slow(kind, data, scope=None):
+        finish.wait(5)
+        return run_collecting(kind, data, scope)
+
+    monkeypatch.setattr(executors, '_run_collecting', slow)
+
+    async def scenario():
+        with pytest.raises(DeadlineExceeded):
+            await generation_executors.run('ssh', {'keyType': 'ed25519'}, deadline=time.monotonic() + 0.1)
+        busy = generation_executors.stats()['cheap']
+        finish.set()
+        for _ in range(100):
+            if generation_executors.stats()['cheap']['running'] == 0:
+                break
+            await asyncio.sleep(0.01)
+        return busy, generation_executors.stats()['cheap']
+
+    busy, idle = asyncio.run(scenario())
+    assert busy['running'] == 1
+    assert idle == {'budget': 2, 'running': 0, 'queued': 0}
+
+
+def test_generate_deadline_responses(generation_executors):
+    """Test invalid client timeouts are rejected and missed deadlines answered with 504"""
+    status, _, body = asyncio.run(_request('POST', '/generate/rsa', {'keySize': 2048},
+                                           {'X-Request-Timeout': 'soon'}))
+    assert status == 400
+    assert 'requestTimeout' in json.loads(body)['error_message']
+
+    status, _, body = asyncio.run(_request('POST', '/generate/rsa', {'keySize': 4096, 'requestTimeout': 0.05}))
+    assert status == 504
+    assert json.loads(body) == {'success': False, 'error_message': 'Request deadline exceeded'}
+
+    status, _, body = asyncio.run(_request('POST', '/generate/ssh', {'keyType': 'ed25519', 'requestTimeout': 30}))
+    assert status == 200
+
+
+def test_idempotent_duplicates_attach(generation_executors, monkeypatch, tmp_path):
+    """Test concurrent duplicates share one generation and later retries are replayed"""
+    from generators import idempotency
+    cache = idempotency.IdempotencyCache(str(tmp_path / 'idempotency'))
+    monkeypatch.setattr(idempotency, '_cache', cache)
+    headers = {'Idempotency-Key': 'retry-storm'}
+    # Cache files are read and written off the event loop thread
+    io_threads = set()
+    for name in ('claim', 'complete', 'release', 'entry_id'):
+        method = getattr(cache, name)
+        monkeypatch.setattr(cache, name, lambda *args, method=method: io_threads.add(threading.get_ident()) or method(*args))
+
+    async def scenario():
+        return await asyncio.gather(*(
+            _request('POST', '/generate/rsa', {'keySize': 2048}, headers) for _ in range(5)
+        ))
+
+    results = asyncio.run(scenario())
+    assert [status for status, _, _ in results] == [200] * 5
+    bodies = [json.loads(body) for _, _, body in results]
+    assert all(body == bodies[0] for body in bodies)
+    assert sum('idempotent-replayed' not in response_headers for _, response_headers, _ in results) == 1
+    assert cache._inflight == {}
+    assert io_threads and threading.get_ident() not in io_threads
+
+    status, response_headers, body = asyncio.run(_request('POST', '/generate/rsa', {'keySize': 2048}, headers))
+    assert status == 200
+    assert response_headers['idempotent-replayed'] == 'true'
+    assert json.loads(body) == bodies[0]
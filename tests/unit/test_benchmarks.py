@@ -0,0 +1,39 @@
+import pytest
+import sys
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.suite import CASES, ROUTES, compare, percentile, run_case
+
+def test_percentile():
+    """Test nearest-rank percentiles"""
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 99) == 99
+    assert percentile([7], 95) == 7
+
+@pytest.mark.parametrize('name,concurrency', [('passphrase', 1), ('route/health', 2)])
+def test_run_case(name, concurrency):
+    """Test a case reports latency, throughput and memory"""
+    result = run_case(name, 10, concurrency)
+    assert result['iterations'] == 10
+    assert result['errors'] == 0
+    assert 0 < result['p50Ms'] <= result['p95Ms'] <= result['p99Ms']
+    assert result['opsPerSec'] > 0
+    assert result['peakRssMb'] > 0
+
+def test_compare_flags_regressions():
+    """Test slower, heavier or failing cases are reported against the baseline"""
+    base = {'p95Ms': 10.0, 'opsPerSec': 100.0, 'peakRssMb': 50.0, 'errors': 0}
+    assert compare({'rsa/2048': dict(base, p95Ms=11.0)}, {'rsa/2048': base}, 0.25) == []
+    assert len(compare({'rsa/2048': dict(base, p95Ms=20.0)}, {'rsa/2048': base}, 0.25)) == 1
+    assert len(compare({'rsa/2048': dict(base, opsPerSec=50.0)}, {'rsa/2048': base}, 0.25)) == 1
+    assert len(compare({'rsa/2048': dict(base, errors=2)}, {}, 0.25)) == 1
+
+def test_every_route_case_is_registered():
+    """Test route cases have a request definition"""
+    assert all(name in CASES for name in ROUTES)
@@ -56,6 +56,48 @@ def test_passphrase_generation_custom_length():
     assert isinstance(result['passphrase'], str)
     assert len(result['passphrase']) == 32
 
+def test_passphrase_generation_count():
+    """Test generating several passphrases in one call"""
+    result = generate_passphrase(length=12, count=50, exclude_chars='abc')
+    assert result['success'] is True
+    assert result['count'] == 50
+    assert len(result['passphrases']) == 50
+    assert result['passphrase'] == result['passphrases'][0]
+    assert all(len(p) == 12 for p in result['passphrases'])
+    assert not set(''.join(result['passphrases'])) & set('abc')
+
+    result = generate_passphrase(count=0)
+    assert result['success'] is False
+
+def test_passphrase_bulk_uniform():
+    """Test the bulk sampler output is uniform over the character pool"""
+    from generators.passphrase import generate_passphrases, compile_charset
+    chars = compile_charset().chars
+    passphrases = generate_passphrases(3000, length=64)
+    sample = ''.join(passphrases)
+    assert set(sample) <= set(chars)
+
+    # Chi-square goodness of fit; 93 degrees of freedom, p < 1e-9 above 200
+    expected = len(sample) / len(chars)
+    chi_square = sum((sample.count(c) - expected) ** 2 / expected for c in chars)
+    assert chi_square < 200
+
+def test_passphrase_charset_cache():
+    """Test equivalent passphrase options share one compiled charset"""
+    from generators.passphrase import compile_charset, get_charset_cache_stats
+    first = compile_charset(exclude_chars='zyxxz')
+    before = get_charset_cache_stats()
+    second = compile_charset(include_numbers=1, exclude_chars='xyz')
+    after = get_charset_cache_stats()
+    assert second is first
+    assert 'x' not in first.chars and 'y' not in first.chars
+    assert after['hits'] == before['hits'] + 1
+    assert after['hitRate'] is not None
+
+    # Excluding everything leaves no pool to compile
+    from string import ascii_letters
+    assert compile_charset(False, False, ascii_letters) is None
+
 def test_ssh_key_generation():
     """Test SSH key generation with RSA"""
     result = generate_ssh_key(key_type='rsa', comment='test')
@@ -115,6 +157,261 @@ def test_pgp_key_generation_ecc(gpg_home):
     assert result['data']['name'] == 'ECC User'
     assert result['data']['email'] == 'ecc@example.com'
 
+def _gpg_key_algorithms(gpg_home, key):
+    """Import a generated key into gpg and check it; returns [(algorithm, curve)] of key and subkey"""
+    import gnupg
+    import subprocess
+    fingerprint = key['keyId']
+    gpg = gnupg.GPG(gnupghome=gpg_home)
+    assert set(gpg.import_keys(key['privateKey']).fingerprints) == {fingerprint}
+    listed = gpg.list_keys(secret=True)[0]
+    assert listed['fingerprint'] == fingerprint
+    assert listed['expires']
+    assert len(listed['subkeys']) == 1
+
+    # Both self-signatures verify
+    sigs = subprocess.run(['gpg', '--homedir', gpg_home, '--batch', '--with-colons', '--check-sigs'],
+                          capture_output=True, text=True, check=True).stdout.splitlines()
+    assert [line.split(':')[1] for line in sigs if line.startswith('sig:')] == ['!', '!']
+
+    # The secret keys decrypt with the passphrase: the subkey decrypts, the primary key signs
+    encrypted = gpg.encrypt('test message', fingerprint, always_trust=True)
+    assert str(gpg.decrypt(str(encrypted), passphrase='pgp secret')) == 'test message'
+    signed = gpg.sign('test message', keyid=fingerprint, passphrase='pgp secret')
+    assert gpg.verify(str(signed)).fingerprint == fingerprint
+    return [(line.split(':')[3], line.split(':')[16]) for line in sigs if line.startswith(('pub:', 'sub:'))]
+
+@pytest.mark.parametrize('key_type,key_length,curve,expected', [
+    ('RSA', 2048, None, [('1', ''), ('1', '')]),
+    ('ECC', None, 'secp384r1', [('19', 'nistp384'), ('18', 'nistp384')]),
+    ('ECC', None, 'brainpoolP256r1', [('19', 'brainpoolP256r1'), ('18', 'brainpoolP256r1')]),
+    ('ECC', None, 'ed25519', [('22', 'ed25519'), ('18', 'cv25519')]),
+])
+def test_native_pgp_key_imports_into_gpg(gpg_home, monkeypatch, key_type, key_length, curve, expected):
+    """Test keys from the in-process OpenPGP engine are valid for gpg"""
+    import gnupg
+    monkeypatch.setenv('PGP_ENGINE', 'native')
+    result = generate_pgp_key(
+        name='Native User', email='native@example.com', comment='Test Key', key_type=key_type,
+        key_length=key_length, curve=curve, passphrase='pgp secret', expire_time='1y'
+    )
+    assert result['success'] is True
+    # The key was built without gpg, so it is not in the keyring yet
+    assert gnupg.GPG(gnupghome=gpg_home).list_keys() == []
+    assert _gpg_key_algorithms(gpg_home, result['data']) == expected
+    assert gnupg.GPG(gnupghome=gpg_home).list_keys()[0]['uids'] == ['Native User (Test Key) <native@example.com>']
+
+def test_gpg_engine_ecc_curve(gpg_home, monkeypatch):
+    """Test the gpg engine generates the requested curve instead of DSA"""
+    monkeypatch.setenv('PGP_ENGINE', 'gpg')
+    result = generate_pgp_key(name='Gpg User', email='gpg@example.com', key_type='ECC', curve='ed25519',
+                              passphrase='pgp secret', expire_time='1y')
+    assert result['success'] is True
+    with tempfile.TemporaryDirectory() as import_home:
+        assert _gpg_key_algorithms(import_home, result['data']) == [('22', 'ed25519'), ('18', 'cv25519')]
+
+@pytest.fixture
+def ephemeral_root():
+    """Short directory for ephemeral GPG homes (gpg-agent socket paths are limited to ~108 bytes)"""
+    root = tempfile.mkdtemp(prefix='eph-', dir='/tmp')
+    yield Path(root)
+    shutil.rmtree(root, ignore_errors=True)
+
+@pytest.fixture
+def tmpfs_root():
+    """Short directory for GPG homes on tmpfs"""
+    from generators.pgp import _on_tmpfs
+    if not os.path.isdir('/dev/shm') or not _on_tmpfs('/dev/shm'):
+        pytest.skip('/dev/shm is not a tmpfs')
+    root = tempfile.mkdtemp(prefix='eph-', dir='/dev/shm')
+    yield Path(root)
+    shutil.rmtree(root, ignore_errors=True)
+
+def test_gpg_ephemeral_home(gpg_home, monkeypatch, ephemeral_root):
+    """Test ephemeral mode generates in a throwaway home that is always removed"""
+    import gnupg
+    import subprocess
+    root = ephemeral_root
+    monkeypatch.setenv('PGP_ENGINE', 'gpg')
+    monkeypatch.setenv('PGP_GPG_HOME', 'ephemeral')
+    monkeypatch.setenv('PGP_EPHEMERAL_HOME_DIR', str(root))
+
+    # Homes left by a dead process are swept; those of live processes are kept
+    dead = subprocess.Popen(['true'])
+    dead.wait()
+    (root / f'keygen-gpg-{dead.pid}-crashed').mkdir()
+    (root / f'keygen-gpg-{os.getpid()}-busy').mkdir()
+
+    result = generate_pgp_key(name='Ephemeral User', email='ephemeral@example.com',
+                              key_type='ECC', curve='ed25519')
+    assert result['success'] is True
+    assert os.listdir(root) == [f'keygen-gpg-{os.getpid()}-busy']
+    # Nothing was added to the shared keyring
+    assert gnupg.GPG(gnupghome=gpg_home).list_keys() == []
+
+    def failing(self, key_input):
+        assert self.gnupghome.startswith(str(root))
+        raise RuntimeError('gpg crashed')
+
+    monkeypatch.setattr(gnupg.GPG, 'gen_key', failing)
+    result = generate_pgp_key(name='Ephemeral User', email='ephemeral@example.com')
+    assert result['success'] is False
+    assert os.listdir(root) == [f'keygen-gpg-{os.getpid()}-busy']
+
+def test_gpg_delete_mode(gpg_home, monkeypatch):
+    """Test delete mode removes each key from the shared keyring after export"""
+    import gnupg
+    monkeypatch.setenv('PGP_ENGINE', 'gpg')
+    monkeypatch.setenv('PGP_GPG_HOME', 'delete')
+    result = generate_pgp_key(name='Delete User', email='delete@example.com', key_type='ECC',
+                              curve='ed25519', passphrase='pgp secret')
+    assert result['success'] is True
+    assert 'PRIVATE KEY BLOCK' in result['data']['privateKey']
+    gpg = gnupg.GPG(gnupghome=gpg_home)
+    assert gpg.list_keys() == []
+    assert gpg.list_keys(secret=True) == []
+
+def _gpg_spawns():
+    from prometheus_client import REGISTRY
+    return {sample.labels['command']: sample.value for metric in REGISTRY.collect()
+            if metric.name == 'keygen_gpg_spawns' for sample in metric.samples if sample.name.endswith('_total')}
+
+@pytest.mark.parametrize('key_type,key_length,curve', [('RSA', 2048, None), ('ECC', None, 'ed25519')])
+def test_gpg_single_export_pipeline(gpg_home, monkeypatch, tmpfs_root, key_type, key_length, curve):
+    """Test gpg keys that are deleted after export cost one generation, one export and one delete"""
+    import gnupg
+    from generators import pgp
+    from generators.openpgp import dearmor, read_packets
+    monkeypatch.setattr(pgp, '_gpg_slots', None)
+    monkeypatch.setenv('PGP_ENGINE', 'gpg')
+    monkeypatch.setenv('PGP_GPG_HOME', 'delete')
+    monkeypatch.setenv('PGP_GPG_SLOTS', '1')
+    monkeypatch.setenv('PGP_EPHEMERAL_HOME_DIR', str(tmpfs_root))
+    slot_home = str(tmpfs_root / f'keygen-gpg-{os.getpid()}-slot0')
+    key_inputs = []
+    gen_key = gnupg.GPG.gen_key
+    monkeypatch.setattr(gnupg.GPG, 'gen_key', lambda self, key_input: key_inputs.append(key_input) or gen_key(self, key_input))
+    # The first generation also probes the gpg version
+    assert generate_pgp_key(name='Pipeline User', email='pipeline@example.com')['success'] is True
+    before = _gpg_spawns()
+    result = generate_pgp_key(name='Pipeline User', email='pipeline@example.com', key_type=key_type,
+                              key_length=key_length, curve=curve, passphrase='right pass')
+    assert result['success'] is True
+    spawns = {command: count - before.get(command, 0) for command, count in _gpg_spawns().items()}
+    assert {command: count for command, count in spawns.items() if count} == {
+        'gen-key': 1, 'export-secret-key': 1, 'delete-secret-and-public-key': 1
+    }
+    # The slot home is on tmpfs, so gpg generated the key without a passphrase
+    assert '%no-protection' in key_inputs[-1]
+    assert gnupg.GPG(gnupghome=slot_home).list_keys(secret=True) == []
+    pgp._get_gpg_slots().close()
+
+    with tempfile.TemporaryDirectory(dir='/tmp') as import_home:
+        gpg = gnupg.GPG(gnupghome=import_home)
+        gpg.import_keys(result['data']['privateKey'])
+        # The derived public key is what gpg exports for the imported key
+        assert (read_packets(dearmor(gpg.export_keys(result['data']['keyId'])))
+                == read_packets(dearmor(result['data']['publicKey'])))
+        # The secret keys are protected with the requested passphrase
+        assert gpg.sign('data', keyid=result['data']['keyId'], passphrase='wrong pass').returncode != 0
+        assert gpg.sign('data', keyid=result['data']['keyId'], passphrase='right pass').returncode == 0
+
+def test_gpg_protects_keys_in_persistent_homes(gpg_home, monkeypatch):
+    """Test keys generated in GNUPGHOME are passphrase-protected by gpg, even in delete mode"""
+    import gnupg
+    monkeypatch.setenv('PGP_ENGINE', 'gpg')
+    monkeypatch.setenv('PGP_GPG_HOME', 'delete')
+    # Deletes fail, so the generated key stays in the keyring
+    monkeypatch.setattr('generators.pgp._delete_from_keyring', lambda gpg, fingerprint, passphrase: None)
+    result = generate_pgp_key(name='Kept User', email='kept@example.com', key_type='ECC',
+                              curve='ed25519', passphrase='right pass')
+    assert result['success'] is True
+
+    gpg = gnupg.GPG(gnupghome=gpg_home)
+    assert gpg.list_keys(secret=True).fingerprints == [result['data']['keyId']]
+    assert gpg.export_keys(result['data']['keyId'], secret=True, passphrase='wrong pass') == ''
+    assert 'PRIVATE KEY BLOCK' in gpg.export_keys(result['data']['keyId'], secret=True,
+                                                  passphrase='right pass')
+
+def test_gpg_killed_at_deadline(gpg_home, monkeypatch):
+    """Test gpg processes of a request are killed when its deadline passes"""
+    import time
+    from generators.handlers import run_handler
+    monkeypatch.setenv('PGP_ENGINE', 'gpg')
+    monkeypatch.setenv('PGP_GPG_HOME', 'delete')
+    assert generate_pgp_key(name='Deadline User', email='deadline@example.com')['success'] is True
+    before = _gpg_spawns()
+    start = time.monotonic()
+    body, status = run_handler('pgp', {'name': 'Deadline User', 'email': 'deadline@example.com',
+                                       'keyLength': 4096}, deadline=time.monotonic() + 0.05)
+    assert status == 504
+    assert body['error_message'] == 'Request deadline exceeded'
+    assert time.monotonic() - start < 1
+    # Killed during gen-key: nothing is exported and the cached gpg context is kept
+    spawns = {command: count - before.get(command, 0) for command, count in _gpg_spawns().items()}
+    assert {command: count for command, count in spawns.items() if count} == {'gen-key': 1}
+
+    body, status = run_handler('pgp', {'name': 'Deadline User', 'email': 'deadline@example.com'},
+                               deadline=time.monotonic() - 1)
+    assert status == 504
+    assert {command: count - before.get(command, 0) for command, count in _gpg_spawns().items()
+            if count - before.get(command, 0)} == {'gen-key': 1}
+
+def test_gpg_slots(gpg_home, monkeypatch, ephemeral_root):
+    """Test each process generates in its own slot homes, at most one generation per slot"""
+    import gnupg
+    from generators import pgp
+    monkeypatch.setattr(pgp, '_gpg_slots', None)
+    monkeypatch.setenv('PGP_ENGINE', 'gpg')
+    monkeypatch.setenv('PGP_GPG_SLOTS', '2')
+    monkeypatch.setenv('PGP_EPHEMERAL_HOME_DIR', str(ephemeral_root))
+
+    result = generate_pgp_key(name='Slot User', email='slot@example.com', key_type='ECC', curve='ed25519')
+    assert result['success'] is True
+    slot_home = ephemeral_root / f'keygen-gpg-{os.getpid()}-slot0'
+    assert len(gnupg.GPG(gnupghome=str(slot_home)).list_keys()) == 1
+    assert gnupg.GPG(gnupghome=gpg_home).list_keys() == []
+
+    slots = pgp._get_gpg_slots()
+    assert pgp._get_gpg_slots() is slots
+    with slots.acquire(0) as first, slots.acquire(0) as second:
+        assert first != second
+        with pytest.raises(pgp.PGPGenerationError, match='busy'):
+            with slots.acquire(0):
+                pass
+        monkeypatch.setenv('PGP_GPG_SLOT_TIMEOUT', '0')
+        result = generate_pgp_key(name='Slot User', email='slot@example.com', key_type='ECC', curve='ed25519')
+        assert result['success'] is False
+        assert 'busy' in result['error_message']
+
+    slots.close()
+    assert os.listdir(ephemeral_root) == []
+
+def test_pgp_engine_selection(gpg_home, monkeypatch):
+    """Test gpg is the default engine, and failures of the native engine use gpg"""
+    import gnupg
+    import generators.pgp as pgp
+    gpg = gnupg.GPG(gnupghome=gpg_home)
+
+    monkeypatch.delenv('PGP_ENGINE', raising=False)
+    assert pgp._get_pgp_engine() == 'gpg'
+    monkeypatch.setenv('PGP_ENGINE', 'gpg')
+    result = generate_pgp_key(name='Gpg User', email='gpg@example.com')
+    assert result['success'] is True
+    assert result['data']['keyId'] in gpg.list_keys().fingerprints
+
+    def failing(*args, **kwargs):
+        raise RuntimeError('native failure')
+
+    monkeypatch.setenv('PGP_ENGINE', 'native')
+    monkeypatch.setattr(pgp, 'generate_openpgp_key', failing)
+    result = generate_pgp_key(name='Fallback User', email='fallback@example.com')
+    assert result['success'] is True
+    assert result['data']['keyId'] in gpg.list_keys().fingerprints
+
+    monkeypatch.setenv('PGP_ENGINE', 'pgp')
+    assert generate_pgp_key(name='Bad Engine', email='bad@example.com')['success'] is False
+
 def test_invalid_pgp_params(gpg_home):
     """Test comprehensive error handling for PGP key generation"""
     # Test invalid name
@@ -186,6 +483,45 @@ def test_pgp_key_generation_long_inputs(gpg_home):
     assert len(result['data']['name']) <= 100
     assert result['data']['email'] == long_email
 
+def test_pgp_gpg_context_reused(gpg_home):
+    """Test the GPG handle is created once per process and home directory"""
+    from generators.pgp import _get_gpg_context, _invalidate_gpg_context
+    context = _get_gpg_context(gpg_home)
+    assert context.version is not None
+    assert _get_gpg_context(gpg_home) is context
+
+    # A failure drops the cached handle and re-checks the binary
+    assert _invalidate_gpg_context(gpg_home) is None
+    assert _get_gpg_context(gpg_home) is not context
+
+@pytest.fixture
+def spans():
+    """Record timing spans in memory for the duration of a test"""
+    from utils.timing import MemorySink, add_sink, remove_sink
+    sink = MemorySink()
+    add_sink(sink)
+    yield sink
+    remove_sink(sink)
+
+def test_generation_spans(gpg_home, spans, monkeypatch):
+    """Test every generator reports its keygen, serialization and export phases"""
+    monkeypatch.setenv('PGP_ENGINE', 'native')
+    assert generate_ssh_key(key_type='ed25519', passphrase='secret')['success'] is True
+    assert generate_rsa_key(key_size=2048)['success'] is True
+    assert generate_pgp_key(name='Span User', email='span@example.com')['success'] is True
+
+    assert spans.names() == [
+        'ssh.validate', 'ssh.keygen', 'ssh.serialize', 'ssh.public',
+        'rsa.validate', 'rsa.keygen', 'rsa.serialize', 'rsa.public',
+        'pgp.validate', 'pgp.keygen', 'pgp.export_public', 'pgp.export_secret'
+    ]
+    attrs = {name: attrs for name, _, attrs in spans.spans}
+    assert attrs['ssh.keygen'] == {'algorithm': 'ed25519', 'size': 256}
+    assert attrs['ssh.serialize'] == {'encrypted': True}
+    assert attrs['rsa.serialize'] == {'encrypted': False}
+    assert attrs['pgp.keygen'] == {'algorithm': 'RSA', 'size': 2048}
+    assert all(duration >= 0 for _, duration, _ in spans.spans)
+
 def test_invalid_passphrase_length():
     """Test error handling for invalid passphrase length"""
     result = generate_passphrase(length=-1)
@@ -203,3 +539,62 @@ def test_invalid_rsa_size():
     result = generate_rsa_key(key_size=1024)
     assert result['success'] is False
     assert 'error_message' in result
+
+def test_idempotency_cache(tmp_path):
+    """Test claims, replays across cache instances, takeover of dead owners, eviction and expiry"""
+    import socket
+    import subprocess
+    import time
+    from generators.idempotency import IdempotencyCache, IdempotencyError
+    directory = tmp_path / 'idempotency'
+    cache = IdempotencyCache(str(directory), ttl=3600, max_entries=1)
+    body = {'success': True, 'data': {'privateKey': 'secret'}}
+    assert cache.claim('a', 'request') == ('owner', None)
+    assert cache.claim('a', 'request') == ('pending', None)
+    with pytest.raises(IdempotencyError) as error:
+        cache.claim('a', 'other request')
+    assert error.value.status == 422
+    cache.complete('a', 'request', body, 200)
+    assert cache.claim('a', 'request') == ('replay', (body, 200))
+    # Another worker process shares the entries
+    assert IdempotencyCache(str(directory)).claim('a', 'request') == ('replay', (body, 200))
+    # The secret is kept outside the directory holding the ciphertexts
+    assert os.path.dirname(cache.secret_path) != str(directory)
+    assert os.stat(cache.secret_path).st_mode & 0o777 == 0o600
+    assert all(name.endswith('.json') for name in os.listdir(directory))
+
+    # Fingerprints are keyed by the secret and ignore the request deadline
+    import hashlib
+    import json
+    request = {'length': 8, 'requestTimeout': 5}
+    fingerprint = cache.fingerprint('passphrase', request)
+    assert fingerprint == cache.fingerprint('passphrase', {'length': 8})
+    assert fingerprint != cache.fingerprint('passphrase', {'length': 9})
+    assert fingerprint != hashlib.sha256(json.dumps(['passphrase', {'length': 8}], separators=(',', ':')).encode()).hexdigest()
+    assert IdempotencyCache(str(tmp_path / 'other')).fingerprint('passphrase', {'length': 8}) != fingerprint
+
+    # Failed requests release their key
+    assert cache.claim('b', 'request') == ('owner', None)
+    cache.complete('b', 'request', {'success': False, 'error_message': 'bad'}, 400)
+    assert cache.claim('b', 'request') == ('owner', None)
+
+    # The pending entry of a process that died is taken over
+    dead = subprocess.Popen(['true'])
+    dead.wait()
+    cache._write(cache._pending_path(cache.entry_id('c')), {
+        'state': 'pending', 'fingerprint': 'request', 'host': socket.gethostname(),
+        'pid': dead.pid, 'createdAt': time.time()
+    })
+    assert cache.claim('c', 'request') == ('owner', None)
+
+    # At most max_entries responses are kept, oldest first; claims of running requests are never evicted
+    os.utime(cache._path(cache.entry_id('a')), (1, 1))
+    os.utime(cache._pending_path(cache.entry_id('b')), (1, 1))
+    cache.complete('c', 'request', body, 200)
+    assert len(list(directory.glob('*.json'))) == 1
+    assert cache.claim('b', 'request') == ('pending', None)
+    assert cache.claim('a', 'request') == ('owner', None)
+
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.claim('c', 'request') == ('owner', None)
@@ -0,0 +1,135 @@
+import pytest
+import sys
+import time
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from generators import generate_rsa_key, generate_ssh_key
+from generators import keypool
+from generators.keypool import RSAKeyPool, get_pool_stats
+from cryptography.hazmat.primitives import serialization
+
+@pytest.fixture
+def pool():
+    """Create a small pool that only holds 2048-bit keys"""
+    pool = RSAKeyPool(key_sizes=(2048,), low_watermark=1, high_watermark=2)
+    yield pool
+    pool.stop()
+
+@pytest.fixture
+def enabled_pool(monkeypatch):
+    """Enable the process-wide pool through the environment"""
+    monkeypatch.setenv('RSA_KEY_POOL_ENABLED', '1')
+    monkeypatch.setenv('RSA_KEY_POOL_LOW_WATERMARK', '1')
+    monkeypatch.setenv('RSA_KEY_POOL_HIGH_WATERMARK', '1')
+    monkeypatch.setattr(keypool, '_pool', None)
+    yield
+    if keypool._pool is not None:
+        keypool._pool.stop()
+    keypool._pool = None
+
+def _wait_for_fill(pool, key_size, level, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if pool.stats()['sizes'][str(key_size)]['available'] >= level:
+            return True
+        time.sleep(0.1)
+    return False
+
+def test_pool_invalid_watermarks():
+    """Test watermark validation"""
+    with pytest.raises(ValueError):
+        RSAKeyPool(low_watermark=5, high_watermark=2)
+    with pytest.raises(ValueError):
+        RSAKeyPool(high_watermark=0)
+
+def test_pool_refills_to_high_watermark(pool):
+    """Test the background workers fill the pool up to the high watermark"""
+    pool.start()
+    assert _wait_for_fill(pool, 2048, 2)
+    stats = pool.stats()['sizes']['2048']
+    assert stats['available'] == 2
+    assert stats['refilling'] is False
+
+def test_pool_hit_and_miss_counters(pool):
+    """Test inline fallbacks are counted as misses and pooled draws as hits"""
+    # The pool starts empty, so the first draw has to fall back
+    key = pool.acquire(2048)
+    assert key.key_size == 2048
+    assert pool.stats()['sizes']['2048']['misses'] == 1
+
+    assert _wait_for_fill(pool, 2048, 2)
+    key = pool.acquire(2048)
+    assert key.key_size == 2048
+    stats = pool.stats()['sizes']['2048']
+    assert stats['hits'] == 1
+    assert stats['hitRate'] == 0.5
+
+def test_pool_unpooled_size_generates_inline(pool):
+    """Test sizes outside the pool are generated without touching counters"""
+    key = pool.acquire(3072)
+    assert key.key_size == 3072
+    assert '3072' not in pool.stats()['sizes']
+
+def test_pool_disabled_by_default(monkeypatch):
+    """Test the pool is off unless enabled through the environment"""
+    monkeypatch.delenv('RSA_KEY_POOL_ENABLED', raising=False)
+    assert get_pool_stats() == {'enabled': False}
+
+def test_pool_started_at_startup(enabled_pool):
+    """Test the ASGI lifespan starts refilling before the first request"""
+    import asyncio
+    import asgi
+    messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        pass
+
+    asyncio.run(asgi.app({'type': 'lifespan'}, receive, send))
+    pool = keypool.get_key_pool()
+    assert _wait_for_fill(pool, 2048, 1)
+    assert pool.stats()['sizes']['2048']['misses'] == 0
+
+def test_generators_draw_from_pool(enabled_pool):
+    """Test RSA and SSH generators use pooled keys when enabled"""
+    pool = keypool.get_key_pool()
+    pool.start()
+    assert _wait_for_fill(pool, 2048, 1)
+
+    result = generate_rsa_key(key_size=2048)
+    assert result['success'] is True
+    assert _wait_for_fill(pool, 2048, 1)
+
+    result = generate_ssh_key(key_type='rsa', key_size=2048)
+    assert result['success'] is True
+    assert result['data']['publicKey'].startswith('ssh-rsa')
+
+    stats = get_pool_stats()
+    assert stats['enabled'] is True
+    assert stats['sizes']['2048']['hits'] == 2
+
+def test_generation_processes_draw_from_pool(enabled_pool):
+    """Test requests run in generation processes get their keys from the web process's pool"""
+    import asyncio
+    from generators.executors import GenerationExecutors
+    pool = keypool.get_key_pool()
+    pool.start()
+    assert _wait_for_fill(pool, 2048, 1)
+    pooled = pool._keys[2048][0].public_key().public_numbers()
+
+    executors = GenerationExecutors()
+    try:
+        body, status = asyncio.run(executors.run('rsa', {'keySize': 2048}))
+    finally:
+        executors.shutdown()
+    assert status == 200
+    public_key = serialization.load_pem_public_key(body['data']['publicKey'].encode())
+    assert public_key.public_numbers() == pooled
+    assert get_pool_stats()['sizes']['2048']['hits'] == 1
@@ -0,0 +1,333 @@
+import pytest
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from storage import (
+    FilesystemKeyStore, SQLiteKeyStore, MemoryKeyStore, PackFileKeyStore, KeyIndex, get_keystore, new_record
+)
+from storage.metadata import key_metadata
+from generators.pgp import generate_pgp_key
+from generators.rsa import generate_rsa_key
+from generators.ssh import generate_ssh_key
+from storage.layout import shard_prefix, migrate
+
+@pytest.fixture(params=['filesystem', 'sharded', 'sqlite', 'packfile', 'memory'])
+def store(request, tmp_path):
+    """Create one store of each backend"""
+    if request.param == 'filesystem':
+        return FilesystemKeyStore(str(tmp_path))
+    if request.param == 'sharded':
+        return FilesystemKeyStore(str(tmp_path), layout='sharded')
+    if request.param == 'sqlite':
+        return SQLiteKeyStore(str(tmp_path / 'keys.db'))
+    if request.param == 'packfile':
+        return PackFileKeyStore(str(tmp_path / 'packs'))
+    return MemoryKeyStore()
+
+def test_keystore_put_get_delete(store):
+    """Test a key pair round-trips through every backend"""
+    stored = store.put('private key', 'public key', 'ssh', 'store_test')
+    key_id = stored['storageHandle']
+    assert store.exists(key_id)
+
+    record = store.get(key_id)
+    assert record['privateKey'] == 'private key'
+    assert record['publicKey'] == 'public key'
+    assert record['keyType'] == 'ssh'
+
+    assert store.delete(key_id) is True
+    assert not store.exists(key_id)
+    assert store.get(key_id) is None
+
+def test_keystore_put_many(store):
+    """Test batched writes store every record"""
+    records = [
+        new_record(store.new_key_id('rsa', 'batch'), f'private {i}', f'public {i}', 'rsa', 'batch')
+        for i in range(5)
+    ]
+    store.put_many(records)
+    for i, record in enumerate(records):
+        assert store.get(record['keyId'])['publicKey'] == f'public {i}'
+
+def test_keystore_invalid_key_type(store):
+    """Test unknown key types are rejected"""
+    with pytest.raises(ValueError):
+        store.put('private', 'public', 'invalid')
+
+def test_filesystem_keystore_layout(tmp_path):
+    """Test the filesystem backend keeps the keys/<type>/<comment>/ layout"""
+    store = FilesystemKeyStore(str(tmp_path))
+    stored = store.put('private key', 'public key', 'pgp', 'work key')
+    assert stored['directory'] == str(tmp_path / 'pgp' / 'work_key')
+    assert os.stat(stored['directory']).st_mode & 0o777 == 0o700
+    assert os.stat(stored['privatePath']).st_mode & 0o777 == 0o600
+
+    # Comments cannot escape the storage root
+    stored = store.put('private key', 'public key', 'pgp', '..')
+    assert os.path.dirname(stored['directory']) == str(tmp_path / 'pgp')
+    assert store.get('pgp/../00000000') is None
+
+def test_filesystem_keystore_sharded_layout(tmp_path):
+    """Test the sharded layout fans key directories out by hash prefix"""
+    store = FilesystemKeyStore(str(tmp_path), layout='sharded')
+    stored = store.put('private key', 'public key', 'ssh', 'work_key')
+    first, second = shard_prefix('work_key')
+    assert stored['directory'] == str(tmp_path / 'ssh' / first / second / 'work_key')
+    assert stored['storageHandle'].startswith('ssh/work_key/')
+    assert os.stat(stored['directory']).st_mode & 0o777 == 0o700
+
+    with pytest.raises(ValueError):
+        FilesystemKeyStore(str(tmp_path), layout='invalid')
+
+def test_layout_migration_round_trip(tmp_path):
+    """Test migrating a tree keeps every storage handle resolvable"""
+    flat = FilesystemKeyStore(str(tmp_path))
+    sharded = FilesystemKeyStore(str(tmp_path), layout='sharded')
+    # 'ab' looks like a shard directory name but holds key files
+    handles = [flat.put('private', f'public {c}', 'rsa', c)['storageHandle']
+               for c in ('ab', 'work_key', '')]
+    legacy = tmp_path / '0f0e0d0c-0b0a-4908-8706-050403020100'
+    legacy.mkdir()
+    (legacy / 'id_rsa').write_text('legacy')
+
+    assert migrate(str(tmp_path), 'sharded', dry_run=True) == 4
+    assert migrate(str(tmp_path), 'sharded') == 4
+    assert migrate(str(tmp_path), 'sharded') == 0
+    assert not legacy.exists()
+    assert len(list((tmp_path / 'rsa').glob('*/*/*'))) == 3
+    for handle in handles:
+        assert sharded.describe(handle)['publicPath'] == sharded._find(handle)[2]
+        # Reads still succeed through a store configured with the old layout
+        assert flat.get(handle)['privateKey'] == 'private'
+
+    assert migrate(str(tmp_path), 'flat') == 4
+    entries = os.listdir(tmp_path / 'rsa')
+    assert len(entries) == 3 and {'ab', 'work_key'} <= set(entries)
+    for handle in handles:
+        assert flat.exists(handle)
+
+def test_layout_migration_shard_name_collision(tmp_path):
+    """Test a key directory named like a shard stays apart from the shards of other keys"""
+    flat = FilesystemKeyStore(str(tmp_path))
+    sharded = FilesystemKeyStore(str(tmp_path), layout='sharded')
+    # A key directory 'ab' next to a shard holding a key whose hash starts with 'ab'
+    name = next(f'key{i}' for i in range(10000) if shard_prefix(f'key{i}')[0] == '+ab')
+    handles = [flat.put('private', 'public', 'rsa', 'ab')['storageHandle'],
+               sharded.put('private', 'public', 'rsa', name)['storageHandle'],
+               flat.put('private', 'public', 'rsa', '+ab')['storageHandle']]
+    assert sorted(os.listdir(tmp_path / 'rsa' / 'ab')) == sorted(
+        f'{handle.rsplit("/", 1)[1]}.{suffix}' for handle in handles[::2] for suffix in ('private', 'public'))
+
+    assert migrate(str(tmp_path), 'flat') == 1
+    assert sorted(os.listdir(tmp_path / 'rsa')) == ['ab', name]
+    assert migrate(str(tmp_path), 'sharded') == 2
+    assert sorted(os.listdir(tmp_path / 'rsa')) == sorted({shard_prefix('ab')[0], '+ab'})
+    for handle in handles:
+        assert sharded.get(handle)['privateKey'] == 'private'
+        assert flat.exists(handle)
+
+def test_layout_migration_renames_legacy_keys(tmp_path):
+    """Test legacy id_* key files are readable through the store after migration"""
+    legacy = tmp_path / '0f0e0d0c-0b0a-4908-8706-050403020100'
+    legacy.mkdir()
+    (legacy / 'id_ed25519').write_text('legacy private')
+    (legacy / 'id_ed25519.pub').write_text('legacy public')
+
+    assert migrate(str(tmp_path), 'sharded') == 1
+    sharded = FilesystemKeyStore(str(tmp_path), layout='sharded')
+    [handle] = sharded.iter_key_ids()
+    assert handle.startswith(f'ssh/{legacy.name}/')
+    key = sharded.get(handle)
+    assert (key['privateKey'], key['publicKey']) == ('legacy private', 'legacy public')
+    assert os.stat(sharded.describe(handle)['privatePath']).st_mode & 0o777 == 0o600
+
+    # A run interrupted between renaming and moving is picked up again
+    legacy.mkdir()
+    (legacy / 'id_rsa').write_text('second private')
+    (legacy / 'id_rsa.pub').write_text('second public')
+    from storage.layout import _rename_legacy_files
+    _rename_legacy_files(str(legacy))
+    assert migrate(str(tmp_path), 'sharded') == 1
+    assert {sharded.get(h)['publicKey'] for h in sharded.iter_key_ids()} == {'legacy public', 'second public'}
+
+def test_sqlite_keystore_file_mode(tmp_path):
+    """Test the SQLite database is only readable by its owner"""
+    SQLiteKeyStore(str(tmp_path / 'keys.db'))
+    assert os.stat(tmp_path / 'keys.db').st_mode & 0o777 == 0o600
+
+def test_packfile_keystore_rotation_and_modes(tmp_path):
+    """Test packs rotate by size, are owner-only and survive a reopen"""
+    pack_dir = tmp_path / 'packs'
+    store = PackFileKeyStore(str(pack_dir), max_pack_size=1024)
+    handles = [store.put('p' * 300, f'public {i}', 'rsa')['storageHandle'] for i in range(10)]
+    packs = sorted(pack_dir.glob('*.pack'))
+    assert len(packs) > 1
+    assert os.stat(pack_dir).st_mode & 0o777 == 0o700
+    for path in packs:
+        assert os.stat(path).st_mode & 0o777 == 0o600
+
+    # A second instance (another worker process) sees the same records
+    other = PackFileKeyStore(str(pack_dir), max_pack_size=1024)
+    assert [other.get(h)['publicKey'] for h in handles] == [f'public {i}' for i in range(10)]
+    store.delete(handles[0])
+    assert not other.exists(handles[0])
+    assert other.get('not-a-key-id') is None
+
+def test_packfile_keystore_compaction(tmp_path):
+    """Test compaction drops deleted and expired records and keeps live ones"""
+    store = PackFileKeyStore(str(tmp_path / 'packs'), max_pack_size=2048, ttl=3600)
+    handles = [store.put('private', f'public {i}', 'ssh')['storageHandle'] for i in range(20)]
+    for handle in handles[:10]:
+        store.delete(handle)
+    expired = new_record(store.new_key_id('ssh'), 'private', 'public', 'ssh')
+    expired['createdAt'] -= 7200
+    store.put_many([expired])
+    assert store.get(expired['keyId']) is None
+
+    reader = PackFileKeyStore(str(tmp_path / 'packs'))
+    stats = store.compact()
+    assert stats['live'] == 10
+    assert stats['dropped'] == 21
+    assert stats['bytesAfter'] < stats['bytesBefore']
+    assert [store.get(h)['publicKey'] for h in handles[10:]] == [f'public {i}' for i in range(10, 20)]
+    assert not store.exists(handles[0])
+    # Instances holding offsets into the removed packs reload transparently
+    assert reader.get(handles[15])['publicKey'] == 'public 15'
+    assert sorted(reader.iter_key_ids()) == sorted(handles[10:])
+
+def test_packfile_keystore_one_fsync_per_batch(tmp_path, monkeypatch):
+    """Test a durable batch is synced with a single fsync"""
+    store = PackFileKeyStore(str(tmp_path / 'packs'))
+    store.put('private', 'public', 'rsa')
+    calls = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: calls.append(fd) or real_fsync(fd))
+    store.put_many([new_record(store.new_key_id('rsa'), 'private', f'public {i}', 'rsa') for i in range(50)])
+    assert len(calls) == 1
+
+def test_packfile_keystore_recovers_torn_write(tmp_path):
+    """Test a record half-written by a crashed writer is discarded"""
+    pack_dir = tmp_path / 'packs'
+    store = PackFileKeyStore(str(pack_dir))
+    handle = store.put('private', 'public', 'pgp')['storageHandle']
+    pack = next(pack_dir.glob('*.pack'))
+    size = pack.stat().st_size
+    with open(pack, 'ab') as f:
+        f.write(b'KPK1\x00\x00\x00\x01\x00')
+
+    reopened = PackFileKeyStore(str(pack_dir))
+    assert pack.stat().st_size == size
+    assert reopened.get(handle)['publicKey'] == 'public'
+    second = reopened.put('private', 'second', 'pgp')['storageHandle']
+    assert store.get(second)['publicKey'] == 'second'
+
+def test_memory_keystore_ttl():
+    """Test the memory backend expires and evicts old keys"""
+    store = MemoryKeyStore(ttl=0.05, max_keys=2)
+    first = store.put('private', 'public', 'rsa')['storageHandle']
+    time.sleep(0.1)
+    assert store.get(first) is None
+
+    ids = [store.put('private', 'public', 'rsa')['storageHandle'] for _ in range(3)]
+    assert not store.exists(ids[0])
+    assert store.exists(ids[2])
+
+def test_get_keystore_backend_selection(monkeypatch, tmp_path):
+    """Test the backend is picked from KEY_STORE_BACKEND"""
+    monkeypatch.setenv('KEY_STORE_BACKEND', 'sqlite')
+    monkeypatch.setenv('KEY_STORE_SQLITE_PATH', str(tmp_path / 'selected.db'))
+    assert isinstance(get_keystore(), SQLiteKeyStore)
+    assert get_keystore() is get_keystore()
+
+    monkeypatch.setenv('KEY_STORE_BACKEND', 'memory')
+    assert isinstance(get_keystore(), MemoryKeyStore)
+
+    monkeypatch.setenv('KEY_STORE_BACKEND', 'packfile')
+    monkeypatch.setenv('KEY_STORE_PACK_PATH', str(tmp_path / 'packs'))
+    assert isinstance(get_keystore(), PackFileKeyStore)
+
+    monkeypatch.setenv('KEY_STORE_BACKEND', 'filesystem')
+    monkeypatch.setenv('KEY_STORAGE_LAYOUT', 'sharded')
+    assert get_keystore().layout == 'sharded'
+
+    monkeypatch.setenv('KEY_STORE_BACKEND', 'invalid')
+    with pytest.raises(ValueError):
+        get_keystore()
+
+def test_key_metadata():
+    """Test index metadata is derived from public keys"""
+    ssh_key = generate_ssh_key(key_type='ecdsa', key_size=384)['data']['publicKey']
+    metadata = key_metadata('ssh', ssh_key)
+    assert metadata['algorithm'] == 'ecdsa-sha2-nistp384'
+    assert metadata['keySize'] == 384
+    assert metadata['fingerprint'].startswith('SHA256:')
+
+    rsa_key = generate_rsa_key(2048)['data']['publicKey']
+    assert key_metadata('rsa', rsa_key)['keySize'] == 2048
+
+    metadata = key_metadata('pgp', 'unused', {
+        'fingerprint': 'abcdef0123456789abcdef0123456789abcdef01',
+        'email': 'User@Example.com'
+    })
+    assert metadata['pgpKeyId'] == '23456789ABCDEF01'
+    assert metadata['email'] == 'user@example.com'
+
+@pytest.mark.parametrize('curve, algorithm, key_size', [
+    ('ed25519', 'EDDSA', 256),
+    ('secp384r1', 'ECDSA', 384)
+])
+def test_pgp_key_metadata_matches_reindex(tmp_path, monkeypatch, curve, algorithm, key_size):
+    """Test PGP keys get the same metadata at generation time and on reindex"""
+    monkeypatch.setenv('GNUPGHOME', str(tmp_path))
+    monkeypatch.setenv('PGP_ENGINE', 'native')
+    data = generate_pgp_key(name='Index User', email='Index@Example.com', key_type='ECC',
+                            curve=curve, expire_time='1y')['data']
+    live = key_metadata('pgp', data['publicKey'], {
+        'fingerprint': data['keyId'],
+        'email': data['email'],
+        'expiresAt': data['expireDate']
+    })
+    assert live == key_metadata('pgp', data['publicKey'])
+    assert (live['algorithm'], live['keySize']) == (algorithm, key_size)
+    assert live['fingerprint'] == data['keyId'].upper()
+    assert live['email'] == 'index@example.com'
+    assert live['expiresAt'] == data['expireDate']
+
+def test_key_index_tracks_store(tmp_path):
+    """Test writes, deletes and rebuilds keep the index in step with the store"""
+    store = FilesystemKeyStore(str(tmp_path / 'keys'))
+    store.index = KeyIndex(str(tmp_path / 'index.db'))
+    assert os.stat(tmp_path / 'index.db').st_mode & 0o777 == 0o600
+
+    public_key = generate_ssh_key(key_type='ed25519')['data']['publicKey']
+    handles = [store.put('private', public_key, 'ssh', f'indexed_{i}')['storageHandle'] for i in range(5)]
+    entry = store.index.get(handles[0])
+    assert entry['comment'] == 'indexed_0'
+    assert 'path' not in entry
+
+    seen = []
+    cursor = None
+    while True:
+        page = store.index.search({'keyType': 'ssh'}, limit=2, cursor=cursor)
+        seen.extend(k['storageHandle'] for k in page['keys'])
+        cursor = page['nextCursor']
+        if cursor is None:
+            break
+    assert seen == handles[::-1]
+    assert store.index.search({'comment': 'indexed_3'})['keys'][0]['storageHandle'] == handles[3]
+    with pytest.raises(ValueError):
+        store.index.search({'privateKey': 'x'})
+
+    store.delete(handles[0])
+    assert store.index.get(handles[0]) is None
+
+    rebuilt = KeyIndex(str(tmp_path / 'rebuilt.db'))
+    assert rebuilt.rebuild(store) == 4
+    assert rebuilt.get(handles[1])['fingerprint'] == entry['fingerprint']
@@ -9,7 +9,7 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 from utils.utils import create_output_directory, save_key_pair
-from utils.sanitize import validate_comment, sanitize_comment
+from utils.sanitize import validate_comment
 from utils.response import info_response, error_response
 
 def test_validate_comment():
@@ -75,3 +75,245 @@ def test_error_response():
     
     assert response["success"] is False
     assert response["error_message"] == message
+
+def test_write_behind_queue():
+    """Test queued key pairs are written with the save_key_pair permissions"""
+    from storage import FilesystemKeyStore
+    from storage.writebehind import WriteBehindQueue
+    base_path = os.environ['KEY_STORAGE_PATH']
+    write_behind = WriteBehindQueue(FilesystemKeyStore(base_path), os.path.join(base_path, '.spool'))
+
+    stored = write_behind.enqueue("private key", "public key", "ssh", "queued_key")
+    assert stored['storageHandle'].startswith('ssh/queued_key/')
+    write_behind.flush()
+
+    assert write_behind.status(stored['storageHandle']) == 'stored'
+    with open(stored['privatePath']) as f:
+        assert f.read() == "private key"
+    assert os.stat(stored['directory']).st_mode & 0o777 == 0o700
+    assert os.stat(stored['privatePath']).st_mode & 0o777 == 0o600
+    assert os.stat(stored['publicPath']).st_mode & 0o777 == 0o644
+
+    # Malformed and unknown handles are rejected
+    assert write_behind.status('ssh/../00000000') is None
+    assert write_behind.status('ssh/queued_key/00000000') is None
+
+def test_write_behind_journal(monkeypatch):
+    """Test journals are fsynced, pending handles of other writers are seen, and failures are kept"""
+    import json
+    import time
+    import threading
+    from storage import FilesystemKeyStore, writebehind
+    from storage.writebehind import WriteBehindQueue
+    base_path = os.environ['KEY_STORAGE_PATH']
+    spool_dir = os.path.join(base_path, '.spool-journal')
+    release = threading.Event()
+
+    class SlowStore(FilesystemKeyStore):
+        def put_many(self, records):
+            release.wait(10)
+            return super().put_many(records)
+
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: synced.append(fd) or fsync(fd))
+    store = SlowStore(base_path)
+    writer = WriteBehindQueue(store, spool_dir)
+    handle = writer.enqueue("private key", "public key", "ssh", "journaled")['storageHandle']
+    # The spool directory and the journal record are both fsynced before enqueue returns
+    assert len(synced) == 2
+    assert writer.status(handle) == 'pending'
+
+    # Another worker process finds the handle in the writer's journal
+    reader = WriteBehindQueue(FilesystemKeyStore(base_path), spool_dir)
+    reader.start()
+    assert reader.status(handle) == 'pending'
+    release.set()
+    writer.flush()
+    assert reader.status(handle) == 'stored'
+
+    # A drained journal is replaced by a new one on the next enqueue
+    journal = writer._journal_path
+    writer.enqueue("private key", "public key", "ssh", "journaled")
+    assert writer._journal_path != journal and not os.path.exists(journal)
+    writer.flush()
+
+    class FailingStore(FilesystemKeyStore):
+        def put_many(self, records):
+            raise OSError('disk full')
+
+    monkeypatch.setattr(writebehind, 'MAX_FAILED', 2)
+    failing = WriteBehindQueue(FailingStore(base_path), spool_dir)
+    handles = [failing.enqueue("private key", "public key", "ssh", "failing")['storageHandle'] for _ in range(3)]
+    failing.flush()
+    assert len(failing._failed) == 2
+    assert [failing.status(h) for h in handles[1:]] == ['failed', 'failed']
+
+    # Failed records are carried into the next journal instead of being dropped
+    journal = failing._journal_path
+    failing.enqueue("private key", "public key", "ssh", "failing")
+    assert not os.path.exists(journal)
+    with open(failing._journal_path) as f:
+        carried = {json.loads(line)['keyId'] for line in f}
+    assert set(handles) < carried
+    failing.flush()
+
+    # A full queue writes on the request path, and its failure is raised
+    blocked = threading.Event()
+
+    class BlockedStore(FailingStore):
+        def put_many(self, records):
+            if threading.current_thread().name == 'key-write-behind':
+                blocked.wait(10)
+            return super().put_many(records)
+
+    full = WriteBehindQueue(BlockedStore(base_path), spool_dir, max_pending=1)
+    full.enqueue("private key", "public key", "ssh", "failing")
+    while not full._queue.empty():
+        time.sleep(0.01)
+    assert full.enqueue("private key", "public key", "ssh", "failing")['storageStatus'] == 'pending'
+    with pytest.raises(OSError):
+        full.enqueue("private key", "public key", "ssh", "failing")
+    blocked.set()
+    full.flush()
+
+def test_write_behind_replays_orphaned_journal():
+    """Test a journal left by a dead writer is replayed on start"""
+    import json
+    from storage import FilesystemKeyStore, new_record
+    from storage.writebehind import WriteBehindQueue
+    base_path = os.environ['KEY_STORAGE_PATH']
+    store = FilesystemKeyStore(base_path)
+    spool_dir = os.path.join(base_path, '.spool')
+    os.makedirs(spool_dir, exist_ok=True)
+    record = new_record('rsa/orphan/deadbeef', 'orphan private', 'orphan public', 'rsa')
+    journal_path = os.path.join(spool_dir, 'journal-orphan.ndjson')
+    with open(journal_path, 'w') as f:
+        f.write(json.dumps(record) + '\n')
+
+    WriteBehindQueue(store, spool_dir).start()
+
+    assert not os.path.exists(journal_path)
+    assert store.get('rsa/orphan/deadbeef')['publicKey'] == 'orphan public'
+    assert os.stat(store.describe('rsa/orphan/deadbeef')['privatePath']).st_mode & 0o777 == 0o600
+
+def test_gpg_command():
+    """Test gpg spawns are labelled by their gpg command"""
+    from utils.metrics import gpg_command
+    assert gpg_command(['--batch', '--gen-key']) == 'gen-key'
+    assert gpg_command(['--armor', '--export-secret-keys', 'ABCD']) == 'export-secret-keys'
+    assert gpg_command(['--with-colons', 'file']) == 'other'
+
+def test_metrics_aggregate_across_processes(tmp_path):
+    """Test multiprocess mode sums metrics written by separate worker processes"""
+    import subprocess
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    write = (
+        "from storage import MemoryKeyStore; "
+        "MemoryKeyStore().put('private', 'public', 'rsa')"
+    )
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', write], cwd=project_root, env=env, check=True)
+    render = "from utils.metrics import render_metrics; print(render_metrics()[0].decode())"
+    output = subprocess.run([sys.executable, '-c', render], cwd=project_root, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    assert 'keygen_storage_write_duration_seconds_count{backend="memory",mode="single"} 2.0' in output
+
+def test_sweep_dead_processes(tmp_path, monkeypatch):
+    """Test live gauges of exited processes are dropped while their counters are kept"""
+    import subprocess
+    from utils.metrics import sweep_dead_processes
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    write = (
+        "from utils.metrics import HTTP_REQUESTS_IN_FLIGHT, GENERATION_ERRORS; "
+        "HTTP_REQUESTS_IN_FLIGHT.labels('/generate/rsa').inc(); "
+        "GENERATION_ERRORS.labels('rsa').inc()"
+    )
+    subprocess.run([sys.executable, '-c', write], cwd=project_root, env=env, check=True)
+    (tmp_path / f'gauge_livesum_{os.getpid()}.db').write_bytes(b'')
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+
+    assert sweep_dead_processes() == 1
+    names = os.listdir(tmp_path)
+    assert [name for name in names if name.startswith('gauge_live')] == [f'gauge_livesum_{os.getpid()}.db']
+    assert any(name.startswith('counter_') for name in names)
+    assert sweep_dead_processes() == 0
+
+def test_timing_spans(tmp_path):
+    """Test spans reach registered sinks and cost nothing without one"""
+    from utils import timing
+    assert timing.span('idle') is timing.span('other', size=1)
+
+    sink = timing.MemorySink()
+    timing.add_sink(sink)
+    try:
+        with timing.span('outer', size=1) as outer:
+            outer.set(extra='yes')
+        with pytest.raises(KeyError):
+            with timing.span('failing'):
+                raise KeyError('boom')
+        save_key_pair('private', 'public', str(tmp_path), 'rsa')
+    finally:
+        timing.remove_sink(sink)
+
+    assert sink.names() == ['outer', 'failing', 'storage.save_key_pair']
+    assert sink.spans[0][2] == {'size': 1, 'extra': 'yes'}
+    assert sink.spans[1][2] == {'error': 'KeyError'}
+    assert sink.spans[2][2] == {'key_type': 'rsa'}
+    assert timing.span('idle') is timing.span('again')
+
+def test_server_timing_header():
+    """Test collected spans are summed into Server-Timing metrics in phase order"""
+    from utils import timing
+    token = timing.start_collecting()
+    with timing.span('ssh.keygen'):
+        pass
+    with timing.span('request.validate'):
+        pass
+    collected = timing.stop_collecting(token)
+    assert [name for name, _ in collected] == ['ssh.keygen', 'request.validate']
+    assert timing.span('after') is timing.span('collecting')
+
+    header = timing.server_timing([
+        ('request.validate', 0.001), ('ssh.validate', 0.002), ('ssh.keygen', 0.5),
+        ('ssh.serialize', 0.01), ('ssh.public', 0.005), ('storage.save_key_pair', 0.003),
+        ('storage.persist', 0.004)
+    ], total=0.6)
+    assert header == ('validate;dur=3.000, keygen;dur=500.000, serialize;dur=15.000, '
+                      'persist;dur=4.000, total;dur=600.000')
+
+def test_parse_timeout():
+    """Test client timeouts come from the header first, then the body field"""
+    from utils.deadline import parse_timeout
+    assert parse_timeout(None, {}) is None
+    assert parse_timeout('2.5', {'requestTimeout': 10}) == 2.5
+    assert parse_timeout(None, {'requestTimeout': 10}) == 10.0
+    assert parse_timeout(None, ['not', 'an', 'object']) is None
+    for value in ('0', '-1', 'soon', 'inf', 'nan', True):
+        with pytest.raises(ValueError, match='requestTimeout must be a positive number of seconds'):
+            parse_timeout(None, {'requestTimeout': value})
+
+def test_cancel_scope_kills_tracked_processes():
+    """Test cancelling a scope kills its running subprocesses and any started afterwards"""
+    import subprocess
+    import time
+    from utils.deadline import CancelScope, cancel_at_deadline, track_process, use_scope, cancelled
+
+    scope = CancelScope(time.monotonic() + 0.1)
+    with use_scope(scope), cancel_at_deadline(scope):
+        process = subprocess.Popen(['sleep', '30'])
+        track_process(process)
+        assert process.wait(timeout=5) < 0
+        assert cancelled()
+        late = subprocess.Popen(['sleep', '30'])
+        track_process(late)
+        assert late.wait(timeout=5) < 0
+    assert not cancelled()
+
+    # Without a deadline nothing is cancelled
+    scope = CancelScope()
+    with use_scope(scope), cancel_at_deadline(scope):
+        process = subprocess.Popen(['true'])
+        track_process(process)
+        assert process.wait(timeout=5) == 0
+    assert scope.remaining() is None and not scope.cancelled
@@ -0,0 +1,34 @@
+import os
+
+def env_flag(name, default='0'):
+    """Read a boolean flag from the environment
+
+    Args:
+        name (str): Environment variable name
+        default (str): Value used when the variable is unset
+
+    Returns:
+        bool: True for 'true', '1' or 't' (case-insensitive)
+    """
+    return os.environ.get(name, default).lower() in ('true', '1', 't')
+
+def env_int(name, default):
+    """Read an integer setting from the environment
+
+    Args:
+        name (str): Environment variable name
+        default (int): Value used when the variable is unset or empty
+
+    Returns:
+        int: The configured value
+
+    Raises:
+        ValueError: If the variable is set but not an integer
+    """
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
@@ -0,0 +1,149 @@
+"""Client deadlines and cancellation of the work started for a request.
+
+A client sets a timeout in seconds with the ``X-Request-Timeout`` header or
+the ``requestTimeout`` body field; ``parse_timeout`` reads either. The
+request's work then runs in a ``CancelScope`` with the resulting deadline.
+
+Code that starts a subprocess for a request passes it to ``track_process``.
+Cancelling the scope kills every tracked process, and processes started
+for the scope afterwards are killed at once, so an abandoned gpg
+generation stops using CPU. The scope of the current request is a context
+variable, set with ``use_scope`` in the thread that runs its handler.
+"""
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Header and request body field carrying a client's timeout in seconds
+DEADLINE_HEADER = 'X-Request-Timeout'
+DEADLINE_FIELD = 'requestTimeout'
+
+_scope = contextvars.ContextVar('cancel_scope', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline passes before its work is done"""
+
+
+def parse_timeout(header_value, data):
+    """
+    Read the timeout a client set for a request.
+
+    Args:
+        header_value (str): Value of the X-Request-Timeout header, or None
+        data: Decoded request body; its requestTimeout field is used if the
+            header is absent
+
+    Returns:
+        float or None: Timeout in seconds, None if the client set none
+
+    Raises:
+        ValueError: If the timeout is not a positive number of seconds
+    """
+    value = header_value
+    if value is None and isinstance(data, dict):
+        value = data.get(DEADLINE_FIELD)
+    if value is None:
+        return None
+    try:
+        if isinstance(value, bool):
+            raise ValueError()
+        timeout = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{DEADLINE_FIELD} must be a positive number of seconds")
+    if not timeout > 0 or timeout == float('inf'):
+        raise ValueError(f"{DEADLINE_FIELD} must be a positive number of seconds")
+    return timeout
+
+
+class CancelScope:
+    """The deadline of one request and the subprocesses started for it"""
+
+    def __init__(self, deadline=None):
+        # time.monotonic() value, or None for no deadline
+        self.deadline = deadline
+        self.cancelled = False
+        self._processes = []
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """Seconds until the deadline (negative once passed), or None"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def track_process(self, process):
+        """Kill ``process`` (a subprocess.Popen) when the scope is cancelled"""
+        with self._lock:
+            if not self.cancelled:
+                self._processes = [p for p in self._processes if p.poll() is None]
+                self._processes.append(process)
+                return
+        _kill(process)
+
+    def cancel(self):
+        """Cancel the scope and kill its running subprocesses"""
+        with self._lock:
+            self.cancelled = True
+            processes, self._processes = self._processes, []
+        for process in processes:
+            _kill(process)
+
+
+def _kill(process):
+    try:
+        if process.poll() is None:
+            process.kill()
+    except OSError:
+        pass
+
+
+def current_scope():
+    """Return the cancel scope of the current request, or None"""
+    return _scope.get()
+
+
+def track_process(process):
+    """Tie a subprocess to the current request's cancel scope, if any"""
+    scope = _scope.get()
+    if scope is not None:
+        scope.track_process(process)
+
+
+def cancelled():
+    """Check whether the current request's work has been cancelled"""
+    scope = _scope.get()
+    return scope is not None and scope.cancelled
+
+
+@contextmanager
+def use_scope(scope):
+    """Make ``scope`` the current request's cancel scope inside the block"""
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+@contextmanager
+def cancel_at_deadline(scope):
+    """
+    Cancel ``scope`` if its deadline passes while the block runs, for work
+    done inline by the calling thread.
+    """
+    remaining = scope.remaining()
+    if remaining is None:
+        yield scope
+        return
+    timer = threading.Timer(max(0.0, remaining), scope.cancel)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield scope
+    finally:
+        timer.cancel()
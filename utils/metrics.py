@@ -0,0 +1,174 @@
+"""Prometheus metrics shared by the routes, generators and key stores.
+
+When PROMETHEUS_MULTIPROC_DIR is set (as under gunicorn, see
+gunicorn.conf.py), every process writes its samples to that directory and
+``render_metrics`` aggregates all of them, so a scrape of any worker reports
+totals for the whole pod. Without it, the default per-process registry is
+used. Live gauge samples of exited processes are dropped by gunicorn's
+``child_exit`` hook; without a gunicorn master, ``mark_process_dead`` and
+``sweep_dead_processes`` do it.
+"""
+import os
+import re
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+)
+from prometheus_client import multiprocess
+
+# Files holding live gauge samples, named after the process that wrote them
+LIVE_GAUGE_FILE_REGEX = re.compile(r'^gauge_live\w*_(\d+)\.db$')
+
+# Key generation ranges from microseconds (passphrases) to tens of seconds (PGP 4096)
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0
+)
+STORAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+HTTP_REQUEST_DURATION = Histogram(
+    'keygen_http_request_duration_seconds',
+    'HTTP request latency by route',
+    ['method', 'route', 'status'],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    'keygen_http_requests_in_flight',
+    'HTTP requests currently being served',
+    ['route'],
+    multiprocess_mode='livesum'
+)
+GENERATION_DURATION = Histogram(
+    'keygen_generation_duration_seconds',
+    'Key generation latency by key type, algorithm and size',
+    ['type', 'algorithm', 'size'],
+    buckets=LATENCY_BUCKETS
+)
+PHASE_DURATION = Histogram(
+    'keygen_phase_duration_seconds',
+    'Duration of timed phases (see utils/timing.py) with TIMING_SINKS=metrics',
+    ['phase'],
+    buckets=LATENCY_BUCKETS
+)
+GENERATION_ERRORS = Counter(
+    'keygen_generation_errors_total',
+    'Failed key generations by key type',
+    ['type']
+)
+ADMISSION_REJECTIONS = Counter(
+    'keygen_admission_rejections_total',
+    'Generation requests rejected with 429 because they would exceed the latency budget, by lane',
+    ['lane']
+)
+GENERATION_CANCELLATIONS = Counter(
+    'keygen_generation_cancellations_total',
+    'Generations stopped because the client deadline passed, by key type and stage '
+    '(admission: never started, queued: dropped from the queue, running: process or gpg killed)',
+    ['type', 'stage']
+)
+GPG_SPAWNS = Counter(
+    'keygen_gpg_spawns_total',
+    'gpg subprocesses started, by gpg command',
+    ['command']
+)
+STORAGE_WRITE_DURATION = Histogram(
+    'keygen_storage_write_duration_seconds',
+    'Key store write latency per call (one pair, or one durable batch)',
+    ['backend', 'mode'],
+    buckets=STORAGE_BUCKETS
+)
+STORAGE_ERRORS = Counter(
+    'keygen_storage_errors_total',
+    'Failed key store operations',
+    ['backend', 'operation']
+)
+
+# gpg arguments that name the operation, in the order python-gnupg passes them
+GPG_COMMANDS = (
+    '--gen-key', '--generate-key', '--export', '--export-secret-key', '--export-secret-keys', '--list-keys',
+    '--list-secret-keys', '--import', '--delete-keys', '--delete-key', '--delete-secret-keys',
+    '--delete-secret-key', '--delete-secret-and-public-key', '--version',
+    '--list-config', '--list-packets'
+)
+
+
+def gpg_command(args):
+    """Return the gpg command among a gpg argument list, for the spawn counter"""
+    for arg in args:
+        if arg in GPG_COMMANDS:
+            return arg.lstrip('-')
+    return 'other'
+
+
+@contextmanager
+def observe_generation(key_type):
+    """
+    Time one key generation.
+
+    The body sets the ``algorithm`` and ``size`` labels on the yielded dict
+    once the generator has applied its defaults, and ``failed`` when the
+    generator returned an error. Failures (including exceptions) are
+    counted instead of observed, so invalid requests do not skew latency.
+    """
+    labels = {'algorithm': '', 'size': '', 'failed': False}
+    start = time.perf_counter()
+    try:
+        yield labels
+    except Exception:
+        labels['failed'] = True
+        raise
+    finally:
+        if labels['failed']:
+            GENERATION_ERRORS.labels(key_type).inc()
+        else:
+            GENERATION_DURATION.labels(key_type, str(labels['algorithm']), str(labels['size'])).observe(
+                time.perf_counter() - start
+            )
+
+
+def render_metrics():
+    """
+    Render all metrics in the Prometheus text format.
+
+    Returns:
+        tuple: (body bytes, content type)
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Drop the live gauge samples of an exited process in multiprocess mode"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
+
+
+def sweep_dead_processes():
+    """
+    Drop the live gauge samples of every process that is gone, for servers
+    without a gunicorn master to report exited workers.
+
+    Returns:
+        int: Number of processes swept
+    """
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not multiproc_dir:
+        return 0
+    try:
+        names = os.listdir(multiproc_dir)
+    except FileNotFoundError:
+        return 0
+    pids = {int(match.group(1)) for match in map(LIVE_GAUGE_FILE_REGEX.match, names) if match}
+    swept = 0
+    for pid in pids:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            multiprocess.mark_process_dead(pid)
+            swept += 1
+        except PermissionError:
+            pass
+    return swept
@@ -0,0 +1,231 @@
+"""Lightweight phase timing for the generators and key storage.
+
+Code wraps a phase in ``span``::
+
+    with span('rsa.keygen', size=key_size):
+        private_key = get_rsa_private_key(key_size)
+
+Finished spans are handed to every registered sink. With no sinks (the
+default) ``span`` returns a shared no-op object, so instrumented code pays a
+function call and a truthiness check per phase.
+
+TIMING_SINKS selects sinks at startup as a comma-separated list of
+``log`` and ``metrics``; tests register a ``MemorySink`` with ``add_sink``.
+
+Independently of the sinks, ``start_collecting`` records the spans that
+finish in the current context (one request), e.g. for a Server-Timing
+header.
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+
+logger = logging.getLogger(__name__)
+
+# Registered sinks; replaced as a whole so readers never need a lock
+_sinks = ()
+_sinks_lock = threading.Lock()
+
+# (name, duration) pairs of the spans finished in this context, or None
+_collected = contextvars.ContextVar('timing_collected', default=None)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'attrs', 'start', 'duration')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.duration = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        collected = _collected.get()
+        if collected is not None:
+            collected.append((self.name, self.duration))
+        for sink in _sinks:
+            try:
+                sink.record(self.name, self.duration, self.attrs)
+            except Exception as e:
+                logger.error(f"Timing sink {type(sink).__name__} failed: {str(e)}")
+        return False
+
+    def set(self, **attrs):
+        """Add attributes known only once the phase has run"""
+        self.attrs.update(attrs)
+
+
+def span(name, **attrs):
+    """
+    Time a phase of work.
+
+    Args:
+        name (str): Phase name, '<component>.<phase>' (e.g. 'pgp.export_secret')
+        **attrs: Attributes passed to the sinks with the duration
+
+    Returns:
+        A context manager; its ``set(**attrs)`` adds attributes
+    """
+    if not _sinks and _collected.get() is None:
+        return _NOOP_SPAN
+    return _Span(name, attrs)
+
+
+def add_sink(sink):
+    """Register a sink: any object with ``record(name, duration, attrs)``"""
+    global _sinks
+    with _sinks_lock:
+        _sinks = _sinks + (sink,)
+
+
+def remove_sink(sink):
+    global _sinks
+    with _sinks_lock:
+        _sinks = tuple(s for s in _sinks if s is not sink)
+
+
+def start_collecting():
+    """
+    Collect the spans finished in the current context until ``stop_collecting``.
+
+    Returns:
+        Token to pass to ``stop_collecting``
+    """
+    return _collected.set([])
+
+
+def stop_collecting(token):
+    """
+    Stop collecting and return what was collected.
+
+    Returns:
+        list: (name, duration in seconds) of each finished span, in order
+    """
+    collected = _collected.get()
+    _collected.reset(token)
+    return collected or []
+
+
+def add_collected(collected):
+    """Add spans that finished elsewhere (e.g. in a worker process) to the current collection"""
+    current = _collected.get()
+    if current is not None:
+        current.extend(collected)
+
+
+# Server-Timing metric for each span phase (the part after the dot), in header order;
+# nested spans such as storage.save_key_pair are left out so nothing is counted twice
+SERVER_TIMING_PHASES = {
+    'validate': 'validate',
+    'keygen': 'keygen',
+    'serialize': 'serialize',
+    'public': 'serialize',
+    'export_public': 'serialize',
+    'export_secret': 'serialize',
+    'persist': 'persist',
+    'json': 'json'
+}
+
+
+def server_timing(collected, total=None):
+    """
+    Format collected spans as a Server-Timing header value.
+
+    Args:
+        collected (list): Result of ``stop_collecting``
+        total (float): Whole request duration in seconds, if known
+
+    Returns:
+        str: e.g. 'validate;dur=0.041, keygen;dur=52.310, total;dur=53.002' (milliseconds)
+    """
+    durations = {}
+    for name, duration in collected:
+        metric = SERVER_TIMING_PHASES.get(name.rpartition('.')[2])
+        if metric is not None:
+            durations[metric] = durations.get(metric, 0.0) + duration
+    entries = [f"{metric};dur={durations[metric] * 1000:.3f}"
+               for metric in dict.fromkeys(SERVER_TIMING_PHASES.values()) if metric in durations]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.3f}")
+    return ', '.join(entries)
+
+
+class LogSink:
+    """Logs every span at the given level"""
+
+    def __init__(self, level=logging.INFO):
+        self.level = level
+
+    def record(self, name, duration, attrs):
+        details = ' '.join(f'{k}={v}' for k, v in attrs.items())
+        logger.log(self.level, f"span {name} {duration * 1000:.3f}ms {details}".rstrip())
+
+
+class MetricsSink:
+    """Observes spans in the keygen_phase_duration_seconds histogram"""
+
+    def record(self, name, duration, attrs):
+        # Imported here so timing stays usable without the metrics module
+        from .metrics import PHASE_DURATION
+        PHASE_DURATION.labels(name).observe(duration)
+
+
+class MemorySink:
+    """Keeps finished spans in memory, for tests and ad-hoc profiling"""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def record(self, name, duration, attrs):
+        with self._lock:
+            self.spans.append((name, duration, dict(attrs)))
+
+    def names(self):
+        with self._lock:
+            return [name for name, _, _ in self.spans]
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+
+SINKS = {
+    'log': LogSink,
+    'metrics': MetricsSink
+}
+
+
+def configure_from_env():
+    """Register the sinks listed in TIMING_SINKS"""
+    for name in filter(None, (n.strip().lower() for n in os.environ.get('TIMING_SINKS', '').split(','))):
+        if name not in SINKS:
+            raise ValueError(f"Invalid TIMING_SINKS entry. Must be one of: {', '.join(SINKS)}")
+        add_sink(SINKS[name]())
+
+
+configure_from_env()
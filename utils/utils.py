@@ -1,18 +1,21 @@
 import os
 import uuid
+from .timing import span
 
-def create_output_directory(key_type, comment=''):
-    """Create and return a directory path for storing generated keys
+def get_output_directory(key_type, comment='', base_path=None):
+    """Return the directory path for storing generated keys without creating it
     
     Args:
         key_type (str): Type of key ('ssh', 'rsa', 'pgp')
         comment (str): Optional comment for naming the directory
+        base_path (str): Storage root, defaults to KEY_STORAGE_PATH
     
     Returns:
-        str: Path to the created directory
+        str: Path of the key directory
     """
     # Get the base storage path from environment or use default
-    base_path = os.getenv('KEY_STORAGE_PATH', 'keys')
+    if base_path is None:
+        base_path = os.getenv('KEY_STORAGE_PATH', 'keys')
     
     # Validate key_type
     if key_type not in ['ssh', 'rsa', 'pgp']:
@@ -25,7 +28,20 @@ def create_output_directory(key_type, comment=''):
         raise ValueError("Comment must be shorter than 40 characters and not contain spaces")
     
     # Create directory path using key type subfolder
-    dir_path = os.path.join(base_path, key_type, comment)
+    return os.path.join(base_path, key_type, comment)
+
+def create_output_directory(key_type, comment='', base_path=None):
+    """Create and return a directory path for storing generated keys
+    
+    Args:
+        key_type (str): Type of key ('ssh', 'rsa', 'pgp')
+        comment (str): Optional comment for naming the directory
+        base_path (str): Storage root, defaults to KEY_STORAGE_PATH
+    
+    Returns:
+        str: Path to the created directory
+    """
+    dir_path = get_output_directory(key_type, comment, base_path)
     
     # Create directory if it doesn't exist
     os.makedirs(dir_path, exist_ok=True)
@@ -35,7 +51,7 @@ def create_output_directory(key_type, comment=''):
     
     return dir_path
 
-def save_key_pair(private_key, public_key, dir_path, key_type):
+def save_key_pair(private_key, public_key, dir_path, key_type, key_id=None):
     """Save key pair to files in the specified directory
     
     Args:
@@ -43,23 +59,26 @@ def save_key_pair(private_key, public_key, dir_path, key_type):
         public_key (str): Public key content
         dir_path (str): Directory to save the keys in
         key_type (str): Type of key ('ssh', 'rsa', 'pgp')
+        key_id (str): Optional file name stem, random if not given
     
     Returns:
         tuple: (private_key_path, public_key_path)
     """
     # Create unique filenames
-    key_id = str(uuid.uuid4())[:8]
+    if key_id is None:
+        key_id = str(uuid.uuid4())[:8]
     private_key_path = os.path.join(dir_path, f'{key_id}.private')
     public_key_path = os.path.join(dir_path, f'{key_id}.public')
     
-    # Save private key with restricted permissions
-    with open(private_key_path, 'w') as f:
-        f.write(private_key)
-    os.chmod(private_key_path, 0o600)
-    
-    # Save public key
-    with open(public_key_path, 'w') as f:
-        f.write(public_key)
-    os.chmod(public_key_path, 0o644)
+    with span('storage.save_key_pair', key_type=key_type):
+        # Save private key with restricted permissions
+        with open(private_key_path, 'w') as f:
+            f.write(private_key)
+        os.chmod(private_key_path, 0o600)
+        
+        # Save public key
+        with open(public_key_path, 'w') as f:
+            f.write(public_key)
+        os.chmod(public_key_path, 0o644)
     
     return private_key_path, public_key_path